@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'drf_spectacular',
     'rest_framework_csv',
     'rest_framework',
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
     'rfc6349',
     'server',
     'location',
+    'stats',
     'durin'
 ]
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -54,6 +56,7 @@ if DEBUG:
     INSTALLED_APPS.insert(0, 'django_extensions')
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -97,6 +100,18 @@ DATABASES = {
     }
 }
 
+# Cached counts and token identities are invalidated through the cache,
+# so every uwsgi worker and worker service must share it: Redis at
+# REDIS_URL. Without it each process has its own local memory cache,
+# which is only consistent for a single process (runserver, tests).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -152,10 +167,110 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly'
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework_csv.renderers.CSVRenderer'
+        'core.renderers.FastJSONRenderer',
+        'rest_framework_csv.renderers.CSVRenderer',
     ]
 }
+
+# Page size of the list endpoints without a ?limit= and the largest
+# one they serve, see core.pagination
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 100))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+
+# Reverse geocoding backends, tried in order until one resolves
+# the coordinate. The boundary geocoder answers in-process from a
+# local GeoJSON file, Google Maps is kept as a fallback. Benchmarks
+# run with GEOCODER_BACKENDS=core.geocoder.StubGeocoder.
+GEOCODER_BACKENDS = os.environ.get(
+    'GEOCODER_BACKENDS',
+    'core.geocoder.BoundaryGeocoder,core.geocoder.GoogleGeocoder').split(',')
+GEOCODER_BOUNDARY_FILE = os.environ.get('GEOCODER_BOUNDARY_FILE', '')
+# Grid bucket size of the boundary spatial index, in degrees
+GEOCODER_GRID_SIZE = 0.05
+# Lookups are cached on coordinates rounded to this many decimal
+# places (3 ~ 110m, 4 ~ 11m), in a per-worker LRU of
+# GEOCODER_CACHE_SIZE entries (0 disables caching) backed by the
+# core.GeocodeCache table.
+GEOCODER_CACHE_PRECISION = int(os.environ.get('GEOCODER_CACHE_PRECISION', 3))
+GEOCODER_CACHE_SIZE = int(os.environ.get('GEOCODER_CACHE_SIZE', 10000))
+GEOCODER_CACHE_PERSISTENT = True
+# Canonical core.Location rows cached per worker
+LOCATION_CACHE_SIZE = 50000
+
+# Geocoding and location linking of submitted tests is done by the
+# process_enrichment worker when ENRICHMENT_ASYNC is set. Failed jobs
+# are retried with exponential backoff (seconds) up to
+# ENRICHMENT_MAX_ATTEMPTS times. A worker leases the jobs it claims for
+# ENRICHMENT_LEASE seconds, after which other workers may claim them.
+ENRICHMENT_ASYNC = bool(int(os.environ.get('ENRICHMENT_ASYNC', 1)))
+ENRICHMENT_MAX_ATTEMPTS = 8
+ENRICHMENT_RETRY_BACKOFF = 30
+ENRICHMENT_RETRY_BACKOFF_MAX = 6 * 60 * 60
+ENRICHMENT_LEASE = 15 * 60
+
+# Maximum number of results accepted by the batch upload endpoints
+RESULT_BATCH_MAX_SIZE = 1000
+
+# Keep mobile_result_flat/rfc_result_flat in sync on ingest, otherwise
+# they are only updated by the sync_flat_results command
+FLAT_RESULTS_SYNC = bool(int(os.environ.get('FLAT_RESULTS_SYNC', 1)))
+
+# Request instrumentation (core.middleware): add a Server-Timing header
+# with the wall, SQL and serializer time of each response, and warn
+# (raise when QUERY_BUDGET_STRICT is set, as in the tests) when a view
+# runs more SQL queries than its budget, keyed by URL name
+SERVER_TIMING = bool(int(os.environ.get('SERVER_TIMING', 1)))
+QUERY_BUDGET_STRICT = bool(int(os.environ.get('QUERY_BUDGET_STRICT', 0)))
+QUERY_BUDGETS = {
+    'mobile:mobileresultslist': 10,
+    'mobile:mobileresultcsv': 6,
+    'mobile:user-tests-list': 6,
+    'mobile:speedtest-list': 6,
+    'mobile:mobile-device-list': 8,
+    'rfc6349:resulttable': 10,
+    'rfc6349:csv': 6,
+    'rfc6349:result': 12,
+    'rfc6349:rfc-tests-list': 6,
+}
+
+# Rebuild the hourly/daily stats rollups of the tests on ingest,
+# otherwise their hours are queued for the refresh_rollups command
+ROLLUP_SYNC = bool(int(os.environ.get('ROLLUP_SYNC', 0)))
+
+# Coverage map cells are precomputed at these zoom levels. A map tile
+# at zoom z is answered with the cells of the finest level up to
+# z + COVERAGE_GRID_DEPTH (32x32 cells per tile), cached for
+# COVERAGE_CACHE_TTL seconds or until the cells are rebuilt.
+COVERAGE_ZOOMS = (6, 9, 12, 15)
+COVERAGE_GRID_DEPTH = 5
+COVERAGE_CACHE_TTL = int(os.environ.get('COVERAGE_CACHE_TTL', 3600))
+
+# The result tables are partitioned by month of timestamp, the flat
+# tables by month of date_created. The manage_partitions command
+# creates partitions this many months ahead and expires the result
+# months older than the retention (in months, unset to keep
+# everything) with their tests, moving them to the archive schema if
+# given.
+PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+PARTITION_RETENTION_MONTHS = int(
+    os.environ.get('PARTITION_RETENTION_MONTHS', 0)) or None
+PARTITION_ARCHIVE_SCHEMA = os.environ.get('PARTITION_ARCHIVE_SCHEMA')
+
+# Datatable counts are cached this many seconds per filter set, and
+# the planner estimate is used instead of COUNT(*) above the threshold
+COUNT_CACHE_TTL = int(os.environ.get('COUNT_CACHE_TTL', 30))
+COUNT_ESTIMATE_THRESHOLD = int(os.environ.get(
+    'COUNT_ESTIMATE_THRESHOLD', 100000))
+
+# Rows fetched per round trip from the server-side cursor of exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows per row group / record batch of Parquet and Arrow exports
+EXPORT_ROW_GROUP_SIZE = 50000
+
+# gzip exports for clients sending Accept-Encoding: gzip
+EXPORT_GZIP = bool(int(os.environ.get('EXPORT_GZIP', 1)))
+
 TEST_CLIENT_NAME = "NETMESH_WEB"
 REST_DURIN = {
     "DEFAULT_TOKEN_TTL": timedelta(days=100),
@@ -170,3 +285,12 @@ REST_DURIN = {
     "API_ACCESS_EXCLUDE_FROM_SESSIONS": False,
     "API_ACCESS_RESPONSE_INCLUDE_TOKEN": True,
 }
+
+# Token identities of the ingest endpoints are cached per worker for
+# IDENTITY_LOCAL_TTL seconds and in the shared cache for
+# IDENTITY_CACHE_TTL seconds, see core.identity. Revocations only reach
+# the other workers through a shared cache, so it is off without Redis.
+IDENTITY_CACHE_SIZE = 10000
+IDENTITY_CACHE_TTL = int(os.environ.get(
+    'IDENTITY_CACHE_TTL', 300 if os.environ.get('REDIS_URL') else 0))
+IDENTITY_LOCAL_TTL = int(os.environ.get('IDENTITY_LOCAL_TTL', 5))
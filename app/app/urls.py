@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path
 from django.urls import include
+from core.views import MetricsView
 from drf_spectacular.views import (
         SpectacularAPIView,
         SpectacularSwaggerView,
@@ -17,7 +18,9 @@ urlpatterns = [
     path('portal/api/rfc6349/', include('rfc6349.urls')),
     path('portal/api/server/', include('server.urls')),
     path('portal/api/accounts/', include('django.contrib.auth.urls')),
-    path('portal/api/nro/', include('nro.urls'))
+    path('portal/api/nro/', include('nro.urls')),
+    path('portal/api/stats/', include('stats.urls')),
+    path('portal/api/metrics/', MetricsView.as_view(), name='metrics')
 ]
 
 # urlpatterns += [path('api-auth/', include('rest_framework.urls')), ]
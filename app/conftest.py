@@ -4,13 +4,33 @@ import pytz
 import pytest
 from durin.models import Client
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from rest_framework.test import APIClient
 from durin.models import AuthToken
 
-from core import models
+from core import identity, models
 from rfc6349.views import ResultLocation
 
 
+@pytest.fixture(autouse=True)
+def clear_location_cache():
+    # Rows committed by transactional tests are flushed after them
+    models.Location.objects.clear_cache()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Neither do cached counts of rows created by the test
+    cache.clear()
+    identity.local.clear()
+
+
+@pytest.fixture(autouse=True)
+def strict_query_budgets(settings):
+    # Views running more queries than their budget fail the test
+    settings.QUERY_BUDGET_STRICT = True
+
+
 @pytest.fixture
 def user_info():
     return {
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core import flat  # noqa: F401 connects flat table sync
+        from core.middleware import instrument_serializers
+
+        instrument_serializers()
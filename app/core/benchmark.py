@@ -0,0 +1,583 @@
+"""
+Load benchmarks of the ingest and read endpoints
+
+seed() writes a synthetic dataset: field testers of one office, their
+mobile devices, servers, locations named by core.geocoder.StubGeocoder
+and any number of mobile tests spread over the last days, inserted in
+batches and synced to the flat table. Seeding again appends tests
+older than the ones already there.
+
+run() drives the SCENARIOS at a set concurrency, either in-process
+through the Django test client or against a running server, and
+reports the throughput, latency percentiles and SQL queries per
+request of each scenario. Reports are written as JSON so a later run
+can be compared against them as a baseline (compare()).
+"""
+import datetime
+import itertools
+import json
+import math
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.db.models import Min, OuterRef, Subquery
+from django.test import Client as TestClient
+from django.test.utils import override_settings
+from django.utils import timezone
+from durin.models import AuthToken, Client
+
+from core import enrichment, flat
+from core.geocoder import StubGeocoder, reset_geocoder
+from core.models import (
+    Agent,
+    Location,
+    MobileDevice,
+    MobileResult,
+    NTCSpeedTest,
+    Office,
+    RegionalOffice,
+    Server,
+)
+
+PREFIX = 'benchmark'
+
+EMAIL = PREFIX + '.%s@example.com'
+
+REGION = 'NCR'
+
+# Area the synthetic tests are placed in
+BOUNDS = ((14.2, 14.8), (121.0, 121.3))
+
+OPERATORS = ('Globe', 'Smart', 'DITO', 'TNT', 'TM')
+
+NETWORK_TYPES = ('3g', '4g', 'lte', '5g')
+
+API = '/portal/api/'
+
+
+def user(name, **extra_fields):
+    email = EMAIL % name
+    User = get_user_model()
+    try:
+        return User.objects.get(email=email)
+    except User.DoesNotExist:
+        return User.objects.create_user(email, PREFIX, first_name=name[:20],
+                                        last_name=PREFIX, **extra_fields)
+
+
+def office():
+    regional, _ = RegionalOffice.objects.get_or_create(region=REGION)
+    return Office.objects.get_or_create(name='NTC', region=regional)[0]
+
+
+def admin():
+    """The staff agent reading the datatable and CSV export"""
+    agent, _ = Agent.objects.get_or_create(
+        agent=user('admin', is_staff=True),
+        defaults={'office': office()})
+    return agent
+
+
+def agents(count):
+    return [Agent.objects.get_or_create(
+        agent=user('agent%d' % i), defaults={'office': office()})[0]
+        for i in range(count)]
+
+
+def devices(count, testers):
+    """`count` mobile devices, each shared by one of the `testers`"""
+    devices = []
+    for i in range(count):
+        name = '%s-device-%d' % (PREFIX, i)
+        device = MobileDevice.objects.filter(name=name).first()
+        if device is None:
+            device = MobileDevice.objects.create(
+                name=name,
+                client=Client.objects.get_or_create(name=name)[0],
+                serial_number=name,
+                imei=name,
+                phone_model='Benchmark')
+        device.users.add(testers[i % len(testers)])
+        devices.append(device)
+    return devices
+
+
+def servers(count):
+    contributor = admin().agent
+    hosts = []
+    for i in range(count):
+        host, _ = Server.objects.get_or_create(
+            nickname='%s-%d' % (PREFIX, i),
+            defaults={'ip_address': '10.0.0.%d' % (i + 1),
+                      'server_type': 'local',
+                      'contributor': contributor})
+        hosts.append(host)
+    return hosts
+
+
+def locations(count, rng):
+    """Anchor points of the tests with their canonical Location"""
+    geocoder = StubGeocoder()
+    anchors = []
+    for _ in range(count):
+        lat, lon = (rng.uniform(*bounds) for bounds in BOUNDS)
+        anchors.append((lat, lon, Location.objects.get_canonical(
+            **geocoder.reverse(lat, lon))))
+    return anchors
+
+
+def result(rng, lat, lon, timestamp, server):
+    return MobileResult(
+        android_version='13',
+        network_type=rng.choice(NETWORK_TYPES),
+        operator=rng.choice(OPERATORS),
+        rssi=rng.uniform(-110, -60),
+        lat=lat,
+        lon=lon,
+        download=rng.lognormvariate(3, 0.8),
+        upload=rng.lognormvariate(2, 0.8),
+        ping=rng.lognormvariate(3.5, 0.5),
+        jitter=rng.lognormvariate(1, 0.5),
+        timestamp=timestamp,
+        success=rng.random() > 0.02,
+        server=server)
+
+
+def seed(results=10000, agents_count=10, devices_count=None,
+         locations_count=200, servers_count=4, days=30, batch_size=5000,
+         random_seed=0, log=None):
+    """
+    Write the synthetic dataset, returns the number of tests created.
+    Tests are spread evenly over `days` ending at the oldest benchmark
+    test already seeded (or now), one microsecond grid per run so the
+    unique (timestamp, server) pairs never collide.
+    """
+    rng = random.Random(random_seed)
+    testers = agents(agents_count)
+    admin()
+    phones = devices(devices_count or agents_count, testers)
+    hosts = servers(servers_count)
+    anchors = locations(locations_count, rng)
+    end = MobileResult.objects.filter(server__in=hosts).aggregate(
+        first=Min('timestamp'))['first'] or timezone.now()
+    step = datetime.timedelta(days=days) / max(results, 1)
+    step = max(step, datetime.timedelta(microseconds=1))
+    created = 0
+    for start in range(0, results, batch_size):
+        rows, links = [], []
+        for i in range(start, min(start + batch_size, results)):
+            lat, lon, location = rng.choice(anchors)
+            device = phones[i % len(phones)]
+            rows.append(result(
+                rng, lat + rng.uniform(-0.005, 0.005),
+                lon + rng.uniform(-0.005, 0.005),
+                end - step * (i + 1), hosts[i % len(hosts)]))
+            links.append((location, device, testers[i % len(testers)]))
+        with transaction.atomic():
+            MobileResult.objects.bulk_create(rows)
+            tests = NTCSpeedTest.objects.bulk_create([
+                NTCSpeedTest(result=row, location=location, tester=tester,
+                             test_device=device, client_ip='10.1.0.1',
+                             enrichment=enrichment.DONE)
+                for row, (location, device, tester) in zip(rows, links)])
+            ids = [test.pk for test in tests]
+            # date_created is auto_now_add, backdate it to the result
+            NTCSpeedTest.objects.filter(pk__in=ids).update(
+                date_created=Subquery(MobileResult.objects.filter(
+                    pk=OuterRef('result_id')).values('timestamp')[:1]))
+            flat.sync(NTCSpeedTest, ids=ids)
+        created += len(ids)
+        if log:
+            log('Seeded %d/%d tests.' % (created, results))
+    return created
+
+
+def token(agent, client):
+    AuthToken.objects.filter(user=agent.agent, client=client).delete()
+    return AuthToken.objects.create(agent.agent, client).token
+
+
+def credentials():
+    """Tokens of the benchmark admin and of a field tester's device"""
+    device = MobileDevice.objects.filter(
+        name__startswith=PREFIX + '-device-').order_by('pk').first()
+    if device is None:
+        raise LookupError("No benchmark dataset, seed it first.")
+    tester = device.users.order_by('pk').first()
+    staff = admin()
+    return {
+        'admin': token(staff, Client.objects.get_or_create(
+            name='%s-admin' % PREFIX)[0]),
+        'tester': token(tester, device.client),
+        'server': Server.objects.filter(
+            nickname__startswith=PREFIX).order_by('pk').first().pk,
+        'region': staff.office.region.region,
+    }
+
+
+class Scenario:
+    """Builds the request of each iteration of a benchmark scenario"""
+    method = 'GET'
+    auth = 'admin'
+
+    def __init__(self, context):
+        self.context = context
+
+    def path(self, i):
+        raise NotImplementedError
+
+    def body(self, i):
+        return None
+
+
+class IngestScenario(Scenario):
+    """Public speed test upload, one result per request"""
+    method = 'POST'
+    auth = None
+
+    def __init__(self, context):
+        super().__init__(context)
+        # Iteration i is timestamped i microseconds after the start, a
+        # grid no later run can overlap
+        self.origin = timezone.now()
+        self.rng = random.Random(1)
+
+    def item(self, i):
+        lat, lon = (self.rng.uniform(*bounds) for bounds in BOUNDS)
+        return {
+            'network_type': 'lte',
+            'operator': OPERATORS[i % len(OPERATORS)],
+            'lat': lat,
+            'lon': lon,
+            'download': 20.5,
+            'upload': 8.25,
+            'ping': 31.0,
+            'jitter': 2.5,
+            'timestamp': (self.origin + datetime.timedelta(
+                microseconds=i)).isoformat(),
+            'success': True,
+            'server': self.context['server'],
+        }
+
+    def path(self, i):
+        return API + 'mobile/result/'
+
+    def body(self, i):
+        return self.item(i)
+
+
+class TesterIngestScenario(IngestScenario):
+    """Field tester device uploading one result per request"""
+    auth = 'tester'
+
+
+class BatchIngestScenario(IngestScenario):
+    """Field tester device uploading buffered results"""
+    auth = 'tester'
+    size = 20
+
+    def path(self, i):
+        return API + 'mobile/result/batch/'
+
+    def body(self, i):
+        return [self.item(i * self.size + j) for j in range(self.size)]
+
+
+class DatatableScenario(Scenario):
+    """Newest first datatable page of the admin's region"""
+
+    def path(self, i):
+        return API + 'mobile/result/datatable?' + urllib.parse.urlencode({
+            'draw': i + 1,
+            'start': i % 10 * 50,
+            'length': 50,
+            'order[0][column]': 0,
+            'order[0][dir]': 'desc',
+        })
+
+
+class CSVScenario(Scenario):
+    """CSV export of the admin's region"""
+
+    def path(self, i):
+        return API + 'mobile/result/csv?' + urllib.parse.urlencode({
+            'region': self.context['region']})
+
+
+class TesterListScenario(Scenario):
+    """Field tester listing their own tests"""
+    auth = 'tester'
+
+    def path(self, i):
+        return API + 'mobile/ft/result/'
+
+
+SCENARIOS = {
+    'ingest': IngestScenario,
+    'ingest-tester': TesterIngestScenario,
+    'ingest-batch': BatchIngestScenario,
+    'datatable': DatatableScenario,
+    'csv': CSVScenario,
+    'ft-list': TesterListScenario,
+}
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries of the current thread"""
+
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+class InProcessTarget:
+    """Requests served in this process by the Django test client"""
+    name = 'in-process'
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @property
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = TestClient(raise_request_exception=False)
+        return self.local.client
+
+    def send(self, method, path, body, token):
+        """(status, size in bytes, queries) of a request"""
+        headers = {}
+        if token:
+            headers['HTTP_AUTHORIZATION'] = 'Token %s' % token
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            if method == 'POST':
+                response = self.client.post(
+                    path, json.dumps(body), content_type='application/json',
+                    **headers)
+            else:
+                response = self.client.get(path, **headers)
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+        return response.status_code, size, counter.queries
+
+    @contextmanager
+    def environment(self):
+        with override_settings(
+                GEOCODER_BACKENDS=['core.geocoder.StubGeocoder'],
+                ALLOWED_HOSTS=['testserver']):
+            reset_geocoder()
+            try:
+                yield
+            finally:
+                reset_geocoder()
+
+    def close(self):
+        """Close the database connection of a worker thread"""
+        connections.close_all()
+
+
+class HTTPTarget:
+    """
+    Requests to a running server at `url`, which should be started with
+    GEOCODER_BACKENDS=core.geocoder.StubGeocoder. Query counts are read
+    from its Server-Timing header, so they are missing for streamed
+    responses and when settings.SERVER_TIMING is off.
+    """
+
+    def __init__(self, url):
+        self.name = self.url = url.rstrip('/')
+
+    @staticmethod
+    def queries(header):
+        for metric in (header or '').split(','):
+            name, *params = metric.strip().split(';')
+            for param in params:
+                if name == 'db' and param.startswith('desc='):
+                    return int(param[5:].strip('"').split()[0])
+        return None
+
+    def send(self, method, path, body, token):
+        request = urllib.request.Request(
+            self.url + path, method=method,
+            data=json.dumps(body).encode() if body is not None else None)
+        request.add_header('Content-Type', 'application/json')
+        if token:
+            request.add_header('Authorization', 'Token %s' % token)
+        try:
+            with urllib.request.urlopen(request) as response:
+                size = len(response.read())
+                return (response.status, size,
+                        self.queries(response.headers.get('Server-Timing')))
+        except urllib.error.HTTPError as error:
+            return (error.code, len(error.read()),
+                    self.queries(error.headers.get('Server-Timing')))
+
+    @contextmanager
+    def environment(self):
+        yield
+
+    def close(self):
+        pass
+
+
+def percentile(values, q):
+    """Nearest rank percentile of sorted `values`"""
+    if not values:
+        return None
+    return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+
+def summary(samples, elapsed):
+    """Report of one scenario from its (seconds, status, queries) samples"""
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    errors = sum(1 for _, status, _ in samples if status >= 400)
+    server_errors = sum(1 for _, status, _ in samples if status >= 500)
+    queries = [count for _, _, count in samples if count is not None]
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'server_errors': server_errors,
+        'throughput': len(samples) / elapsed if elapsed else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+        },
+        'queries': {
+            'mean': sum(queries) / len(queries) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def drive(target, scenario, context, requests, concurrency):
+    """Send `requests` requests of `scenario` from `concurrency` workers"""
+    scenario = SCENARIOS[scenario](context)
+    token = context.get(scenario.auth)
+    iterations = itertools.count()
+    lock = threading.Lock()
+    samples = []
+
+    def work():
+        while True:
+            with lock:
+                i = next(iterations)
+            if i >= requests:
+                return
+            body = scenario.body(i)
+            start = time.perf_counter()
+            status, _, queries = target.send(
+                scenario.method, scenario.path(i), body, token)
+            with lock:
+                samples.append((time.perf_counter() - start, status,
+                                queries))
+
+    def worker():
+        try:
+            work()
+        finally:
+            target.close()
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        work()
+    else:
+        threads = [threading.Thread(target=worker)
+                   for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summary(samples, time.perf_counter() - start)
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scenarios=None, requests=200, concurrency=8, url=None, warmup=5,
+        log=None):
+    """Drive each scenario and return the report"""
+    target = HTTPTarget(url) if url else InProcessTarget()
+    context = credentials()
+    report = {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'commit': commit(),
+            'target': target.name,
+            'requests': requests,
+            'concurrency': concurrency,
+            'tests': NTCSpeedTest.objects.count(),
+        },
+        'scenarios': {},
+    }
+    with target.environment():
+        for name in scenarios or SCENARIOS:
+            if warmup:
+                drive(target, name, context, warmup, 1)
+            report['scenarios'][name] = drive(
+                target, name, context, requests, concurrency)
+            if log:
+                log(format_line(name, report['scenarios'][name]))
+    return report
+
+
+def format_line(name, stats):
+    def number(value, pattern):
+        return pattern % value if value is not None else '-'
+
+    return '%-13s %8s req/s  p50 %9s ms  p99 %9s ms  %7s queries  %d/%d ' \
+           'errors' % (
+               name, number(stats['throughput'], '%.1f'),
+               number(stats['latency_ms']['p50'], '%.1f'),
+               number(stats['latency_ms']['p99'], '%.1f'),
+               number(stats['queries']['mean'], '%.1f'),
+               stats['errors'], stats['requests'])
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Regressions of `report` against `baseline`: latency or throughput
+    worse by more than `tolerance` (a fraction), any increase of the
+    queries per request and new errors
+    """
+    regressions = []
+    for name, stats in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for q in ('p50', 'p99'):
+            old, new = before['latency_ms'][q], stats['latency_ms'][q]
+            if old and new and new > old * (1 + tolerance):
+                regressions.append('%s: %s latency %.1f ms -> %.1f ms' % (
+                    name, q, old, new))
+        old, new = before['throughput'], stats['throughput']
+        if old and new and new < old * (1 - tolerance):
+            regressions.append('%s: throughput %.1f -> %.1f req/s' % (
+                name, old, new))
+        old, new = before['queries']['mean'], stats['queries']['mean']
+        if old is not None and new is not None and new > old:
+            regressions.append('%s: queries per request %.1f -> %.1f' % (
+                name, old, new))
+        if stats['errors'] > before['errors']:
+            regressions.append('%s: errors %d -> %d' % (
+                name, before['errors'], stats['errors']))
+    return regressions
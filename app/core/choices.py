@@ -82,3 +82,19 @@ test_mode_choices = [
     ('simultaneous', 'Simultaneous Mode'),
     ('unknown', 'Unknown')
 ]
+
+enrichment_choices = [
+    ('pending', 'Enrichment Pending'),
+    ('done', 'Enriched'),
+    ('failed', 'Enrichment Failed')
+]
+
+enrichment_kind_choices = [
+    ('mobile', 'Mobile Speed Test'),
+    ('rfc', 'RFC-6349 Test')
+]
+
+rollup_granularity_choices = [
+    ('hour', 'Hourly'),
+    ('day', 'Daily')
+]
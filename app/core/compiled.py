@@ -0,0 +1,256 @@
+"""
+Compiled read-only serializers
+
+compiled() turns a ModelSerializer, nested serializers included, into
+the list of columns to read with values_list() and a function, built
+once per serializer class, that maps a row of them to the dict the
+serializer returns for the instance. Many-to-many primary key fields
+are filled from one extra query per relation.
+
+Columns whose database value already is what the DRF field returns are
+copied as is, the others go through the to_representation() of the
+field, so the rendered JSON is the same as the serializer's.
+Serializers with fields that can't be read from columns (method
+fields, properties, nested lists, ...) don't compile and data(),
+data_in_order() and first() fall back to serializing
+instances.
+"""
+import functools
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import fields, relations, serializers
+from rest_framework.response import Response
+
+from core.eager import eager_load, join, model_of
+from core.middleware import serializer_timer
+
+
+class NotCompilable(Exception):
+    pass
+
+
+# DRF field -> model fields whose values it returns unchanged
+UNCHANGED = {
+    fields.IntegerField: (models.IntegerField, models.AutoField),
+    fields.FloatField: (models.FloatField,),
+    fields.BooleanField: (models.BooleanField,),
+    fields.CharField: (models.CharField, models.TextField),
+    fields.EmailField: (models.CharField,),
+    fields.ChoiceField: (models.CharField,),
+}
+
+
+def unchanged(field, model_field):
+    return isinstance(model_field, UNCHANGED.get(type(field), ()))
+
+
+def file_url(name, field, use_url, request):
+    """FileField.to_representation of a stored file name"""
+    if not name:
+        return None
+    if not use_url:
+        return name
+    url = field.storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+class Compiled:
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.model = model_of(serializer_class)
+        # The primary key comes first for ordering rows
+        self.columns = [self.model._meta.pk.name]
+        self.many = []
+        self.functions = []
+        source = 'def row(r, many, request):\n    return %s\n' % self.build(
+            serializer_class(), self.model, '')
+        namespace = {'f': self.functions, 'file_url': file_url}
+        exec(compile(source, '<compiled %s>' % serializer_class.__name__,
+                     'exec'), namespace)
+        self.source = source
+        self.row = namespace['row']
+
+    def column(self, path):
+        if path not in self.columns:
+            self.columns.append(path)
+        return self.columns.index(path)
+
+    def function(self, function):
+        self.functions.append(function)
+        return 'f[%d]' % (len(self.functions) - 1)
+
+    def build(self, serializer, model, prefix):
+        """Expression of the dict of `serializer` reading `model` rows"""
+        items = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            items.append('%r: %s' % (name, self.field(field, model, prefix)))
+        return '{%s}' % ', '.join(items)
+
+    def field(self, field, model, prefix):
+        if field.source == '*':
+            raise NotCompilable(field.field_name)
+        path, related = prefix, model
+        for attr in field.source_attrs[:-1]:
+            model_field = self.model_field(related, attr)
+            if not model_field.concrete or model_field.null or \
+                    not (model_field.many_to_one or model_field.one_to_one):
+                raise NotCompilable(field.field_name)
+            path, related = join(path, attr), model_field.related_model
+        model_field = self.model_field(related, field.source_attrs[-1])
+        path = join(path, field.source_attrs[-1])
+
+        if isinstance(field, serializers.ListSerializer):
+            raise NotCompilable(field.field_name)
+        if isinstance(field, serializers.BaseSerializer):
+            if not (model_field.concrete and
+                    (model_field.many_to_one or model_field.one_to_one)):
+                raise NotCompilable(field.field_name)
+            target = model_field.related_model
+            nested = self.build(field, target, path)
+            if not model_field.null:
+                return nested
+            pk = self.column(join(path, target._meta.pk.name))
+            return '(None if r[%d] is None else %s)' % (pk, nested)
+        if isinstance(field, relations.ManyRelatedField):
+            child = field.child_relation
+            if not model_field.many_to_many or not model_field.concrete or \
+                    type(child) is not relations.PrimaryKeyRelatedField or \
+                    child.pk_field is not None:
+                raise NotCompilable(field.field_name)
+            parent = self.column(join(prefix, related._meta.pk.name))
+            self.many.append((parent, model_field))
+            return 'many[%d].get(r[%d], [])' % (len(self.many) - 1, parent)
+        if isinstance(field, relations.RelatedField):
+            if type(field) is not relations.PrimaryKeyRelatedField or \
+                    field.pk_field is not None or model_field.many_to_many:
+                raise NotCompilable(field.field_name)
+            return 'r[%d]' % self.column(path)
+        if model_field.is_relation:
+            raise NotCompilable(field.field_name)
+        value = 'r[%d]' % self.column(path)
+        if unchanged(field, model_field):
+            return value
+        if isinstance(field, fields.FileField):
+            use_url = getattr(field, 'use_url', True)
+            return 'file_url(%s, %s, %r, request)' % (
+                value, self.function(model_field), use_url)
+        return '(None if %s is None else %s(%s))' % (
+            value, self.function(field.to_representation), value)
+
+    @staticmethod
+    def model_field(model, attr):
+        try:
+            return model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise NotCompilable(attr)
+
+    def related(self, rows):
+        """Primary keys of each many-to-many relation by parent key"""
+        many = []
+        for parent, model_field in self.many:
+            keys = {row[parent] for row in rows if row[parent] is not None}
+            name = model_field.related_query_name()
+            mapping = {}
+            if keys:
+                pairs = model_field.related_model._default_manager.filter(
+                    **{name + '__in': keys}).values_list(name, 'pk')
+                for key, pk in pairs:
+                    mapping.setdefault(key, []).append(pk)
+            many.append(mapping)
+        return many
+
+    def values(self, queryset):
+        # values_list() has no use for the eager loading of the view
+        return queryset.prefetch_related(None).values_list(*self.columns)
+
+    def serialize(self, rows, request=None):
+        many = self.related(rows)
+        return [self.row(row, many, request) for row in rows]
+
+    def rows(self, queryset, request=None, order=None):
+        """
+        Serialized rows of `queryset`, in the order of the primary keys
+        in `order` when given
+        """
+        rows = list(self.values(queryset))
+        if order is not None:
+            position = {pk: i for i, pk in enumerate(order)}
+            rows.sort(key=lambda row: position[row[0]])
+        return self.serialize(rows, request)
+
+
+@functools.lru_cache(maxsize=None)
+def compiled(serializer_class):
+    """Compiled form of `serializer_class`, None when it can't compile"""
+    try:
+        return Compiled(serializer_class)
+    except NotCompilable:
+        return None
+
+
+def request_of(context):
+    return (context or {}).get('request')
+
+
+def data(serializer_class, queryset, context=None):
+    """Serialized list of the rows of `queryset`"""
+    fast = compiled(serializer_class)
+    with serializer_timer():
+        if fast is not None:
+            return fast.rows(queryset, request_of(context))
+        return serializer_class(eager_load(queryset, serializer_class),
+                                many=True, context=context).data
+
+
+def data_in_order(serializer_class, ids, context=None):
+    """Serialized rows with primary key in `ids`, in that order"""
+    model = model_of(serializer_class)
+    queryset = model.objects.filter(pk__in=ids)
+    fast = compiled(serializer_class)
+    with serializer_timer():
+        if fast is not None:
+            return fast.rows(queryset, request_of(context), order=ids)
+        instances = eager_load(queryset, serializer_class).in_bulk(ids)
+        return serializer_class([instances[pk] for pk in ids
+                                 if pk in instances],
+                                many=True, context=context).data
+
+
+def first(serializer_class, queryset, context=None):
+    """Serialized first row of `queryset`, None when it is empty"""
+    fast = compiled(serializer_class)
+    with serializer_timer():
+        if fast is not None:
+            rows = fast.rows(queryset[:1], request_of(context))
+            return rows[0] if rows else None
+        instance = eager_load(queryset, serializer_class).first()
+        if instance is None:
+            return None
+        return serializer_class(instance, context=context).data
+
+
+class CompiledListMixin:
+    """list() serializing through the compiled serializer of the view"""
+
+    def list(self, request, *args, **kwargs):
+        return self.list_compiled(
+            self.get_serializer_class(),
+            self.filter_queryset(self.get_queryset()),
+            self.get_serializer_context())
+
+    def list_compiled(self, serializer_class, queryset, context=None):
+        """Page of `queryset` when the view paginates, all of it otherwise"""
+        if self.paginator is None:
+            return Response(data(serializer_class, queryset, context))
+        # Pages are cut on their key alone, data_in_order() reads the rest
+        keys = getattr(self.paginator, 'fields', ())
+        page = self.paginate_queryset(
+            queryset.prefetch_related(None).values('pk', *keys))
+        return self.get_paginated_response(data_in_order(
+            serializer_class, [row['pk'] for row in page], context))
@@ -0,0 +1,78 @@
+"""
+Row counts for the result datatables
+
+COUNT(*) over a filtered, joined NTCSpeedTest/RfcTest queryset is the
+most expensive part of a datatable page. Counts are cached per model
+and normalized filter signature for settings.COUNT_CACHE_TTL seconds,
+and large result sets are answered with the Postgres planner estimate
+instead of an exact count. Writing rows invalidates the cached counts
+of their model by bumping a version number in the key, see
+core.flat.sync. The version is read from the cache shared by the
+workers (settings.CACHES), with per-process caches the other processes
+only see new rows once their counts expire.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+def _version_key(model):
+    return 'counts:%s:version' % model._meta.label_lower
+
+
+def version(model):
+    return cache.get_or_set(_version_key(model), 1, timeout=None)
+
+
+def invalidate(model):
+    """Drop the cached counts of `model`, after inserts"""
+    try:
+        cache.incr(_version_key(model))
+    except ValueError:
+        cache.set(_version_key(model), 2, timeout=None)
+
+
+def signature(filters):
+    """Stable digest of the filters, ignoring empty ones and case"""
+    normalized = {
+        key: value.strip().casefold() if isinstance(value, str) else value
+        for key, value in filters.items()
+        if value not in (None, '')
+    }
+    data = json.dumps(normalized, sort_keys=True, default=str)
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def estimate(queryset):
+    """Number of rows the Postgres planner expects the queryset to return"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count(queryset, **filters):
+    """
+    Count of `queryset`, which is the model's rows narrowed by
+    `filters`. Exact below settings.COUNT_ESTIMATE_THRESHOLD rows,
+    the planner estimate above it.
+    """
+    model = queryset.model
+    key = 'counts:%s:%s:%s' % (model._meta.label_lower, version(model),
+                               signature(filters))
+    total = cache.get(key)
+    if total is None:
+        total = estimate(queryset)
+        if total is None or total <= settings.COUNT_ESTIMATE_THRESHOLD:
+            total = queryset.order_by().count()
+        cache.set(key, total, settings.COUNT_CACHE_TTL)
+    return total
@@ -0,0 +1,186 @@
+"""
+Coverage map aggregation on web-mercator tiles
+
+Mobile tests are counted per cell of the slippy map tile grid at each
+of settings.COVERAGE_ZOOMS, per day, operator and network type, with
+the count, sum, min and max of their speeds (CoverageCell). The cells
+of a day are rebuilt in SQL from the flat table whenever the rollups
+of that day are (core.rollups.rebuild), so they follow ingest.
+
+A map tile z/x/y is answered with the cells of the finest precomputed
+level up to z + settings.COVERAGE_GRID_DEPTH that fall inside it,
+summed over the requested days. Tiles are cached until the next
+rebuild.
+"""
+import hashlib
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from core.models import CoverageCell, MobileResultFlat
+
+KIND = 'mobile'
+
+METRICS = ('download', 'upload', 'ping')
+
+# Latitude where the web-mercator square ends
+MAX_LATITUDE = 85.05112878
+
+CELL_SQL = """
+INSERT INTO {cells} (day, zoom, x, y, operator, network_type, count,
+                     {metric_columns})
+SELECT %(day)s, %(zoom)s, x, y, operator, network_type, COUNT(*),
+       {metric_aggregates}
+FROM (
+    SELECT
+        LEAST(FLOOR((lon + 180) / 360 * %(size)s), %(size)s - 1) AS x,
+        LEAST(FLOOR((1 - LN(TAN(RADIANS(lat)) + 1 / COS(RADIANS(lat)))
+                     / PI()) / 2 * %(size)s), %(size)s - 1) AS y,
+        COALESCE(operator, '') AS operator,
+        COALESCE(network_type, '') AS network_type,
+        {metrics}
+    FROM {flat}
+    WHERE date_created >= %(start)s AND date_created < %(end)s
+      AND success
+      AND lat BETWEEN -%(max_lat)s AND %(max_lat)s
+      AND lon BETWEEN -180 AND 180
+) points
+GROUP BY x, y, operator, network_type
+"""
+
+
+def cell_sql():
+    quote = connection.ops.quote_name
+    return CELL_SQL.format(
+        cells=quote(CoverageCell._meta.db_table),
+        flat=quote(MobileResultFlat._meta.db_table),
+        metrics=', '.join(quote(name) for name in METRICS),
+        metric_columns=', '.join(
+            '%s_%s' % (name, stat) for name in METRICS
+            for stat in ('count', 'sum', 'min', 'max')),
+        metric_aggregates=', '.join(
+            '%s(%s)' % (function, quote(name)) for name in METRICS
+            for function in ('COUNT', 'SUM', 'MIN', 'MAX')))
+
+
+def rebuild(kind, day):
+    """Recompute the cells of `day` (an aware midnight) at every level"""
+    if kind != KIND:
+        return
+    date = timezone.localtime(day).date()
+    CoverageCell.objects.filter(day=date).delete()
+    sql = cell_sql()
+    with connection.cursor() as cursor:
+        for zoom in settings.COVERAGE_ZOOMS:
+            cursor.execute(sql, {
+                'day': date,
+                'zoom': zoom,
+                'size': 2 ** zoom,
+                'start': day,
+                'end': day + timezone.timedelta(days=1),
+                'max_lat': MAX_LATITUDE,
+            })
+    invalidate()
+
+
+def version():
+    return cache.get_or_set('coverage:version', 1, timeout=None)
+
+
+def invalidate():
+    try:
+        cache.incr('coverage:version')
+    except ValueError:
+        cache.set('coverage:version', 2, timeout=None)
+
+
+def tile_of(zoom, lat, lon):
+    """(x, y) of the tile at `zoom` holding a point, as in CELL_SQL"""
+    size = 2 ** zoom
+    lat = math.radians(lat)
+    x = math.floor((lon + 180) / 360 * size)
+    y = math.floor((1 - math.log(math.tan(lat) + 1 / math.cos(lat))
+                    / math.pi) / 2 * size)
+    return min(x, size - 1), min(y, size - 1)
+
+
+def tile_bounds(zoom, x, y):
+    """(west, south, east, north) of a tile in degrees"""
+    size = 2 ** zoom
+
+    def latitude(row):
+        return math.degrees(
+            math.atan(math.sinh(math.pi * (1 - 2 * row / size))))
+
+    return (x / size * 360 - 180, latitude(y + 1),
+            (x + 1) / size * 360 - 180, latitude(y))
+
+
+def cell_zoom(zoom):
+    """Precomputed level whose cells are drawn on a tile at `zoom`"""
+    levels = sorted(settings.COVERAGE_ZOOMS)
+    usable = [level for level in levels
+              if level <= zoom + settings.COVERAGE_GRID_DEPTH]
+    return usable[-1] if usable else levels[0]
+
+
+def cells(zoom, x, y, min_date, max_date, filters=None):
+    """
+    Cells of the tile summed over the days from `min_date` to
+    `max_date`, `filters` maps operator/network_type to the values kept
+    """
+    level = cell_zoom(zoom)
+    if level >= zoom:
+        shift = level - zoom
+        x_range = (x << shift, ((x + 1) << shift) - 1)
+        y_range = (y << shift, ((y + 1) << shift) - 1)
+    else:
+        x_range = (x >> zoom - level,) * 2
+        y_range = (y >> zoom - level,) * 2
+    aggregates = {'count': Sum('count')}
+    for name in METRICS:
+        aggregates.update({
+            name + '_count': Sum(name + '_count'),
+            name + '_sum': Sum(name + '_sum'),
+            name + '_min': Min(name + '_min'),
+            name + '_max': Max(name + '_max'),
+        })
+    rows = CoverageCell.objects.filter(
+        zoom=level, x__range=x_range, y__range=y_range,
+        day__gte=min_date, day__lte=max_date,
+        **{key + '__in': values for key, values in (filters or {}).items()},
+    ).values('x', 'y').annotate(**aggregates).order_by('x', 'y')
+    return level, [
+        dict(
+            x=row['x'],
+            y=row['y'],
+            bounds=tile_bounds(level, row['x'], row['y']),
+            count=row['count'],
+            **{name: {
+                'mean': (row[name + '_sum'] / row[name + '_count']
+                         if row[name + '_count'] else None),
+                'min': row[name + '_min'],
+                'max': row[name + '_max'],
+            } for name in METRICS})
+        for row in rows
+    ]
+
+
+def tile(zoom, x, y, min_date, max_date, filters=None):
+    """Response data of tile z/x/y, cached until the cells change"""
+    params = json.dumps([zoom, x, y, min_date, max_date, filters],
+                        sort_keys=True, default=str)
+    key = 'coverage:%s:%s' % (version(),
+                              hashlib.md5(params.encode()).hexdigest())
+    data = cache.get(key)
+    if data is None:
+        level, tile_cells = cells(zoom, x, y, min_date, max_date, filters)
+        data = {'zoom': zoom, 'x': x, 'y': y, 'cell_zoom': level,
+                'bounds': tile_bounds(zoom, x, y), 'cells': tile_cells}
+        cache.set(key, data, settings.COVERAGE_CACHE_TTL)
+    return data
@@ -0,0 +1,141 @@
+"""
+Eager loading plans derived from serializers
+
+plan() walks the fields of a ModelSerializer, nested serializers
+included, and works out what a queryset of its model has to load for
+serializing it without any further query: forward relations that are
+serialized are joined with select_related(), many-to-many and reverse
+relations are prefetched, and only() restricts every joined table to
+the serialized columns. Fields that can't be resolved to model fields
+(method fields, properties) leave the columns unrestricted.
+
+Views mix in EagerLoadingMixin to have their querysets loaded with the
+plan of their serializer, so list responses run the same number of
+queries whatever the number of rows.
+"""
+import functools
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import permissions, serializers
+from rest_framework.relations import RelatedField
+
+SEPARATOR = '__'
+
+
+class Plan:
+
+    def __init__(self, model):
+        self.model = model
+        self.select = []
+        self.prefetch = []
+        self.only = set()
+        self.complete = True
+
+    def apply(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*self.select)
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch)
+        if self.complete:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset
+
+
+def join(*parts):
+    return SEPARATOR.join(part for part in parts if part)
+
+
+def model_of(serializer):
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    meta = getattr(serializer, 'Meta', None)
+    return getattr(meta, 'model', None)
+
+
+def single(model_field):
+    """Forward or reverse one-to-one or forward foreign key"""
+    return model_field.one_to_one or model_field.many_to_one
+
+
+def walk(plan, serializer, model, prefix='', prefetched=False):
+    """
+    Add the fields of `serializer` read from `model` at `prefix`, below
+    a prefetched relation only the relations to prefetch are added
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            if isinstance(field, serializers.BaseSerializer):
+                walk(plan, field, model, prefix, prefetched)
+            elif not prefetched:
+                plan.complete = False
+            continue
+        path, related, nested = prefix, model, prefetched
+        for i, attr in enumerate(field.source_attrs):
+            try:
+                model_field = related._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # Method or property of the model
+                if not nested:
+                    plan.complete = False
+                break
+            path = join(path, attr)
+            last = i == len(field.source_attrs) - 1
+            if not model_field.is_relation or last and isinstance(
+                    field, RelatedField) and field.use_pk_only_optimization():
+                if not nested:
+                    plan.only.add(path)
+                continue
+            related = model_field.related_model
+            if nested or not single(model_field):
+                nested = True
+                plan.prefetch.append(path)
+            else:
+                plan.select.append(path)
+                plan.only.add(path)
+        else:
+            if isinstance(field, serializers.BaseSerializer):
+                walk(plan, field, related, path, nested)
+
+
+@functools.lru_cache(maxsize=None)
+def plan(serializer_class):
+    """Plan of the queryset serialized by `serializer_class`"""
+    serializer = serializer_class()
+    result = Plan(model_of(serializer))
+    walk(result, serializer, result.model)
+    # Parents first, prefetching a path also prefetches its prefixes
+    result.select = sorted(set(result.select))
+    result.prefetch = [
+        path for path in sorted(set(result.prefetch))
+        if not any(other.startswith(path + SEPARATOR)
+                   for other in result.prefetch)]
+    return result
+
+
+def eager_load(queryset, serializer_class):
+    """`queryset` loading what `serializer_class` serializes up front"""
+    if serializer_class is None or \
+            model_of(serializer_class) is not queryset.model:
+        return queryset
+    return plan(serializer_class).apply(queryset)
+
+
+class EagerLoadingMixin:
+    """
+    Load the querysets of a view with the plan of its serializer, on
+    filter_queryset() which the list and retrieve actions go through.
+    Objects fetched for writes are left whole.
+    """
+
+    def eager(self, queryset):
+        return eager_load(queryset, self.get_serializer_class())
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in permissions.SAFE_METHODS:
+            return queryset
+        return self.eager(queryset)
@@ -0,0 +1,196 @@
+"""
+Post-ingest enrichment of speed test submissions
+
+Ingest only persists the result and its NTCSpeedTest/RfcTest row with
+enrichment='pending'. Geocoding and location linking are done here,
+either inline or by the process_enrichment worker draining the
+database backed EnrichmentJob queue with retry and exponential backoff.
+The worker leases due jobs by pushing their run_after past
+settings.ENRICHMENT_LEASE, then geocodes outside of any transaction
+and commits each job on its own.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core import flat
+from core.models import EnrichmentJob, Location, NTCSpeedTest, RfcTest
+from core.utils import Gis
+
+logger = logging.getLogger(__name__)
+
+PENDING, DONE, FAILED = 'pending', 'done', 'failed'
+
+MODELS = {
+    'mobile': NTCSpeedTest,
+    'rfc': RfcTest,
+}
+
+
+class LocationNotFound(LookupError):
+    pass
+
+
+def kind_of(test):
+    for kind, model in MODELS.items():
+        if isinstance(test, model):
+            return kind
+    raise TypeError("No enrichment for %r" % type(test).__name__)
+
+
+def locate(test):
+    """Geocode the test result"""
+    loc = Gis.find_location(test.result.lat, test.result.lon)
+    if loc is None:
+        raise LocationNotFound(
+            "No Location found for (%s, %s)" % (test.result.lat,
+                                                test.result.lon))
+    return loc
+
+
+def link(test, loc):
+    """Link the canonical Location of a geocoded test"""
+    test.location = Location.objects.get_canonical(**loc)
+    test.enrichment = DONE
+    test.save(update_fields=['location', 'enrichment'])
+    return test
+
+
+def enrich(test):
+    """Geocode the test result and link its canonical Location"""
+    return link(test, locate(test))
+
+
+def enqueue(*tests):
+    """Queue pending tests for the enrichment worker"""
+    EnrichmentJob.objects.bulk_create([
+        EnrichmentJob(kind=kind_of(test), object_id=test.pk)
+        for test in tests
+    ])
+
+
+def submit(test):
+    """
+    Enrich a freshly ingested test, in the background when
+    settings.ENRICHMENT_ASYNC is set
+    """
+    if settings.ENRICHMENT_ASYNC:
+        enqueue(test)
+        return test
+    try:
+        with transaction.atomic():
+            return enrich(test)
+    except Exception:
+        # Don't lose the submission, let the worker retry it
+        logger.exception("Inline enrichment of %r failed", test)
+        enqueue(test)
+        return test
+
+
+def submit_many(tests):
+    """
+    Enrich a batch of freshly ingested tests, geocoding each distinct
+    coordinate once when enrichment is done inline
+    """
+    if settings.ENRICHMENT_ASYNC:
+        enqueue(*tests)
+        return tests
+    locations = {}
+    failed = []
+    for test in tests:
+        point = (test.result.lat, test.result.lon)
+        if point not in locations:
+            try:
+                loc = Gis.find_location(*point)
+                locations[point] = loc and Location.objects.get_canonical(**loc)
+            except Exception:
+                logger.exception("Inline enrichment of %s failed", point)
+                locations[point] = None
+        if locations[point] is None:
+            failed.append(test)
+            continue
+        test.location = locations[point]
+        test.enrichment = DONE
+    enriched = [test for test in tests if test.enrichment == DONE]
+    if enriched:
+        type(enriched[0]).objects.bulk_update(
+            enriched, ['location', 'enrichment'])
+    if failed:
+        enqueue(*failed)
+    return tests
+
+
+def backoff(attempts):
+    """Delay before the next attempt of a job that failed `attempts` times"""
+    delay = settings.ENRICHMENT_RETRY_BACKOFF * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.ENRICHMENT_RETRY_BACKOFF_MAX))
+
+
+def run_job(job):
+    model = MODELS[job.kind]
+    test = model.objects.select_related('result').get(pk=job.object_id)
+    # The geocoder may be slow, don't hold any lock while calling it
+    loc = locate(test)
+    with transaction.atomic():
+        link(test, loc)
+        EnrichmentJob.objects.filter(pk=job.pk).delete()
+
+
+def fail(job, error):
+    """Reschedule a failed job with backoff, or give up on it"""
+    job.attempts += 1
+    job.last_error = repr(error)
+    with transaction.atomic():
+        if job.attempts >= settings.ENRICHMENT_MAX_ATTEMPTS:
+            job.is_dead = True
+            MODELS[job.kind].objects.filter(
+                pk=job.object_id).update(enrichment=FAILED)
+            if settings.FLAT_RESULTS_SYNC:
+                flat.sync(MODELS[job.kind], ids=[job.object_id])
+            logger.error("Giving up enrichment of %s: %s", job, error)
+        else:
+            job.run_after = timezone.now() + backoff(job.attempts)
+        # Not save(), it would recreate a job another worker finished
+        EnrichmentJob.objects.filter(pk=job.pk).update(
+            attempts=job.attempts, last_error=job.last_error,
+            is_dead=job.is_dead, run_after=job.run_after)
+
+
+def claim(limit):
+    """
+    Lease up to `limit` due jobs until settings.ENRICHMENT_LEASE seconds
+    from now. Jobs are claimed with SKIP LOCKED so several workers can
+    run, and become due again if the worker dies holding them.
+    """
+    leased_until = timezone.now() + timedelta(
+        seconds=settings.ENRICHMENT_LEASE)
+    with transaction.atomic():
+        jobs = list(
+            EnrichmentJob.objects.select_for_update(skip_locked=True).filter(
+                is_dead=False,
+                run_after__lte=timezone.now()
+            ).order_by('run_after')[:limit])
+        EnrichmentJob.objects.filter(
+            pk__in=[job.pk for job in jobs]).update(run_after=leased_until)
+    return jobs, leased_until
+
+
+def process(limit=100):
+    """
+    Run up to `limit` due jobs, returns the number of jobs processed.
+    Jobs left when the lease runs out are left to the next claim.
+    """
+    jobs, leased_until = claim(limit)
+    processed = 0
+    for job in jobs:
+        if timezone.now() >= leased_until:
+            break
+        try:
+            run_job(job)
+        except Exception as e:
+            fail(job, e)
+        processed += 1
+    return processed
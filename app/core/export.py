@@ -0,0 +1,247 @@
+"""Helpers for streaming large result exports"""
+import csv
+import logging
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db.models.constants import LOOKUP_SEP
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from core.renderers import ArrowRenderer, ParquetRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class Echo:
+    """File-like object handing back what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, fields):
+    """
+    Read `fields` of a queryset in chunks from a server-side cursor,
+    yielding one tuple per row
+    """
+    return queryset.values_list(*fields).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def localize_dates(rows, index, fmt='%Y-%m-%d %I:%M%p '):
+    """Render the datetime in column `index` of each row in local time"""
+    for row in rows:
+        row = list(row)
+        row[index] = timezone.localtime(row[index]).strftime(fmt)
+        yield row
+
+
+def iter_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header).encode()
+    for row in rows:
+        yield writer.writerow(row).encode()
+
+
+def count_rows(rows, stats):
+    for row in rows:
+        stats['rows'] += 1
+        yield row
+
+
+def summarize(chunks, name, stats):
+    """
+    Pass `chunks` through, logging the number of rows and bytes sent
+    and the throughput once the export ends or the client goes away
+    """
+    nbytes = 0
+    start = time.monotonic()
+    try:
+        for chunk in chunks:
+            nbytes += len(chunk)
+            yield chunk
+    finally:
+        elapsed = time.monotonic() - start
+        rows = stats['rows']
+        logger.info(
+            "Exported %s: %d rows, %d bytes in %.2fs (%.0f rows/s)",
+            name, rows, nbytes, elapsed,
+            rows / elapsed if elapsed else rows)
+
+
+def accepts_gzip(request):
+    return settings.EXPORT_GZIP and 'gzip' in request.META.get(
+        'HTTP_ACCEPT_ENCODING', '')
+
+
+def stream_csv(header, rows, filename, compress=False):
+    """
+    CSV response written incrementally from an iterable of rows,
+    gzip encoded on the fly when `compress` is set
+    """
+    stats = {'rows': 0}
+    chunks = summarize(iter_csv(header, count_rows(rows, stats)),
+                       filename, stats)
+    if compress:
+        chunks = compress_sequence(chunks)
+    response = StreamingHttpResponse(chunks, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+# Columnar (Parquet / Arrow IPC) exports, pyarrow is only imported by
+# the requests asking for them
+
+COLUMNAR_FORMATS = {
+    renderer.format: renderer.media_type
+    for renderer in (ParquetRenderer, ArrowRenderer)
+}
+
+
+def export_columns(columns, model, prefix=None):
+    """
+    Extend the `columns` name -> lookup mapping with every concrete
+    field of `model`, reached through the `prefix` relation if given
+    """
+    columns = dict(columns)
+    lookups = set(columns.values())
+    path = prefix + LOOKUP_SEP if prefix else ''
+    for field in model._meta.concrete_fields:
+        lookup = path + field.attname
+        if lookup in lookups or path + field.name in lookups:
+            continue
+        name = field.name
+        if name in columns:
+            name = prefix + '_' + name
+        columns[name] = lookup
+    return columns
+
+
+def resolve_field(model, lookup):
+    *path, name = lookup.split(LOOKUP_SEP)
+    for part in path:
+        model = model._meta.get_field(part).related_model
+    for field in model._meta.concrete_fields:
+        if name in (field.name, field.attname):
+            return field
+    return model._meta.get_field(name)
+
+
+def arrow_type(field):
+    """Arrow type of the values read from a model field"""
+    import pyarrow as pa
+
+    if field.is_relation:
+        field = field.target_field
+    internal = field.get_internal_type()
+    if internal in ('FloatField', 'DecimalField'):
+        return pa.float64()
+    if internal == 'BooleanField':
+        return pa.bool_()
+    if internal == 'DateTimeField':
+        return pa.timestamp('us', tz='UTC')
+    if internal == 'DateField':
+        return pa.date32()
+    if internal.endswith('AutoField') or internal.endswith('IntegerField'):
+        return pa.int64()
+    return pa.string()
+
+
+def arrow_schema(model, columns):
+    import pyarrow as pa
+
+    return pa.schema([
+        (name, arrow_type(resolve_field(model, lookup)))
+        for name, lookup in columns.items()
+    ])
+
+
+def iter_batches(rows, schema, size):
+    """Group rows into Arrow record batches of up to `size` rows"""
+    import pyarrow as pa
+
+    strings = [pa.types.is_string(field.type) for field in schema]
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        arrays = []
+        for values, field, is_string in zip(zip(*batch), schema, strings):
+            if is_string:
+                values = [None if v is None else str(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class ChunkSink:
+    """Write-only file object keeping what pyarrow wrote until drained"""
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_columnar(batches, schema, fmt):
+    """Encode record batches, yielding the bytes of each row group"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for batch in batches:
+        if fmt == 'parquet':
+            writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def stream_columnar(queryset, columns, name, fmt):
+    """
+    Typed Parquet or Arrow IPC stream of `columns` (name -> lookup),
+    encoded in row groups of settings.EXPORT_ROW_GROUP_SIZE rows as
+    they are read from the cursor
+    """
+    schema = arrow_schema(queryset.model, columns)
+    filename = '%s.%s' % (name, fmt)
+    stats = {'rows': 0}
+    rows = count_rows(iter_rows(queryset, columns.values()), stats)
+    batches = iter_batches(rows, schema, settings.EXPORT_ROW_GROUP_SIZE)
+    chunks = summarize(iter_columnar(batches, schema, fmt), filename, stats)
+    response = StreamingHttpResponse(chunks,
+                                     content_type=COLUMNAR_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
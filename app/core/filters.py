@@ -0,0 +1,74 @@
+"""
+Filters shared by the result datatable and export endpoints
+
+The location and operator filters are icontains lookups served by the
+pg_trgm GIN indexes on UPPER(column), test_id search by the unique
+index or the text_pattern_ops btree on test_id::text.
+"""
+import datetime
+import re
+import uuid
+from datetime import date
+
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+
+TEST_ID_FRAGMENT = re.compile(r'[0-9a-f-]+')
+
+# Filter -> lookup on NTCSpeedTest/RfcTest and on their flat tables
+LOOKUPS = {
+    'isp': 'result__operator',
+    'province': 'location__province',
+    'municipality': 'location__municipality',
+    'barangay': 'location__barangay',
+}
+
+FLAT_LOOKUPS = {
+    'isp': 'operator',
+    'province': 'province',
+    'municipality': 'municipality',
+    'barangay': 'barangay',
+}
+
+
+def search_test_id(queryset, search):
+    """
+    Match a full test_id exactly, or a fragment as a test_id prefix.
+    Nothing else can be part of a UUID.
+    """
+    search = search.strip().lower()
+    try:
+        return queryset.filter(test_id=uuid.UUID(search))
+    except ValueError:
+        pass
+    if not TEST_ID_FRAGMENT.fullmatch(search):
+        return queryset.none()
+    return queryset.alias(
+        test_id_text=Cast('test_id', TextField())
+    ).filter(test_id_text__startswith=search)
+
+
+def filter_results(queryset, isp=None, province=None, municipality=None,
+                   barangay=None, min_date=None, max_date=None,
+                   search=None, lookups=LOOKUPS):
+    """
+    Filter NTCSpeedTest/RfcTest querysets, or their flat tables with
+    lookups=FLAT_LOOKUPS, by the datatable/CSV query parameters
+    """
+    if search and search.strip():
+        queryset = search_test_id(queryset, search)
+    if min_date:
+        until = max_date or date.today()
+        queryset = queryset.filter(date_created__range=(
+            min_date, until + datetime.timedelta(days=1)))
+    contains = {
+        'isp': isp,
+        'province': province,
+        'municipality': municipality,
+        'barangay': barangay,
+    }
+    for name, value in contains.items():
+        if value:
+            queryset = queryset.filter(
+                Q(**{lookups[name] + '__icontains': value}))
+    return queryset
@@ -0,0 +1,234 @@
+"""
+Denormalized copies of NTCSpeedTest and RfcTest for reporting reads
+
+mobile_result_flat and rfc_result_flat carry one row per test with its
+tester, office, region, device, location and result columns inlined.
+Rows are upserted in the transaction that writes the test (post_save
+for single saves, sync() after bulk operations) and deleted with it
+when settings.FLAT_RESULTS_SYNC is set. Saving a tester, user, office,
+region, location or device rewrites the columns inlined from it in
+the rows of its tests (sync_related). The sync_flat_results command
+catches up otherwise, or after changes made without signals
+(QuerySet.update(), raw SQL).
+"""
+from django.conf import settings
+from django.db.models.functions import TruncHour
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core import counts, rollups
+from core.models import (
+    Agent,
+    Location,
+    MobileDevice,
+    MobileResultFlat,
+    NTCSpeedTest,
+    Office,
+    RegionalOffice,
+    RfcDevice,
+    RfcResultFlat,
+    RfcTest,
+    User,
+)
+
+# Flat column -> lookup from the test model, other columns are
+# copied from the result field of the same name
+COMMON_COLUMNS = {
+    'id': 'id',
+    'date_created': 'date_created',
+    'test_id': 'test_id',
+    'enrichment': 'enrichment',
+    'client_ip': 'client_ip',
+    'tester_id': 'tester_id',
+    'tester_email': 'tester__agent__email',
+    'tester_first_name': 'tester__agent__first_name',
+    'tester_last_name': 'tester__agent__last_name',
+    'office_id': 'tester__office_id',
+    'office_name': 'tester__office__name',
+    'region_id': 'tester__office__region_id',
+    'region': 'tester__office__region__region',
+    'location_id': 'location_id',
+    'location_region': 'location__region',
+    'province': 'location__province',
+    'municipality': 'location__municipality',
+    'barangay': 'location__barangay',
+    'test_device_id': 'test_device_id',
+    'td_name': 'test_device__name',
+    'td_serial_number': 'test_device__serial_number',
+    'result_id': 'result_id',
+}
+
+MOBILE_COLUMNS = dict(
+    COMMON_COLUMNS,
+    td_imei='test_device__imei',
+    td_phone_model='test_device__phone_model',
+    td_android_version='test_device__android_version',
+)
+
+RFC_COLUMNS = dict(
+    COMMON_COLUMNS,
+    result_test_id='result__test_id',
+    result_location='result__location',
+)
+
+FLAT_MODELS = {
+    NTCSpeedTest: (MobileResultFlat, MOBILE_COLUMNS),
+    RfcTest: (RfcResultFlat, RFC_COLUMNS),
+}
+
+# Models whose columns are inlined in the flat rows -> (lookup from the
+# test, filter of the flat rows of the tests referencing an instance)
+RELATED = {
+    User: ('tester__agent', lambda user: {
+        'tester_id__in': Agent.objects.filter(agent=user).values('pk')}),
+    Agent: ('tester', lambda agent: {'tester_id': agent.pk}),
+    Office: ('tester__office', lambda office: {'office_id': office.pk}),
+    RegionalOffice: ('tester__office__region',
+                     lambda region: {'region_id': region.pk}),
+    Location: ('location', lambda location: {'location_id': location.pk}),
+    MobileDevice: ('test_device',
+                   lambda device: {'test_device_id': device.pk}),
+    RfcDevice: ('test_device', lambda device: {'test_device_id': device.pk}),
+}
+
+
+def columns(model):
+    """Flat column -> lookup from `model` for every flat column"""
+    flat_model, explicit = FLAT_MODELS[model]
+    return {
+        field.attname: explicit.get(field.attname, 'result__' + field.attname)
+        for field in flat_model._meta.concrete_fields
+    }
+
+
+def flat_model(model):
+    return FLAT_MODELS[model][0]
+
+
+def sync(model, queryset=None, ids=None):
+    """
+    Upsert the flat rows of the `model` tests in `queryset` (or with
+    primary key in `ids`), returns the number of rows written
+    """
+    flat, mapping = flat_model(model), columns(model)
+    if queryset is None:
+        queryset = model.objects.filter(pk__in=ids)
+    rows = [
+        flat(**dict(zip(mapping, values)))
+        for values in queryset.order_by().values_list(*mapping.values())
+    ]
+    if not rows:
+        return 0
+    flat.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        # The primary key of the partitioned tables is (id, date_created)
+        unique_fields=['id', 'date_created'],
+        update_fields=[column for column in mapping
+                       if column not in ('id', 'date_created')])
+    counts.invalidate(flat)
+    rollups.mark(flat, [row.date_created for row in rows])
+    return len(rows)
+
+
+def sync_tests(tests):
+    """Upsert the flat rows of freshly written test instances"""
+    if not settings.FLAT_RESULTS_SYNC or not tests:
+        return 0
+    return sync(type(tests[0]), ids=[test.pk for test in tests])
+
+
+def remove(model, tests):
+    """Delete the flat rows of deleted `model` tests"""
+    flat = flat_model(model)
+    flat.objects.filter(
+        id__in=[test.pk for test in tests],
+        date_created__in={test.date_created for test in tests}).delete()
+    counts.invalidate(flat)
+    rollups.mark(flat, [test.date_created for test in tests])
+
+
+def related_model(model, lookup):
+    for name in lookup.split('__'):
+        model = model._meta.get_field(name).related_model
+    return model
+
+
+def follow(instance, path):
+    for name in path.split('__'):
+        if instance is None:
+            return None
+        instance = getattr(instance, name)
+    return instance
+
+
+def sync_related(instance, update_fields=None):
+    """
+    Rewrite the columns inlined from `instance` in the flat rows of the
+    tests referencing it, returns the number of rows written
+    """
+    path, rows_of = RELATED[type(instance)]
+    prefix = path + '__'
+    opts = type(instance)._meta
+    written = 0
+    for model in FLAT_MODELS:
+        if related_model(model, path) is not type(instance):
+            continue
+        flat = flat_model(model)
+        lookups = {
+            column: lookup[len(prefix):]
+            for column, lookup in columns(model).items()
+            if lookup.startswith(prefix)
+        }
+        fields = {opts.get_field(lookup.split('__')[0]).name
+                  for lookup in lookups.values()}
+        if update_fields is not None and fields.isdisjoint(update_fields):
+            continue
+        values = {column: follow(instance, lookup)
+                  for column, lookup in lookups.items()}
+        # Only the rows that change, saving a user on login writes none
+        rows = flat.objects.filter(**rows_of(instance)).exclude(**values)
+        hours = list(rows.annotate(hour=TruncHour('date_created')).values_list(
+            'hour', flat=True).distinct())
+        if not hours:
+            continue
+        written += rows.update(**values)
+        counts.invalidate(flat)
+        rollups.mark(flat, hours)
+    return written
+
+
+def load_tests(model, ids, *related):
+    """
+    Test instances with primary key in `ids`, in that order, for
+    serializing a page found through the flat table
+    """
+    tests = model.objects.select_related(*related).in_bulk(ids)
+    return [tests[pk] for pk in ids if pk in tests]
+
+
+@receiver(post_save, sender=NTCSpeedTest)
+@receiver(post_save, sender=RfcTest)
+def sync_on_save(sender, instance, **kwargs):
+    if settings.FLAT_RESULTS_SYNC:
+        sync(sender, ids=[instance.pk])
+
+
+@receiver(post_delete, sender=NTCSpeedTest)
+@receiver(post_delete, sender=RfcTest)
+def remove_on_delete(sender, instance, **kwargs):
+    if settings.FLAT_RESULTS_SYNC:
+        remove(sender, [instance])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Agent)
+@receiver(post_save, sender=Office)
+@receiver(post_save, sender=RegionalOffice)
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=MobileDevice)
+@receiver(post_save, sender=RfcDevice)
+def sync_related_on_save(sender, instance, created, update_fields,
+                         **kwargs):
+    if settings.FLAT_RESULTS_SYNC and not created:
+        sync_related(instance, update_fields)
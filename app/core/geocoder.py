@@ -0,0 +1,392 @@
+"""
+Reverse geocoding backends used by core.utils.Gis
+
+Backends resolve a (lat, lon) pair into the administrative areas
+(region, province, municipality, barangay) stored on core.Location.
+They are configured through settings.GEOCODER_BACKENDS and tried in
+order until one of them resolves the coordinate.
+"""
+import gzip
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from core.choices import region_choices
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("region", "province", "municipality", "barangay")
+
+
+class BaseGeocoder:
+    """Interface for reverse geocoding backends"""
+
+    def reverse(self, lat, lon):
+        """
+        Return a dict with lat, lon and any resolved administrative
+        levels, or None if the coordinate can't be resolved.
+        """
+        raise NotImplementedError
+
+
+class GoogleGeocoder(BaseGeocoder):
+    """Google Maps reverse geocoding (network round trip per call)"""
+
+    def __init__(self, key=None):
+        self.key = key or os.environ.get('GMAPS_TOKEN')
+        self._client = None
+
+    @property
+    def client(self):
+        # googlemaps is only needed when this backend is enabled
+        if self._client is None:
+            import googlemaps
+            self._client = googlemaps.Client(key=self.key)
+        return self._client
+
+    def reverse(self, lat, lon):
+        if not self.key:
+            return None
+        data = {'lat': lat, 'lon': lon}
+        reverse_geocode_result = self.client.reverse_geocode(
+            (data['lat'],
+             data['lon']),
+            result_type='political')
+
+        if not reverse_geocode_result:
+            return None
+        for i in reverse_geocode_result:
+            if "administrative_area_level_1" in i['types']:
+                region = i['address_components'][0].get('long_name')
+                data["region"] = region or None
+
+            if "administrative_area_level_2" in i['types']:
+                province = i['address_components'][0].get('long_name')
+                data["province"] = province or None
+
+            if "administrative_area_level_3" in i['types']:
+                municipality = i['address_components'][0].get('long_name')
+                data["municipality"] = municipality or None
+
+            if "neighborhood" in i['types'] or "administrative_area_level_5" in i['types']:
+                barangay = i['address_components'][0].get('long_name')
+                data["barangay"] = barangay or None
+        return data
+
+
+def _point_in_ring(x, y, ring):
+    """Ray casting test of a point against a closed [lon, lat] ring"""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > y) != (yj > y) and \
+                x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class Boundary:
+    """A (multi)polygon boundary with the names it resolves to"""
+
+    def __init__(self, polygons, properties):
+        self.polygons = polygons
+        self.properties = properties
+        xs = [p[0] for polygon in polygons for p in polygon[0]]
+        ys = [p[1] for polygon in polygons for p in polygon[0]]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    def contains(self, lon, lat):
+        min_x, min_y, max_x, max_y = self.bbox
+        if not (min_x <= lon <= max_x and min_y <= lat <= max_y):
+            return False
+        for outer, *holes in self.polygons:
+            if _point_in_ring(lon, lat, outer) and \
+                    not any(_point_in_ring(lon, lat, h) for h in holes):
+                return True
+        return False
+
+
+class GridIndex:
+    """Spatial index bucketing boundaries by the grid cells they overlap"""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.buckets = {}
+
+    def _cell(self, lon, lat):
+        return (math.floor(lon / self.cell_size),
+                math.floor(lat / self.cell_size))
+
+    def add(self, boundary):
+        min_x, min_y, max_x, max_y = boundary.bbox
+        x0, y0 = self._cell(min_x, min_y)
+        x1, y1 = self._cell(max_x, max_y)
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                self.buckets.setdefault((cx, cy), []).append(boundary)
+
+    def find(self, lon, lat):
+        for boundary in self.buckets.get(self._cell(lon, lat), ()):
+            if boundary.contains(lon, lat):
+                return boundary
+        return None
+
+
+class BoundaryGeocoder(BaseGeocoder):
+    """
+    In-process point-in-polygon lookups against local boundary files.
+
+    The file is a GeoJSON FeatureCollection (optionally gzipped) of
+    Polygon/MultiPolygon features. Each feature either has a ``level``
+    (one of LEVELS) and ``name`` property, or carries the level names
+    directly as ``region``/``province``/``municipality``/``barangay``
+    properties, in which case its level is the finest one present.
+    Boundaries are loaded once per process on first use.
+    """
+
+    def __init__(self, path=None, cell_size=None):
+        self.path = path or getattr(settings, 'GEOCODER_BOUNDARY_FILE', '')
+        self.cell_size = cell_size or getattr(
+            settings, 'GEOCODER_GRID_SIZE', 0.05)
+        self._indexes = None
+        self._lock = threading.Lock()
+
+    @property
+    def indexes(self):
+        if self._indexes is None:
+            with self._lock:
+                if self._indexes is None:
+                    self._indexes = self.load()
+        return self._indexes
+
+    def load(self):
+        indexes = {}
+        counts = {}
+        if not self.path or not os.path.exists(self.path):
+            logger.warning("Boundary file %r not found, local geocoder "
+                           "disabled.", self.path)
+            return indexes
+        opener = gzip.open if self.path.endswith('.gz') else open
+        with opener(self.path, 'rt', encoding='utf-8') as f:
+            collection = json.load(f)
+        for feature in collection.get('features', []):
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+            properties = self._names(feature.get('properties') or {})
+            if properties is None:
+                continue
+            level, names = properties
+            indexes.setdefault(level, GridIndex(self.cell_size)).add(
+                Boundary(polygons, names))
+            counts[level] = counts.get(level, 0) + 1
+        logger.info("Loaded boundaries from %s: %s", self.path, counts)
+        return indexes
+
+    @staticmethod
+    def _names(properties):
+        names = {level: properties[level] for level in LEVELS
+                 if properties.get(level)}
+        level = properties.get('level')
+        if level in LEVELS and properties.get('name'):
+            names[level] = properties['name']
+        elif names:
+            level = [lvl for lvl in LEVELS if lvl in names][-1]
+        else:
+            return None
+        return level, names
+
+    def reverse(self, lat, lon):
+        indexes = self.indexes
+        if not indexes:
+            return None
+        data = {'lat': lat, 'lon': lon}
+        # Finest level first, its feature usually names its parents too
+        for level in reversed(LEVELS):
+            if data.get(level) or level not in indexes:
+                continue
+            boundary = indexes[level].find(lon, lat)
+            if boundary is None:
+                continue
+            for key, name in boundary.properties.items():
+                data.setdefault(key, name)
+        if not any(data.get(level) for level in LEVELS):
+            return None
+        return data
+
+
+class StubGeocoder(BaseGeocoder):
+    """
+    Deterministic synthetic areas named after the grid cells holding
+    the coordinate, without any I/O. Used by the benchmarks so that
+    geocoding costs nothing and always resolves.
+    """
+    REGIONS = [code for code, _ in region_choices
+               if code not in ('Central', 'unknown', 'Demo')]
+
+    # Cell size in degrees of each level below the region
+    CELLS = (('province', 0.25), ('municipality', 0.05), ('barangay', 0.01))
+
+    def reverse(self, lat, lon):
+        cell = (math.floor(lat), math.floor(lon))
+        data = {
+            'lat': lat,
+            'lon': lon,
+            'region': self.REGIONS[hash(cell) % len(self.REGIONS)],
+        }
+        for level, size in self.CELLS:
+            data[level] = '%s %d:%d' % (level.title(),
+                                        math.floor(lat / size),
+                                        math.floor(lon / size))
+        return data
+
+
+class ChainGeocoder(BaseGeocoder):
+    """Try each backend in order, returning the first resolved location"""
+
+    def __init__(self, backends):
+        self.backends = backends
+
+    def reverse(self, lat, lon):
+        for backend in self.backends:
+            try:
+                location = backend.reverse(lat, lon)
+            except Exception:
+                logger.exception("Geocoder %s failed for (%s, %s)",
+                                 type(backend).__name__, lat, lon)
+                continue
+            if location is not None:
+                return location
+        return None
+
+
+class LRUCache:
+    """Thread-safe bounded mapping evicting the least recently used key"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CachedGeocoder(BaseGeocoder):
+    """
+    Cache in front of another geocoder keyed on coordinates quantized
+    to `precision` decimal places. Lookups go to a per-process LRU
+    first, then to the shared core.GeocodeCache table and only then
+    to the wrapped backend. Lookups are counted by where they were
+    answered in core.metrics, to tune the grid size.
+    """
+
+    def __init__(self, backend, precision=3, maxsize=10000, persistent=True):
+        self.backend = backend
+        self.precision = precision
+        self.persistent = persistent
+        self.memory = LRUCache(maxsize)
+
+    def key(self, lat, lon):
+        scale = 10 ** self.precision
+        return self.precision, round(lat * scale), round(lon * scale)
+
+    def _load(self, key):
+        from core.models import GeocodeCache
+
+        row = GeocodeCache.objects.filter(
+            precision=key[0], lat_key=key[1], lon_key=key[2]
+        ).values(*LEVELS).first()
+        return row
+
+    def _store(self, key, names):
+        from core.models import GeocodeCache
+
+        GeocodeCache.objects.bulk_create([GeocodeCache(
+            precision=key[0], lat_key=key[1], lon_key=key[2], **names
+        )], ignore_conflicts=True)
+
+    def reverse(self, lat, lon):
+        key = self.key(lat, lon)
+        names = self.memory.get(key)
+        if names is not None:
+            registry.geocoded('memory_hit')
+        else:
+            names = self._load(key) if self.persistent else None
+            if names is not None:
+                registry.geocoded('table_hit')
+            else:
+                registry.geocoded('miss')
+                location = self.backend.reverse(lat, lon)
+                if location is None:
+                    return None
+                names = {level: location.get(level) for level in LEVELS}
+                if self.persistent:
+                    self._store(key, names)
+            self.memory.put(key, names)
+        return {'lat': lat, 'lon': lon, **names}
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def build_geocoder():
+    backends = [import_string(path)() for path in settings.GEOCODER_BACKENDS]
+    geocoder = ChainGeocoder(backends)
+    if settings.GEOCODER_CACHE_SIZE:
+        geocoder = CachedGeocoder(
+            geocoder,
+            precision=settings.GEOCODER_CACHE_PRECISION,
+            maxsize=settings.GEOCODER_CACHE_SIZE,
+            persistent=settings.GEOCODER_CACHE_PERSISTENT)
+    return geocoder
+
+
+def get_geocoder():
+    """Return the process-wide geocoder built from settings"""
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                _geocoder = build_geocoder()
+    return _geocoder
+
+
+def reset_geocoder():
+    """Drop the process-wide geocoder so it is rebuilt from settings"""
+    global _geocoder
+    _geocoder = None
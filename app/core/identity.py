@@ -0,0 +1,133 @@
+"""
+Token to identity resolution for the ingest endpoints
+
+resolve() maps a durin token to the Identity of its owner: the user,
+their agent and office, and the client of the token with the mobile or
+RFC 6349 device registered to it, all read in one query. Identities
+are cached in a per-worker LRU for settings.IDENTITY_LOCAL_TTL seconds
+and in the shared cache for settings.IDENTITY_CACHE_TTL seconds (never
+past the expiry of the token).
+
+Revoking tokens or deactivating users or devices must call
+invalidate(), which clears the LRU of this worker and bumps the version
+in the shared cache keys. Other workers keep their local copies for at
+most IDENTITY_LOCAL_TTL. This needs a cache shared by the workers
+(REDIS_URL), without one IDENTITY_CACHE_TTL defaults to 0 and only the
+LRU is used.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from durin.auth import TokenAuthentication
+from durin.models import AuthToken
+from rest_framework import exceptions
+
+from core.geocoder import LRUCache
+
+VERSION_KEY = 'identity:version'
+
+RELATED = ('user__agent__office', 'client__mobiledevice',
+           'client__rfcdevice')
+
+local = LRUCache(settings.IDENTITY_CACHE_SIZE)
+
+
+def related(obj, name):
+    """Reverse one-to-one `name` of `obj`, None when there is none"""
+    try:
+        return getattr(obj, name)
+    except ObjectDoesNotExist:
+        return None
+
+
+class Identity:
+    """Who a token authenticates, shared between requests: read only"""
+
+    def __init__(self, token):
+        self.token = token
+        self.user = token.user
+        self.client = token.client
+        self.agent = related(self.user, 'agent')
+        self.office = self.agent.office if self.agent else None
+        self.mobile_device = related(self.client, 'mobiledevice')
+        self.rfc_device = related(self.client, 'rfcdevice')
+
+
+def version():
+    return cache.get_or_set(VERSION_KEY, 1, timeout=None)
+
+
+def invalidate():
+    """Drop every cached identity"""
+    local.clear()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, timeout=None)
+
+
+def key(token):
+    # Tokens are credentials, keep them out of the cache keys
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    return 'identity:%s:%s' % (version(), digest)
+
+
+def load(token):
+    try:
+        return Identity(AuthToken.objects.select_related(*RELATED).get(
+            token=token))
+    except AuthToken.DoesNotExist:
+        return None
+
+
+def resolve(token):
+    """Identity of the `token` string, None for unknown tokens"""
+    now = time.monotonic()
+    entry = local.get(token)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    identity = None
+    if settings.IDENTITY_CACHE_TTL > 0:
+        shared = key(token)
+        identity = cache.get(shared)
+    if identity is None:
+        identity = load(token)
+        if identity is None:
+            return None
+        ttl = min(settings.IDENTITY_CACHE_TTL, (
+            identity.token.expiry - timezone.now()).total_seconds())
+        if ttl > 0:
+            cache.set(shared, identity, ttl)
+    local.put(token, (now + settings.IDENTITY_LOCAL_TTL, identity))
+    return identity
+
+
+def of(request):
+    """Identity of the token `request` is authenticated with, if any"""
+    if request.auth is None:
+        return None
+    # An AuthToken, or its string when forced in tests
+    return resolve(getattr(request.auth, 'token', request.auth))
+
+
+class IdentityTokenAuthentication(TokenAuthentication):
+    """durin's TokenAuthentication answered from resolve()"""
+
+    @classmethod
+    def authenticate_credentials(cls, token):
+        try:
+            identity = resolve(token.decode('utf-8'))
+        except UnicodeDecodeError:
+            identity = None
+        if identity is None:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+        if cls._cleanup_token(identity.token):
+            invalidate()
+            raise exceptions.AuthenticationFailed(
+                _("The given token has expired."))
+        return cls.validate_user(identity.token)
@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import partitions
+
+
+class Command(BaseCommand):
+    """
+    Create the monthly partitions of the result and flat result tables
+    ahead of time and expire the result months past the retention with
+    their tests. Meant to run daily.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=settings.PARTITION_MONTHS_AHEAD,
+            help="Months after the current one to create partitions for.")
+        parser.add_argument(
+            '--retention', type=int,
+            default=settings.PARTITION_RETENTION_MONTHS,
+            help="Months to keep attached, including the current one.")
+        parser.add_argument(
+            '--archive-schema', default=settings.PARTITION_ARCHIVE_SCHEMA,
+            help="Schema detached partitions and their tests are moved to.")
+        parser.add_argument('--drop', action='store_true',
+                            help="Drop detached partitions and their tests.")
+        parser.add_argument(
+            '--interval', type=float,
+            help="Repeat every this many seconds instead of exiting.")
+
+    def handle(self, *args, **options):
+        while True:
+            self.maintain(options)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def maintain(self, options):
+        for model in partitions.MODELS:
+            created, detached = partitions.maintain(
+                model,
+                ahead=options['ahead'],
+                retention=options['retention'],
+                archive_schema=options['archive_schema'],
+                drop=options['drop'])
+            for name in created:
+                self.stdout.write(f'Created {name}.')
+            for name in detached:
+                self.stdout.write(f'Detached {name}.')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import enrichment
+
+
+class Command(BaseCommand):
+    """Drain the post-ingest enrichment queue"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Process due jobs once and exit.")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help="Seconds to sleep when the queue is empty.")
+
+    def handle(self, *args, **options):
+        self.stdout.write('Processing enrichment jobs...')
+        while True:
+            processed = enrichment.process(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f'Processed {processed} job(s).')
+            if options['once']:
+                break
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models.functions import TruncHour
+
+from core import rollups
+from core.models import PendingRollup
+
+
+class Command(BaseCommand):
+    """Rebuild the stats rollups of the hours with new or changed tests"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Rebuild the pending hours once and exit.")
+        parser.add_argument('--backfill', action='store_true',
+                            help="Queue every hour with tests first.")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help="Seconds to sleep when nothing is pending.")
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.backfill()
+        while True:
+            refreshed = rollups.refresh(limit=options['batch_size'])
+            if refreshed:
+                self.stdout.write(f'Rebuilt {refreshed} hour(s).')
+            if options['once'] and refreshed < options['batch_size']:
+                break
+            if refreshed < options['batch_size']:
+                time.sleep(options['interval'])
+
+    def backfill(self):
+        for kind, (flat_model, *_) in rollups.KINDS.items():
+            hours = flat_model.objects.annotate(
+                hour=TruncHour('date_created')).values_list(
+                    'hour', flat=True).distinct()
+            PendingRollup.objects.bulk_create(
+                [PendingRollup(kind=kind, hour=hour) for hour in hours],
+                ignore_conflicts=True)
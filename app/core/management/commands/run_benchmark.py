@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    """
+    Drive the ingest and read endpoints against the seeded benchmark
+    dataset and report throughput, p50/p99 latency and queries per
+    request. --output writes the report as a JSON baseline, --compare
+    fails when a run regressed against one. Server errors fail the run,
+    a broken endpoint is not measured. Geocoding is stubbed out,
+    run with ENRICHMENT_ASYNC=0 to time it inline with ingest.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append',
+                            choices=sorted(benchmark.SCENARIOS),
+                            help="Scenario to run, all of them by default. "
+                                 "Repeatable.")
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--warmup', type=int, default=5,
+                            help="Requests sent before measuring.")
+        parser.add_argument('--url',
+                            help="Base URL of a running server, the "
+                                 "requests are served in-process by "
+                                 "default.")
+        parser.add_argument('--output', help="Write the report here.")
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help="Report of an earlier run to compare "
+                                 "against.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Fraction latency and throughput may get "
+                                 "worse by before being reported.")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--concurrency and --requests must be "
+                               "positive.")
+        try:
+            report = benchmark.run(
+                scenarios=options['scenario'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                url=options['url'],
+                warmup=options['warmup'],
+                log=self.stdout.write)
+        except LookupError as error:
+            raise CommandError(str(error))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}.")
+        failing = [name for name, stats in report['scenarios'].items()
+                   if stats['server_errors']]
+        if failing:
+            raise CommandError("Server errors in %s." % ', '.join(failing))
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = benchmark.compare(report, baseline,
+                                            options['tolerance'])
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError(
+                    "%d regression(s) against %s (%s)." % (
+                        len(regressions), options['compare'],
+                        baseline['meta'].get('commit')))
+            self.stdout.write(f"No regression against {options['compare']}.")
@@ -0,0 +1,44 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    """
+    Seed the synthetic benchmark dataset (see core.benchmark). Running
+    it again appends --results older tests to the same testers,
+    devices and servers.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--results', type=int, default=10000,
+                            help="Mobile tests to create.")
+        parser.add_argument('--agents', type=int, default=10,
+                            help="Field testers sharing the tests.")
+        parser.add_argument('--devices', type=int,
+                            help="Mobile devices, one per agent by default.")
+        parser.add_argument('--locations', type=int, default=200,
+                            help="Anchor points the tests are placed "
+                                 "around.")
+        parser.add_argument('--servers', type=int, default=4)
+        parser.add_argument('--days', type=int, default=30,
+                            help="Days the tests are spread over.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Seed of the random generator.")
+
+    def handle(self, *args, **options):
+        created = benchmark.seed(
+            results=options['results'],
+            agents_count=options['agents'],
+            devices_count=options['devices'],
+            locations_count=options['locations'],
+            servers_count=options['servers'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+            random_seed=options['seed'],
+            log=self.stdout.write)
+        # Move the backdated rows out of the default partitions
+        call_command('manage_partitions', stdout=self.stdout)
+        self.stdout.write(f'Seeded {created} test(s).')
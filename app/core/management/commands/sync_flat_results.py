@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from core import enrichment, flat
+
+
+class Command(BaseCommand):
+    """
+    Bring mobile_result_flat and rfc_result_flat up to date. By default
+    only tests missing from the flat table and rows still pending
+    enrichment are synced, --full re-syncs every test.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Re-sync every test and drop orphan rows.")
+        parser.add_argument('--kind', choices=sorted(enrichment.MODELS),
+                            help="Only sync mobile or rfc tests.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        kinds = [options['kind']] if options['kind'] else enrichment.MODELS
+        for kind in kinds:
+            model = enrichment.MODELS[kind]
+            flat_model = flat.flat_model(model)
+            tests = model.objects.all()
+            if not options['full']:
+                pending = list(flat_model.objects.filter(
+                    enrichment=enrichment.PENDING).values_list(
+                        'id', flat=True))
+                for i in range(0, len(pending), options['batch_size']):
+                    flat.sync(model, ids=pending[
+                        i:i + options['batch_size']])
+                tests = tests.filter(~Exists(flat_model.objects.filter(
+                    id=OuterRef('pk'))))
+            synced = self.sync_batches(model, tests, options['batch_size'])
+            if options['full']:
+                orphans = flat_model.objects.exclude(
+                    id__in=model.objects.values('id'))
+                orphans.delete()
+            self.stdout.write(f'Synced {synced} {kind} test(s).')
+
+    def sync_batches(self, model, tests, batch_size):
+        """Sync `tests` in batches of primary keys"""
+        synced = 0
+        start = 0
+        while True:
+            ids = list(tests.filter(pk__gt=start).order_by(
+                'pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return synced
+            with transaction.atomic():
+                synced += flat.sync(model, ids=ids)
+            start = ids[-1]
@@ -0,0 +1,101 @@
+"""
+Request metrics exposed in the Prometheus text format
+
+The request counters and histograms are labelled with the URL name of
+the view, see core.middleware for what is recorded, and the geocode
+cache lookups with where they were answered, see core.geocoder. uwsgi
+runs several workers and geocoding runs in the process_enrichment
+worker, so when PROMETHEUS_MULTIPROC_DIR is set (see scripts/run.sh and
+the docker-compose files) every process writes its values to files in
+that directory and render() sums them over all of them, whichever one
+serves the scrape. Without it the metrics are those of the current
+process only.
+"""
+import math
+import os
+import socket
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    disable_created_metrics,
+    generate_latest,
+    multiprocess,
+    values,
+)
+
+PREFIX = 'netmesh_'
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+
+QUERIES = (1, 2, 5, 10, 20, 50, 100, 200, 500, math.inf)
+
+# The *_created samples cannot be summed over workers
+disable_created_metrics()
+
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # The directory is shared between containers, whose pids can clash
+    values.ValueClass = values.MultiProcessValue(
+        lambda: '%s-%s' % (socket.gethostname(), os.getpid()))
+
+
+class Registry:
+
+    def __init__(self):
+        self.registry = CollectorRegistry(auto_describe=True)
+        self.requests = Counter(
+            PREFIX + 'http_requests', "Requests handled.",
+            ('view', 'method', 'status'), registry=self.registry)
+        self.duration = Histogram(
+            PREFIX + 'http_request_duration_seconds',
+            "Wall time of requests.", ('view', 'method'), buckets=SECONDS,
+            registry=self.registry)
+        self.db_duration = Histogram(
+            PREFIX + 'db_duration_seconds',
+            "Time spent in SQL queries per request.", ('view',),
+            buckets=SECONDS, registry=self.registry)
+        self.db_queries = Histogram(
+            PREFIX + 'db_queries', "SQL queries run per request.",
+            ('view',), buckets=QUERIES, registry=self.registry)
+        self.serializer_duration = Histogram(
+            PREFIX + 'serializer_duration_seconds',
+            "Time spent serializing response data per request.", ('view',),
+            buckets=SECONDS, registry=self.registry)
+        self.budget_exceeded = Counter(
+            PREFIX + 'query_budget_exceeded',
+            "Requests that ran more queries than their budget.", ('view',),
+            registry=self.registry)
+        self.geocoder_lookups = Counter(
+            PREFIX + 'geocoder_lookups',
+            "Geocode cache lookups by where they were answered.",
+            ('result',), registry=self.registry)
+
+    def record(self, view, method, status, stats):
+        self.requests.labels(view, method, status).inc()
+        self.duration.labels(view, method).observe(stats.wall_time)
+        self.db_duration.labels(view).observe(stats.db_time)
+        self.db_queries.labels(view).observe(stats.queries)
+        self.serializer_duration.labels(view).observe(stats.serializer_time)
+
+    def exceeded(self, view):
+        self.budget_exceeded.labels(view).inc()
+
+    def geocoded(self, result):
+        """Count a geocode lookup, a memory_hit, table_hit or miss"""
+        self.geocoder_lookups.labels(result).inc()
+
+    def value(self, name, **labels):
+        """Current value of the sample `name` of this process, 0 if none"""
+        return self.registry.get_sample_value(name, labels) or 0
+
+    def render(self):
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = self.registry
+        return generate_latest(registry).decode()
+
+
+registry = Registry()
@@ -0,0 +1,166 @@
+"""
+Per-request wall time, SQL time, query count and serializer time
+
+RequestMetricsMiddleware records them for every request under the URL
+name of the view (core.metrics), adds a Server-Timing header when
+settings.SERVER_TIMING is set and checks the query count against
+settings.QUERY_BUDGETS. Streaming responses are measured until their
+last chunk is sent.
+"""
+import contextlib
+import contextvars
+import functools
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+current = contextvars.ContextVar('request_stats', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestStats:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.wall_time = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper timing each query"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def begin(self):
+        for connection in connections.all():
+            # Left behind by a streaming response that was never read
+            connection.execute_wrappers[:] = [
+                wrapper for wrapper in connection.execute_wrappers
+                if not isinstance(wrapper, RequestStats)]
+            connection.execute_wrappers.append(self)
+            self.connections.append(connection)
+
+    def end(self):
+        for connection in self.connections:
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+        self.connections = []
+        self.wall_time = time.perf_counter() - self.start
+
+    def server_timing(self):
+        return ', '.join([
+            'total;dur=%.1f' % (self.wall_time * 1000),
+            'db;dur=%.1f;desc="%d queries"' % (self.db_time * 1000,
+                                               self.queries),
+            'serializer;dur=%.1f' % (self.serializer_time * 1000),
+        ])
+
+
+@contextlib.contextmanager
+def serializer_timer():
+    """Count the time of the block as serializer time, once if nested"""
+    stats = current.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - start
+        stats.serializing = False
+
+
+def instrument_serializers():
+    """Time the outermost serializer.data of each request"""
+    data = serializers.BaseSerializer.data
+    if getattr(data.fget, 'instrumented', False):
+        return
+
+    @functools.wraps(data.fget)
+    def timed_data(serializer):
+        with serializer_timer():
+            return data.fget(serializer)
+
+    timed_data.instrumented = True
+    serializers.BaseSerializer.data = property(timed_data)
+
+
+class RequestMetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = current.set(stats)
+        stats.begin()
+        try:
+            response = self.get_response(request)
+        except Exception:
+            stats.end()
+            raise
+        finally:
+            current.reset(token)
+        view = self.view_name(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, stats, request, view,
+                response.status_code)
+            return response
+        stats.end()
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = stats.server_timing()
+        self.finish(stats, request, view, response.status_code)
+        return response
+
+    def stream(self, content, stats, request, view, status):
+        content = iter(content)
+        try:
+            while True:
+                # Serializers can run while the chunks are generated
+                token = current.set(stats)
+                try:
+                    chunk = next(content)
+                except StopIteration:
+                    return
+                finally:
+                    current.reset(token)
+                yield chunk
+        finally:
+            stats.end()
+            self.finish(stats, request, view, status)
+
+    def view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match else 'unresolved'
+
+    def finish(self, stats, request, view, status):
+        registry.record(view, request.method, status, stats)
+        budget = settings.QUERY_BUDGETS.get(view)
+        if budget is None or stats.queries <= budget:
+            return
+        registry.exceeded(view)
+        message = "%s %s ran %d queries, over its budget of %d" % (
+            request.method, request.path, stats.queries, budget)
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
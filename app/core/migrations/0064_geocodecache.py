@@ -0,0 +1,31 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0063_alter_linkedmobiledevice_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precision', models.PositiveSmallIntegerField()),
+                ('lat_key', models.IntegerField()),
+                ('lon_key', models.IntegerField()),
+                ('region', models.CharField(blank=True, max_length=255, null=True)),
+                ('province', models.CharField(blank=True, max_length=255, null=True)),
+                ('municipality', models.CharField(blank=True, max_length=255, null=True)),
+                ('barangay', models.CharField(blank=True, max_length=255, null=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='geocodecache',
+            constraint=models.UniqueConstraint(fields=('precision', 'lat_key', 'lon_key'), name='unique geocode cache key'),
+        ),
+    ]
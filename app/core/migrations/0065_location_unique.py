@@ -0,0 +1,57 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:23
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+# Point every test at the lowest id of its
+# (region, province, municipality, barangay) group and drop the rest
+COLLAPSE_DUPLICATE_LOCATIONS = [
+    """
+    UPDATE core_location SET
+        region = NULLIF(region, ''),
+        province = NULLIF(province, ''),
+        municipality = NULLIF(municipality, ''),
+        barangay = NULLIF(barangay, '')
+    """,
+    """
+    CREATE TEMPORARY TABLE canonical_location ON COMMIT DROP AS
+    SELECT id, keep FROM (
+        SELECT id, MIN(id) OVER (
+            PARTITION BY region, province, municipality, barangay
+        ) AS keep
+        FROM core_location
+    ) locations
+    WHERE id <> keep
+    """,
+    """
+    UPDATE core_ntcspeedtest SET location_id = c.keep
+    FROM canonical_location c WHERE location_id = c.id
+    """,
+    """
+    UPDATE core_rfctest SET location_id = c.keep
+    FROM canonical_location c WHERE location_id = c.id
+    """,
+    """
+    DELETE FROM core_location
+    WHERE id IN (SELECT id FROM canonical_location)
+    """,
+    # Fire the deferred FK checks before the unique index is built
+    "SET CONSTRAINTS ALL IMMEDIATE",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0064_geocodecache'),
+    ]
+
+    operations = [
+        migrations.RunSQL(COLLAPSE_DUPLICATE_LOCATIONS,
+                          reverse_sql=migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='location',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('region', models.Value('')), django.db.models.functions.comparison.Coalesce('province', models.Value('')), django.db.models.functions.comparison.Coalesce('municipality', models.Value('')), django.db.models.functions.comparison.Coalesce('barangay', models.Value('')), name='unique location'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0065_location_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrichmentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('mobile', 'Mobile Speed Test'), ('rfc', 'RFC-6349 Test')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('is_dead', models.BooleanField(default=False)),
+                ('last_error', models.TextField(blank=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ntcspeedtest',
+            name='enrichment',
+            field=models.CharField(choices=[('pending', 'Enrichment Pending'), ('done', 'Enriched'), ('failed', 'Enrichment Failed')], default='done', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='rfctest',
+            name='enrichment',
+            field=models.CharField(choices=[('pending', 'Enrichment Pending'), ('done', 'Enriched'), ('failed', 'Enrichment Failed')], default='done', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='ntcspeedtest',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.location'),
+        ),
+        migrations.AlterField(
+            model_name='rfctest',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.location'),
+        ),
+        migrations.AddIndex(
+            model_name='enrichmentjob',
+            index=models.Index(fields=['is_dead', 'run_after'], name='enrichment_job_queue'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:36
+
+from django.contrib.postgres.operations import TrigramExtension
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0066_enrichment'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('province'), name='gin_trgm_ops'), name='location_province_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('municipality'), name='gin_trgm_ops'), name='location_municipality_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('barangay'), name='gin_trgm_ops'), name='location_barangay_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='mobileresult',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('operator'), name='gin_trgm_ops'), name='mobileresult_operator_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='ntcspeedtest',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('test_id', models.TextField()), name='text_pattern_ops'), name='ntcspeedtest_test_id_prefix'),
+        ),
+        migrations.AddIndex(
+            model_name='rfctest',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('test_id', models.TextField()), name='text_pattern_ops'), name='rfctest_test_id_prefix'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0067_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='rfctest',
+            options={'ordering': ['-date_created']},
+        ),
+        migrations.AddIndex(
+            model_name='ntcspeedtest',
+            index=models.Index(fields=['date_created', 'id'], name='ntcspeedtest_created'),
+        ),
+        migrations.AddIndex(
+            model_name='ntcspeedtest',
+            index=models.Index(fields=['tester', 'date_created', 'id'], name='ntcspeedtest_tester_created'),
+        ),
+        migrations.AddIndex(
+            model_name='rfctest',
+            index=models.Index(fields=['date_created', 'id'], name='rfctest_created'),
+        ),
+        migrations.AddIndex(
+            model_name='rfctest',
+            index=models.Index(fields=['tester', 'date_created', 'id'], name='rfctest_tester_created'),
+        ),
+    ]
@@ -0,0 +1,252 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:41
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+
+# Flat column -> lookup from the test model as of this migration, other
+# columns are copied from the result field of the same name
+COMMON_COLUMNS = {
+    'id': 'id',
+    'date_created': 'date_created',
+    'test_id': 'test_id',
+    'enrichment': 'enrichment',
+    'client_ip': 'client_ip',
+    'tester_id': 'tester_id',
+    'tester_email': 'tester__agent__email',
+    'tester_first_name': 'tester__agent__first_name',
+    'tester_last_name': 'tester__agent__last_name',
+    'office_id': 'tester__office_id',
+    'office_name': 'tester__office__name',
+    'region_id': 'tester__office__region_id',
+    'region': 'tester__office__region__region',
+    'location_id': 'location_id',
+    'location_region': 'location__region',
+    'province': 'location__province',
+    'municipality': 'location__municipality',
+    'barangay': 'location__barangay',
+    'test_device_id': 'test_device_id',
+    'td_name': 'test_device__name',
+    'td_serial_number': 'test_device__serial_number',
+    'result_id': 'result_id',
+}
+
+FLAT_MODELS = {
+    'NTCSpeedTest': ('MobileResultFlat', dict(
+        COMMON_COLUMNS,
+        td_imei='test_device__imei',
+        td_phone_model='test_device__phone_model',
+        td_android_version='test_device__android_version',
+    )),
+    'RfcTest': ('RfcResultFlat', dict(
+        COMMON_COLUMNS,
+        result_test_id='result__test_id',
+        result_location='result__location',
+    )),
+}
+
+
+def backfill(apps, schema_editor):
+    """Copy the existing tests into the flat tables in one INSERT each"""
+    quote = schema_editor.quote_name
+    for name, (flat_name, explicit) in FLAT_MODELS.items():
+        model = apps.get_model('core', name)
+        flat = apps.get_model('core', flat_name)
+        mapping = {
+            field.attname: explicit.get(field.attname,
+                                        'result__' + field.attname)
+            for field in flat._meta.concrete_fields
+        }
+        sql, params = model.objects.order_by().values(
+            *mapping.values()).query.sql_with_params()
+        schema_editor.execute('INSERT INTO %s (%s) %s' % (
+            quote(flat._meta.db_table),
+            ', '.join(quote(column) for column in mapping),
+            sql), params)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0068_result_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MobileResultFlat',
+            fields=[
+                ('id', models.BigIntegerField(help_text='id of the test row', primary_key=True, serialize=False)),
+                ('date_created', models.DateTimeField()),
+                ('test_id', models.UUIDField(null=True)),
+                ('enrichment', models.CharField(choices=[('pending', 'Enrichment Pending'), ('done', 'Enriched'), ('failed', 'Enrichment Failed')], max_length=10)),
+                ('client_ip', models.GenericIPAddressField(null=True)),
+                ('tester_id', models.BigIntegerField()),
+                ('tester_email', models.EmailField(max_length=255, null=True)),
+                ('tester_first_name', models.CharField(max_length=20, null=True)),
+                ('tester_last_name', models.CharField(max_length=20, null=True)),
+                ('office_id', models.BigIntegerField(null=True)),
+                ('office_name', models.CharField(max_length=250, null=True)),
+                ('region_id', models.BigIntegerField(null=True)),
+                ('region', models.CharField(max_length=20, null=True)),
+                ('location_id', models.BigIntegerField(null=True)),
+                ('location_region', models.CharField(max_length=255, null=True)),
+                ('province', models.CharField(max_length=255, null=True)),
+                ('municipality', models.CharField(max_length=255, null=True)),
+                ('barangay', models.CharField(max_length=255, null=True)),
+                ('test_device_id', models.BigIntegerField()),
+                ('td_name', models.CharField(max_length=250, null=True)),
+                ('td_serial_number', models.CharField(max_length=250, null=True)),
+                ('result_id', models.BigIntegerField()),
+                ('server_id', models.BigIntegerField(null=True)),
+                ('lat', models.FloatField(null=True)),
+                ('lon', models.FloatField(null=True)),
+                ('timestamp', models.DateTimeField(null=True)),
+                ('td_imei', models.CharField(max_length=250, null=True)),
+                ('td_phone_model', models.CharField(max_length=250, null=True)),
+                ('td_android_version', models.CharField(max_length=100, null=True)),
+                ('android_version', models.CharField(max_length=100, null=True)),
+                ('ssid', models.CharField(max_length=250, null=True)),
+                ('bssid', models.CharField(max_length=250, null=True)),
+                ('rssi', models.FloatField(null=True)),
+                ('network_type', models.CharField(max_length=20, null=True)),
+                ('imei', models.CharField(max_length=250, null=True)),
+                ('cell_id', models.CharField(max_length=250, null=True)),
+                ('mcc', models.CharField(max_length=250, null=True)),
+                ('mnc', models.CharField(max_length=250, null=True)),
+                ('tac', models.CharField(max_length=250, null=True)),
+                ('signal_quality', models.CharField(max_length=250, null=True)),
+                ('operator', models.CharField(max_length=250, null=True)),
+                ('upload', models.FloatField(null=True)),
+                ('download', models.FloatField(null=True)),
+                ('jitter', models.FloatField(null=True)),
+                ('ping', models.FloatField(null=True)),
+                ('success', models.BooleanField(null=True)),
+            ],
+            options={
+                'db_table': 'mobile_result_flat',
+            },
+        ),
+        migrations.CreateModel(
+            name='RfcResultFlat',
+            fields=[
+                ('id', models.BigIntegerField(help_text='id of the test row', primary_key=True, serialize=False)),
+                ('date_created', models.DateTimeField()),
+                ('test_id', models.UUIDField(null=True)),
+                ('enrichment', models.CharField(choices=[('pending', 'Enrichment Pending'), ('done', 'Enriched'), ('failed', 'Enrichment Failed')], max_length=10)),
+                ('client_ip', models.GenericIPAddressField(null=True)),
+                ('tester_id', models.BigIntegerField()),
+                ('tester_email', models.EmailField(max_length=255, null=True)),
+                ('tester_first_name', models.CharField(max_length=20, null=True)),
+                ('tester_last_name', models.CharField(max_length=20, null=True)),
+                ('office_id', models.BigIntegerField(null=True)),
+                ('office_name', models.CharField(max_length=250, null=True)),
+                ('region_id', models.BigIntegerField(null=True)),
+                ('region', models.CharField(max_length=20, null=True)),
+                ('location_id', models.BigIntegerField(null=True)),
+                ('location_region', models.CharField(max_length=255, null=True)),
+                ('province', models.CharField(max_length=255, null=True)),
+                ('municipality', models.CharField(max_length=255, null=True)),
+                ('barangay', models.CharField(max_length=255, null=True)),
+                ('test_device_id', models.BigIntegerField()),
+                ('td_name', models.CharField(max_length=250, null=True)),
+                ('td_serial_number', models.CharField(max_length=250, null=True)),
+                ('result_id', models.BigIntegerField()),
+                ('server_id', models.BigIntegerField(null=True)),
+                ('lat', models.FloatField(null=True)),
+                ('lon', models.FloatField(null=True)),
+                ('timestamp', models.DateTimeField(null=True)),
+                ('result_test_id', models.UUIDField(null=True)),
+                ('result_location', models.CharField(max_length=250, null=True)),
+                ('direction', models.CharField(max_length=10, null=True)),
+                ('mtu', models.IntegerField(null=True)),
+                ('baseline_rtt', models.FloatField(null=True)),
+                ('rtt', models.FloatField(null=True)),
+                ('ave_rtt', models.FloatField(null=True)),
+                ('bb', models.FloatField(null=True)),
+                ('bdp', models.FloatField(null=True)),
+                ('rwnd', models.FloatField(null=True)),
+                ('max_achievable_thpt', models.PositiveBigIntegerField(null=True)),
+                ('actual_thpt', models.PositiveBigIntegerField(null=True)),
+                ('ideal_transfer_time', models.FloatField(null=True)),
+                ('acutal_transfer_time', models.FloatField(null=True)),
+                ('transfer_time_ratio', models.FloatField(null=True)),
+                ('tcp_efficiency', models.FloatField(null=True)),
+                ('buffer_delay', models.FloatField(null=True)),
+                ('tx_bytes', models.FloatField(null=True)),
+                ('iperf_version', models.CharField(max_length=250, null=True)),
+                ('sndbuf_actual', models.CharField(max_length=250, null=True)),
+                ('rcvbuf_actual', models.CharField(max_length=250, null=True)),
+                ('transfer_bytes', models.PositiveBigIntegerField(null=True)),
+                ('retransmit_bytes', models.PositiveBigIntegerField(null=True)),
+                ('sender_tcp_congestion', models.CharField(max_length=10, null=True)),
+                ('receiver_tcp_congestion', models.CharField(max_length=10, null=True)),
+                ('host_system_util', models.FloatField(null=True)),
+                ('remote_system_util', models.FloatField(null=True)),
+            ],
+            options={
+                'db_table': 'rfc_result_flat',
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rfcresultflat',
+            index=models.Index(fields=['region', 'date_created', 'id'], name='rfcflat_region_created'),
+        ),
+        migrations.AddIndex(
+            model_name='rfcresultflat',
+            index=models.Index(fields=['tester_id', 'date_created', 'id'], name='rfcflat_tester_created'),
+        ),
+        migrations.AddIndex(
+            model_name='rfcresultflat',
+            index=models.Index(fields=['date_created', 'id'], name='rfcflat_created'),
+        ),
+        migrations.AddIndex(
+            model_name='rfcresultflat',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('test_id', models.TextField()), name='text_pattern_ops'), name='rfcflat_test_id_prefix'),
+        ),
+        migrations.AddIndex(
+            model_name='rfcresultflat',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('province'), name='gin_trgm_ops'), name='rfcflat_province_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='rfcresultflat',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('municipality'), name='gin_trgm_ops'), name='rfcflat_municipality_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='rfcresultflat',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('barangay'), name='gin_trgm_ops'), name='rfcflat_barangay_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='mobileresultflat',
+            index=models.Index(fields=['region', 'date_created', 'id'], name='mobileflat_region_created'),
+        ),
+        migrations.AddIndex(
+            model_name='mobileresultflat',
+            index=models.Index(fields=['tester_id', 'date_created', 'id'], name='mobileflat_tester_created'),
+        ),
+        migrations.AddIndex(
+            model_name='mobileresultflat',
+            index=models.Index(fields=['date_created', 'id'], name='mobileflat_created'),
+        ),
+        migrations.AddIndex(
+            model_name='mobileresultflat',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.comparison.Cast('test_id', models.TextField()), name='text_pattern_ops'), name='mobileflat_test_id_prefix'),
+        ),
+        migrations.AddIndex(
+            model_name='mobileresultflat',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('province'), name='gin_trgm_ops'), name='mobileflat_province_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='mobileresultflat',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('municipality'), name='gin_trgm_ops'), name='mobileflat_municipality_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='mobileresultflat',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('barangay'), name='gin_trgm_ops'), name='mobileflat_barangay_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='mobileresultflat',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('operator'), name='gin_trgm_ops'), name='mobileflat_operator_trgm'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:05
+
+from django.db import migrations
+
+FLAT_MODELS = ('MobileResultFlat', 'RfcResultFlat')
+
+
+def rebuild(apps, schema_editor, partitioned):
+    """
+    Recreate the flat tables with their rows, partitioned by month of
+    date_created (see core.partitions) or as plain tables. The primary
+    key of a partitioned table has to include the partition key, so it
+    becomes (id, date_created). Only the default partition is created
+    here, the manage_partitions command adds the monthly ones.
+    """
+    quote = schema_editor.quote_name
+    for name in FLAT_MODELS:
+        model = apps.get_model('core', name)
+        table = model._meta.db_table
+        old = table + '_old'
+        schema_editor.execute('ALTER TABLE %s RENAME TO %s' % (
+            quote(table), quote(old)))
+        schema_editor.execute(
+            'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING '
+            'CONSTRAINTS)%s' % (
+                quote(table), quote(old),
+                ' PARTITION BY RANGE (date_created)' if partitioned else ''))
+        if partitioned:
+            schema_editor.execute(
+                'CREATE TABLE %s PARTITION OF %s DEFAULT' % (
+                    quote(table + '_default'), quote(table)))
+        schema_editor.execute('INSERT INTO %s SELECT * FROM %s' % (
+            quote(table), quote(old)))
+        schema_editor.execute('DROP TABLE %s CASCADE' % quote(old))
+        schema_editor.execute('ALTER TABLE %s ADD PRIMARY KEY (%s)' % (
+            quote(table), 'id, date_created' if partitioned else 'id'))
+        for index in model._meta.indexes:
+            schema_editor.add_index(model, index)
+
+
+def partition(apps, schema_editor):
+    rebuild(apps, schema_editor, partitioned=True)
+
+
+def unpartition(apps, schema_editor):
+    rebuild(apps, schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0069_flat_results'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
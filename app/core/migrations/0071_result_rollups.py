@@ -0,0 +1,60 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:48
+
+from django.db import migrations, models
+from django.db.models.functions import TruncHour
+
+FLAT_MODELS = {'mobile': 'MobileResultFlat', 'rfc': 'RfcResultFlat'}
+
+
+def queue_hours(apps, schema_editor):
+    """Queue every hour with tests, the refresh_rollups worker builds them"""
+    PendingRollup = apps.get_model('core', 'PendingRollup')
+    for kind, name in FLAT_MODELS.items():
+        hours = apps.get_model('core', name).objects.annotate(
+            hour=TruncHour('date_created')).values_list(
+                'hour', flat=True).distinct()
+        PendingRollup.objects.bulk_create(
+            [PendingRollup(kind=kind, hour=hour) for hour in hours],
+            ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0070_partition_flat_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('mobile', 'Mobile Speed Test'), ('rfc', 'RFC-6349 Test')], max_length=10)),
+                ('hour', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResultRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('mobile', 'Mobile Speed Test'), ('rfc', 'RFC-6349 Test')], max_length=10)),
+                ('granularity', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket', models.DateTimeField(help_text='start of the hour or day')),
+                ('region', models.CharField(blank=True, default='', max_length=20)),
+                ('operator', models.CharField(blank=True, default='', max_length=250)),
+                ('network_type', models.CharField(blank=True, default='', max_length=20)),
+                ('province', models.CharField(blank=True, default='', max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('metrics', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='resultrollup',
+            constraint=models.UniqueConstraint(fields=('kind', 'granularity', 'bucket', 'region', 'operator', 'network_type', 'province'), name='unique result rollup key'),
+        ),
+        migrations.AddConstraint(
+            model_name='pendingrollup',
+            constraint=models.UniqueConstraint(fields=('kind', 'hour'), name='unique pending rollup'),
+        ),
+        migrations.RunPython(queue_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:51
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0071_result_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('mobile', 'Mobile Speed Test'), ('rfc', 'RFC-6349 Test')], max_length=10)),
+                ('metric', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('region', models.CharField(blank=True, default='', max_length=20)),
+                ('operator', models.CharField(blank=True, default='', max_length=250)),
+                ('network_type', models.CharField(blank=True, default='', max_length=20)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('zero_count', models.PositiveBigIntegerField(default=0)),
+                ('bin_offset', models.IntegerField(default=0)),
+                ('bins', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveBigIntegerField(), default=list, size=None)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='resultsketch',
+            constraint=models.UniqueConstraint(fields=('kind', 'metric', 'day', 'region', 'operator', 'network_type'), name='unique result sketch key'),
+        ),
+    ]
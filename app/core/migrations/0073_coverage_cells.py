@@ -0,0 +1,46 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0072_result_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoverageCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('x', models.IntegerField()),
+                ('y', models.IntegerField()),
+                ('operator', models.CharField(blank=True, default='', max_length=250)),
+                ('network_type', models.CharField(blank=True, default='', max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('download_count', models.PositiveIntegerField(default=0)),
+                ('download_sum', models.FloatField(null=True)),
+                ('download_min', models.FloatField(null=True)),
+                ('download_max', models.FloatField(null=True)),
+                ('upload_count', models.PositiveIntegerField(default=0)),
+                ('upload_sum', models.FloatField(null=True)),
+                ('upload_min', models.FloatField(null=True)),
+                ('upload_max', models.FloatField(null=True)),
+                ('ping_count', models.PositiveIntegerField(default=0)),
+                ('ping_sum', models.FloatField(null=True)),
+                ('ping_min', models.FloatField(null=True)),
+                ('ping_max', models.FloatField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='coveragecell',
+            index=models.Index(fields=['day'], name='coveragecell_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='coveragecell',
+            constraint=models.UniqueConstraint(fields=('zoom', 'x', 'y', 'day', 'operator', 'network_type'), name='unique coverage cell key'),
+        ),
+    ]
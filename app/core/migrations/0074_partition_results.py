@@ -0,0 +1,127 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+# Result model -> partition key, unique constraints (name, columns) of
+# the partitioned and of the plain table
+RESULT_MODELS = {
+    'MobileResult': (
+        'timestamp',
+        [('unique mobile results', ['timestamp', 'server_id'])],
+        [('unique mobile results', ['timestamp', 'server_id'])],
+    ),
+    'RfcResult': (
+        'timestamp',
+        [('unique rfc result test id', ['test_id', 'timestamp'])],
+        [(None, ['test_id'])],
+    ),
+}
+
+
+def rebuild(apps, schema_editor, partitioned):
+    """
+    Recreate the result tables with their rows, partitioned by month of
+    timestamp (see core.partitions) or as plain tables. The primary key
+    and unique constraints of a partitioned table have to include the
+    partition key, so the primary key becomes (id, timestamp) and the
+    tests reference their result without a foreign key constraint. Only
+    the default partition is created here, the manage_partitions
+    command adds the monthly ones.
+    """
+    quote = schema_editor.quote_name
+    for name, (key, partitioned_unique, plain_unique) in \
+            RESULT_MODELS.items():
+        model = apps.get_model('core', name)
+        table = model._meta.db_table
+        old = table + '_old'
+        sequence = table + '_id_seq'
+        schema_editor.execute('ALTER TABLE %s RENAME TO %s' % (
+            quote(table), quote(old)))
+        # Neither the serial default nor an identity column are copied,
+        # their sequence goes with the old table
+        schema_editor.execute(
+            'CREATE TABLE %s (LIKE %s INCLUDING CONSTRAINTS)%s' % (
+                quote(table), quote(old),
+                ' PARTITION BY RANGE (%s)' % quote(key)
+                if partitioned else ''))
+        if partitioned:
+            schema_editor.execute(
+                'CREATE TABLE %s PARTITION OF %s DEFAULT' % (
+                    quote(table + '_default'), quote(table)))
+        schema_editor.execute('INSERT INTO %s SELECT * FROM %s' % (
+            quote(table), quote(old)))
+        schema_editor.execute('DROP TABLE %s CASCADE' % quote(old))
+        schema_editor.execute('CREATE SEQUENCE %s OWNED BY %s.id' % (
+            quote(sequence), quote(table)))
+        schema_editor.execute(
+            "SELECT setval(%s, COALESCE(MAX(id), 0) + 1, false) FROM %s" % (
+                "'%s'" % sequence, quote(table)))
+        schema_editor.execute(
+            "ALTER TABLE %s ALTER COLUMN id SET DEFAULT nextval('%s')" % (
+                quote(table), sequence))
+        schema_editor.execute('ALTER TABLE %s ADD PRIMARY KEY (%s)' % (
+            quote(table), 'id, %s' % quote(key) if partitioned else 'id'))
+        for constraint, columns in (
+                partitioned_unique if partitioned else plain_unique):
+            schema_editor.execute('ALTER TABLE %s ADD %sUNIQUE (%s)' % (
+                quote(table),
+                'CONSTRAINT %s ' % quote(constraint) if constraint else '',
+                ', '.join(quote(column) for column in columns)))
+        for field in model._meta.local_fields:
+            if field.remote_field and field.db_constraint:
+                schema_editor.execute(
+                    schema_editor._create_index_sql(model, fields=[field]))
+                schema_editor.execute(schema_editor._create_fk_sql(
+                    model, field, '_fk_%(to_table)s_%(to_column)s'))
+        for index in model._meta.indexes:
+            schema_editor.add_index(model, index)
+
+
+def partition(apps, schema_editor):
+    rebuild(apps, schema_editor, partitioned=True)
+
+
+def unpartition(apps, schema_editor):
+    rebuild(apps, schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0073_coverage_cells'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ntcspeedtest',
+            name='result',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='core.mobileresult'),
+        ),
+        migrations.AlterField(
+            model_name='publicspeedtest',
+            name='result',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='core.mobileresult'),
+        ),
+        migrations.AlterField(
+            model_name='rfctest',
+            name='result',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='core.rfcresult'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            # The unique constraints are rebuilt by partition()
+            state_operations=[
+                migrations.AlterField(
+                    model_name='rfcresult',
+                    name='test_id',
+                    field=models.UUIDField(blank=True, default=uuid.uuid4, editable=False),
+                ),
+                migrations.AddConstraint(
+                    model_name='rfcresult',
+                    constraint=models.UniqueConstraint(fields=('test_id', 'timestamp'), name='unique rfc result test id'),
+                ),
+            ],
+        ),
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:05
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+from django.db.models.functions import TruncHour
+
+
+def queue_hours(apps, schema_editor):
+    """
+    Queue every hour with mobile tests, their rssi sketches were built
+    with the negative values counted as zero
+    """
+    PendingRollup = apps.get_model('core', 'PendingRollup')
+    hours = apps.get_model('core', 'MobileResultFlat').objects.annotate(
+        hour=TruncHour('date_created')).values_list(
+            'hour', flat=True).distinct()
+    PendingRollup.objects.bulk_create(
+        [PendingRollup(kind='mobile', hour=hour) for hour in hours],
+        ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0074_partition_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultsketch',
+            name='negative_bin_offset',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resultsketch',
+            name='negative_bins',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveBigIntegerField(), default=list, size=None),
+        ),
+        migrations.RunPython(queue_hours, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 import uuid
 import os
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import Cast, Coalesce, Upper
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.utils import timezone
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, \
                                         PermissionsMixin
@@ -12,6 +15,7 @@ from django.conf import settings
 from durin.models import Client
 
 from . import choices
+from .geocoder import LRUCache
 
 
 def profile_image_file_path(instance, filename):
@@ -235,7 +239,11 @@ class Server(models.Model):
 
 
 class MobileResult(models.Model):
-    """Mobile Device Speed test result"""
+    """
+    Mobile Device Speed test result, partitioned by month of timestamp
+    with (id, timestamp) as primary key in the database, see
+    core.partitions
+    """
     android_version = models.CharField(max_length=100, blank=True)
     ssid = models.CharField(max_length=250, blank=True)
     bssid = models.CharField(max_length=250, blank=True)
@@ -276,6 +284,10 @@ class MobileResult(models.Model):
                 fields=['timestamp', 'server'],
                 name="unique mobile results")
             ]
+        indexes = [
+            GinIndex(OpClass(Upper('operator'), name='gin_trgm_ops'),
+                     name='mobileresult_operator_trgm'),
+        ]
 
     def __str__(self):
         return "%s<success=%s>" % (self.timestamp, self.success)
@@ -315,13 +327,13 @@ class IPaddress(models.Model):
 
 class RfcResult(models.Model):
     """
-        Model for an RFC-6349 test result
+        Model for an RFC-6349 test result, partitioned by month of
+        timestamp like MobileResult
     """
     test_id = models.UUIDField(
         default=uuid.uuid4,
         editable=False,
-        blank=True,
-        unique=True
+        blank=True
     )
     direction = models.CharField(
         null=False,
@@ -384,6 +396,14 @@ class RfcResult(models.Model):
     location = models.CharField(max_length=250, blank=True)
     timestamp = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        constraints = [
+            # Unique constraints of a partitioned table include its key
+            models.UniqueConstraint(
+                fields=['test_id', 'timestamp'],
+                name="unique rfc result test id")
+            ]
+
     def __str__(self):
         return f"{self.direction}"
 
@@ -476,7 +496,9 @@ class Speedtest(models.Model):
 
 class PublicSpeedTest(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
-    result = models.ForeignKey(MobileResult, on_delete=models.PROTECT)
+    # The partitioned result tables have no unique id to reference
+    result = models.ForeignKey(MobileResult, on_delete=models.PROTECT,
+                               db_constraint=False)
     test_id = models.UUIDField(
         default=uuid.uuid4,
         null=True,
@@ -486,7 +508,63 @@ class PublicSpeedTest(models.Model):
     )
 
 
+class LocationManager(models.Manager):
+    """
+    Resolve the canonical Location of a
+    (region, province, municipality, barangay) key
+    """
+    KEY_FIELDS = ('region', 'province', 'municipality', 'barangay')
+
+    cache = LRUCache(settings.LOCATION_CACHE_SIZE)
+
+    def _lookup(self, key):
+        # Matches the coalesced expressions of the unique constraint
+        # so that the lookup is served by its index
+        return self.annotate(**{
+            f'_{field}': Coalesce(field, models.Value(''))
+            for field in self.KEY_FIELDS
+        }).get(**{
+            f'_{field}': value or ''
+            for field, value in zip(self.KEY_FIELDS, key)
+        })
+
+    def get_canonical(self, lat=0, lon=0, region=None, province=None,
+                      municipality=None, barangay=None):
+        """
+        Get or create the Location for the given areas, the first
+        coordinate seen for a key is kept as its reference point
+        """
+        key = tuple(value or None for value in (
+            region, province, municipality, barangay))
+        location = self.cache.get(key)
+        if location is not None:
+            return location
+        try:
+            location = self._lookup(key)
+        except self.model.DoesNotExist:
+            try:
+                with transaction.atomic(using=self.db):
+                    location = self.create(
+                        lat=lat, lon=lon,
+                        **dict(zip(self.KEY_FIELDS, key)))
+            except IntegrityError:
+                location = self._lookup(key)
+        # Only once committed, a rolled back row would keep being handed
+        # out. Runs right away outside of a transaction.
+        transaction.on_commit(lambda: self.cache.put(key, location),
+                              using=self.db)
+        return location
+
+    def clear_cache(self):
+        self.cache.clear()
+
+
 class Location(models.Model):
+    """
+    Administrative area of a test. Rows are unique per
+    (region, province, municipality, barangay), lat/lon is
+    the reference point of the area.
+    """
     lat = models.FloatField(
         default=0,
         validators=[
@@ -502,13 +580,61 @@ class Location(models.Model):
     municipality = models.CharField(max_length=255, null=True, blank=True)
     barangay = models.CharField(max_length=255, null=True, blank=True)
 
+    objects = LocationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                Coalesce('region', models.Value('')),
+                Coalesce('province', models.Value('')),
+                Coalesce('municipality', models.Value('')),
+                Coalesce('barangay', models.Value('')),
+                name="unique location")
+            ]
+        # Trigram indexes serving the icontains location filters
+        indexes = [
+            GinIndex(OpClass(Upper('province'), name='gin_trgm_ops'),
+                     name='location_province_trgm'),
+            GinIndex(OpClass(Upper('municipality'), name='gin_trgm_ops'),
+                     name='location_municipality_trgm'),
+            GinIndex(OpClass(Upper('barangay'), name='gin_trgm_ops'),
+                     name='location_barangay_trgm'),
+        ]
+
+    def __str__(self):
+        return "%s, %s, %s" % (self.barangay, self.municipality, self.province)
+
+
+class GeocodeCache(models.Model):
+    """
+    Reverse geocoding results keyed on coordinates quantized to
+    a grid of `precision` decimal places
+    """
+    precision = models.PositiveSmallIntegerField()
+    lat_key = models.IntegerField()
+    lon_key = models.IntegerField()
+    region = models.CharField(max_length=255, null=True, blank=True)
+    province = models.CharField(max_length=255, null=True, blank=True)
+    municipality = models.CharField(max_length=255, null=True, blank=True)
+    barangay = models.CharField(max_length=255, null=True, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['precision', 'lat_key', 'lon_key'],
+                name="unique geocode cache key")
+            ]
+
     def __str__(self):
         return "%s, %s, %s" % (self.barangay, self.municipality, self.province)
 
 
 class NTCSpeedTest(models.Model):
 
-    result = models.ForeignKey(MobileResult, on_delete=models.PROTECT)
+    # The partitioned result tables have no unique id to reference
+    result = models.ForeignKey(MobileResult, on_delete=models.PROTECT,
+                               db_constraint=False)
     date_created = models.DateTimeField(auto_now_add=True)
     test_id = models.UUIDField(
         default=uuid.uuid4,
@@ -517,20 +643,41 @@ class NTCSpeedTest(models.Model):
         blank=True,
         unique=True
     )
-    location = models.ForeignKey(Location, on_delete=models.PROTECT)
+    location = models.ForeignKey(Location, null=True, blank=True,
+                                 on_delete=models.PROTECT)
+    enrichment = models.CharField(
+        max_length=10,
+        choices=choices.enrichment_choices,
+        default='done')
     tester = models.ForeignKey(Agent,
                                on_delete=models.PROTECT)
     test_device = models.ForeignKey(MobileDevice,
                                     on_delete=models.PROTECT)
     client_ip = models.GenericIPAddressField("IP address of Speedtest Client.")
 
+    class Meta:
+        indexes = [
+            # test_id prefix search, see core.filters.search_test_id
+            models.Index(OpClass(Cast('test_id', models.TextField()),
+                                 name='text_pattern_ops'),
+                         name='ntcspeedtest_test_id_prefix'),
+            # Newest first lists, whole region and per tester, with the
+            # id tie breaker of the datatable keyset pagination
+            models.Index(fields=['date_created', 'id'],
+                         name='ntcspeedtest_created'),
+            models.Index(fields=['tester', 'date_created', 'id'],
+                         name='ntcspeedtest_tester_created'),
+        ]
+
     def __str__(self):
-        return "%s<%s>" % (self.date_created, self.location.barangay)
+        return "%s<%s>" % (self.date_created,
+                           getattr(self.location, 'barangay', None))
 
 
 class RfcTest(models.Model):
 
-    result = models.ForeignKey(RfcResult, on_delete=models.PROTECT)
+    result = models.ForeignKey(RfcResult, on_delete=models.PROTECT,
+                               db_constraint=False)
     date_created = models.DateTimeField(auto_now_add=True)
     test_id = models.UUIDField(
         default=uuid.uuid4,
@@ -539,7 +686,12 @@ class RfcTest(models.Model):
         blank=True,
         unique=True
     )
-    location = models.ForeignKey(Location, on_delete=models.PROTECT)
+    location = models.ForeignKey(Location, null=True, blank=True,
+                                 on_delete=models.PROTECT)
+    enrichment = models.CharField(
+        max_length=10,
+        choices=choices.enrichment_choices,
+        default='done')
     tester = models.ForeignKey(Agent,
                                on_delete=models.PROTECT)
     test_device = models.ForeignKey(RfcDevice,
@@ -547,10 +699,312 @@ class RfcTest(models.Model):
     client_ip = models.GenericIPAddressField("IP address of RFC Client.")
 
     class Meta:
-        ordering = ["-result__timestamp"]
+        # Sorting on result__timestamp forced a join to core_rfcresult
+        ordering = ["-date_created"]
+        indexes = [
+            models.Index(OpClass(Cast('test_id', models.TextField()),
+                                 name='text_pattern_ops'),
+                         name='rfctest_test_id_prefix'),
+            models.Index(fields=['date_created', 'id'],
+                         name='rfctest_created'),
+            models.Index(fields=['tester', 'date_created', 'id'],
+                         name='rfctest_tester_created'),
+        ]
+
+    def __str__(self):
+        return "%s<%s>" % (self.date_created,
+                           getattr(self.location, 'barangay', None))
+
+
+class EnrichmentJob(models.Model):
+    """
+    Database backed queue of post-ingest work (geocoding and
+    location linking) for NTCSpeedTest and RfcTest rows
+    """
+    kind = models.CharField(max_length=10,
+                            choices=choices.enrichment_kind_choices)
+    object_id = models.BigIntegerField()
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    is_dead = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_dead', 'run_after'],
+                         name="enrichment_job_queue"),
+        ]
+
+    def __str__(self):
+        return "%s:%s<attempts=%s>" % (self.kind, self.object_id,
+                                       self.attempts)
+
+
+class FlatResult(models.Model):
+    """
+    Read-optimized copy of a test with its tester, office, region,
+    device and location columns inlined, kept in sync by core.flat.
+    Datatable and export queries read these tables without joins.
+    The tables are partitioned by month of date_created, see
+    core.partitions, with (id, date_created) as primary key in the
+    database.
+    """
+    id = models.BigIntegerField(primary_key=True,
+                                help_text="id of the test row")
+    date_created = models.DateTimeField()
+    test_id = models.UUIDField(null=True)
+    enrichment = models.CharField(max_length=10,
+                                  choices=choices.enrichment_choices)
+    client_ip = models.GenericIPAddressField(null=True)
+    tester_id = models.BigIntegerField()
+    tester_email = models.EmailField(max_length=255, null=True)
+    tester_first_name = models.CharField(max_length=20, null=True)
+    tester_last_name = models.CharField(max_length=20, null=True)
+    office_id = models.BigIntegerField(null=True)
+    office_name = models.CharField(max_length=250, null=True)
+    region_id = models.BigIntegerField(null=True)
+    region = models.CharField(max_length=20, null=True)
+    location_id = models.BigIntegerField(null=True)
+    location_region = models.CharField(max_length=255, null=True)
+    province = models.CharField(max_length=255, null=True)
+    municipality = models.CharField(max_length=255, null=True)
+    barangay = models.CharField(max_length=255, null=True)
+    test_device_id = models.BigIntegerField()
+    td_name = models.CharField(max_length=250, null=True)
+    td_serial_number = models.CharField(max_length=250, null=True)
+    result_id = models.BigIntegerField()
+    server_id = models.BigIntegerField(null=True)
+    lat = models.FloatField(null=True)
+    lon = models.FloatField(null=True)
+    timestamp = models.DateTimeField(null=True)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return "%s<%s>" % (self.date_created, self.barangay)
+
+
+class MobileResultFlat(FlatResult):
+    """NTCSpeedTest joined with its MobileResult and MobileDevice"""
+    td_imei = models.CharField(max_length=250, null=True)
+    td_phone_model = models.CharField(max_length=250, null=True)
+    td_android_version = models.CharField(max_length=100, null=True)
+    android_version = models.CharField(max_length=100, null=True)
+    ssid = models.CharField(max_length=250, null=True)
+    bssid = models.CharField(max_length=250, null=True)
+    rssi = models.FloatField(null=True)
+    network_type = models.CharField(max_length=20, null=True)
+    imei = models.CharField(max_length=250, null=True)
+    cell_id = models.CharField(max_length=250, null=True)
+    mcc = models.CharField(max_length=250, null=True)
+    mnc = models.CharField(max_length=250, null=True)
+    tac = models.CharField(max_length=250, null=True)
+    signal_quality = models.CharField(max_length=250, null=True)
+    operator = models.CharField(max_length=250, null=True)
+    upload = models.FloatField(null=True)
+    download = models.FloatField(null=True)
+    jitter = models.FloatField(null=True)
+    ping = models.FloatField(null=True)
+    success = models.BooleanField(null=True)
+
+    class Meta:
+        db_table = 'mobile_result_flat'
+        indexes = [
+            models.Index(fields=['region', 'date_created', 'id'],
+                         name='mobileflat_region_created'),
+            models.Index(fields=['tester_id', 'date_created', 'id'],
+                         name='mobileflat_tester_created'),
+            models.Index(fields=['date_created', 'id'],
+                         name='mobileflat_created'),
+            models.Index(OpClass(Cast('test_id', models.TextField()),
+                                 name='text_pattern_ops'),
+                         name='mobileflat_test_id_prefix'),
+            GinIndex(OpClass(Upper('province'), name='gin_trgm_ops'),
+                     name='mobileflat_province_trgm'),
+            GinIndex(OpClass(Upper('municipality'), name='gin_trgm_ops'),
+                     name='mobileflat_municipality_trgm'),
+            GinIndex(OpClass(Upper('barangay'), name='gin_trgm_ops'),
+                     name='mobileflat_barangay_trgm'),
+            GinIndex(OpClass(Upper('operator'), name='gin_trgm_ops'),
+                     name='mobileflat_operator_trgm'),
+        ]
+
+
+class RfcResultFlat(FlatResult):
+    """RfcTest joined with its RfcResult and RfcDevice"""
+    result_test_id = models.UUIDField(null=True)
+    result_location = models.CharField(max_length=250, null=True)
+    direction = models.CharField(max_length=10, null=True)
+    mtu = models.IntegerField(null=True)
+    baseline_rtt = models.FloatField(null=True)
+    rtt = models.FloatField(null=True)
+    ave_rtt = models.FloatField(null=True)
+    bb = models.FloatField(null=True)
+    bdp = models.FloatField(null=True)
+    rwnd = models.FloatField(null=True)
+    max_achievable_thpt = models.PositiveBigIntegerField(null=True)
+    actual_thpt = models.PositiveBigIntegerField(null=True)
+    ideal_transfer_time = models.FloatField(null=True)
+    acutal_transfer_time = models.FloatField(null=True)
+    transfer_time_ratio = models.FloatField(null=True)
+    tcp_efficiency = models.FloatField(null=True)
+    buffer_delay = models.FloatField(null=True)
+    tx_bytes = models.FloatField(null=True)
+    iperf_version = models.CharField(max_length=250, null=True)
+    sndbuf_actual = models.CharField(max_length=250, null=True)
+    rcvbuf_actual = models.CharField(max_length=250, null=True)
+    transfer_bytes = models.PositiveBigIntegerField(null=True)
+    retransmit_bytes = models.PositiveBigIntegerField(null=True)
+    sender_tcp_congestion = models.CharField(max_length=10, null=True)
+    receiver_tcp_congestion = models.CharField(max_length=10, null=True)
+    host_system_util = models.FloatField(null=True)
+    remote_system_util = models.FloatField(null=True)
+
+    class Meta:
+        db_table = 'rfc_result_flat'
+        indexes = [
+            models.Index(fields=['region', 'date_created', 'id'],
+                         name='rfcflat_region_created'),
+            models.Index(fields=['tester_id', 'date_created', 'id'],
+                         name='rfcflat_tester_created'),
+            models.Index(fields=['date_created', 'id'],
+                         name='rfcflat_created'),
+            models.Index(OpClass(Cast('test_id', models.TextField()),
+                                 name='text_pattern_ops'),
+                         name='rfcflat_test_id_prefix'),
+            GinIndex(OpClass(Upper('province'), name='gin_trgm_ops'),
+                     name='rfcflat_province_trgm'),
+            GinIndex(OpClass(Upper('municipality'), name='gin_trgm_ops'),
+                     name='rfcflat_municipality_trgm'),
+            GinIndex(OpClass(Upper('barangay'), name='gin_trgm_ops'),
+                     name='rfcflat_barangay_trgm'),
+        ]
+
+
+class ResultRollup(models.Model):
+    """
+    Test metrics aggregated per hour or day and per region, operator,
+    network type and province, maintained by core.rollups. `metrics`
+    maps each metric to its count, sum, min, max and quantile sketch.
+    """
+    kind = models.CharField(max_length=10,
+                            choices=choices.enrichment_kind_choices)
+    granularity = models.CharField(max_length=4,
+                                   choices=choices.rollup_granularity_choices)
+    bucket = models.DateTimeField(help_text="start of the hour or day")
+    region = models.CharField(max_length=20, blank=True, default='')
+    operator = models.CharField(max_length=250, blank=True, default='')
+    network_type = models.CharField(max_length=20, blank=True, default='')
+    province = models.CharField(max_length=255, blank=True, default='')
+    count = models.PositiveIntegerField(default=0)
+    metrics = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'granularity', 'bucket', 'region',
+                        'operator', 'network_type', 'province'],
+                name="unique result rollup key")
+        ]
+
+    def __str__(self):
+        return "%s:%s<%s %s>" % (self.kind, self.granularity, self.bucket,
+                                 self.region)
+
+
+class ResultSketch(models.Model):
+    """
+    DDSketch of one metric per day, region, operator and network type,
+    see core.sketches. `bins` holds the counts of the bins from
+    `bin_offset` on, so sketches are merged in SQL by summing the
+    counts per bin index, and `negative_bins` those of the negative
+    values from `negative_bin_offset` on.
+    """
+    kind = models.CharField(max_length=10,
+                            choices=choices.enrichment_kind_choices)
+    metric = models.CharField(max_length=50)
+    day = models.DateField()
+    region = models.CharField(max_length=20, blank=True, default='')
+    operator = models.CharField(max_length=250, blank=True, default='')
+    network_type = models.CharField(max_length=20, blank=True, default='')
+    count = models.PositiveBigIntegerField(default=0)
+    zero_count = models.PositiveBigIntegerField(default=0)
+    bin_offset = models.IntegerField(default=0)
+    bins = ArrayField(models.PositiveBigIntegerField(), default=list)
+    negative_bin_offset = models.IntegerField(default=0)
+    negative_bins = ArrayField(models.PositiveBigIntegerField(),
+                               default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'metric', 'day', 'region', 'operator',
+                        'network_type'],
+                name="unique result sketch key")
+        ]
+
+    def __str__(self):
+        return "%s:%s<%s %s>" % (self.kind, self.metric, self.day,
+                                 self.region)
+
+
+class CoverageCell(models.Model):
+    """
+    Mobile tests of a day aggregated per web-mercator tile at one of
+    the precomputed zoom levels and per operator and network type,
+    maintained by core.coverage for the coverage maps
+    """
+    day = models.DateField()
+    zoom = models.PositiveSmallIntegerField()
+    x = models.IntegerField()
+    y = models.IntegerField()
+    operator = models.CharField(max_length=250, blank=True, default='')
+    network_type = models.CharField(max_length=20, blank=True, default='')
+    count = models.PositiveIntegerField(default=0)
+    download_count = models.PositiveIntegerField(default=0)
+    download_sum = models.FloatField(null=True)
+    download_min = models.FloatField(null=True)
+    download_max = models.FloatField(null=True)
+    upload_count = models.PositiveIntegerField(default=0)
+    upload_sum = models.FloatField(null=True)
+    upload_min = models.FloatField(null=True)
+    upload_max = models.FloatField(null=True)
+    ping_count = models.PositiveIntegerField(default=0)
+    ping_sum = models.FloatField(null=True)
+    ping_min = models.FloatField(null=True)
+    ping_max = models.FloatField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['zoom', 'x', 'y', 'day', 'operator',
+                        'network_type'],
+                name="unique coverage cell key")
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='coveragecell_day'),
+        ]
+
+    def __str__(self):
+        return "%s/%s/%s<%s>" % (self.zoom, self.x, self.y, self.day)
+
+
+class PendingRollup(models.Model):
+    """Hour of tests whose rollups are out of date"""
+    kind = models.CharField(max_length=10,
+                            choices=choices.enrichment_kind_choices)
+    hour = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'hour'],
+                                    name="unique pending rollup")
+        ]
 
     def __str__(self):
-        return "%s<%s>" % (self.date_created, self.location.barangay)
+        return "%s<%s>" % (self.kind, self.hour)
 
 
 class RfcDeviceUser(models.Model):
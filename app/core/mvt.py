@@ -0,0 +1,91 @@
+"""
+Minimal Mapbox Vector Tile (v2.1) encoder for the coverage map cells
+
+Only what the coverage tiles need is implemented: one layer of square
+polygons with numeric properties, written straight to protobuf wire
+format so no protobuf or geometry library is required.
+"""
+import struct
+
+EXTENT = 4096
+
+POLYGON = 3
+
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+
+
+def varint(value):
+    data = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def field(number, wire_type):
+    return varint(number << 3 | wire_type)
+
+
+def message(number, payload):
+    """Length-delimited field"""
+    return field(number, 2) + varint(len(payload)) + payload
+
+
+def packed(number, values):
+    return message(number, b''.join(varint(value) for value in values))
+
+
+def command(command_id, count):
+    return command_id & 0x7 | count << 3
+
+
+def square(x0, y0, x1, y1):
+    """Geometry commands of a rectangle, clockwise in tile space"""
+    geometry = [command(MOVE_TO, 1), zigzag(x0), zigzag(y0),
+                command(LINE_TO, 3)]
+    cursor = (x0, y0)
+    for x, y in ((x1, y0), (x1, y1), (x0, y1)):
+        geometry += [zigzag(x - cursor[0]), zigzag(y - cursor[1])]
+        cursor = (x, y)
+    return geometry + [command(CLOSE_PATH, 1)]
+
+
+def value(number):
+    """Value message holding a double"""
+    return field(3, 1) + struct.pack('<d', number)
+
+
+def encode(layer, features, extent=EXTENT):
+    """
+    Tile with one `layer` of `features`, each a ((x0, y0, x1, y1),
+    properties) pair in tile coordinates from 0 to `extent`. None
+    properties are left out.
+    """
+    keys, values, body = {}, {}, b''
+    for feature_id, (box, properties) in enumerate(features, 1):
+        tags = []
+        for key, number in properties.items():
+            if number is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(float(number), len(values)))
+        feature = (field(1, 0) + varint(feature_id) +
+                   packed(2, tags) +
+                   field(3, 0) + varint(POLYGON) +
+                   packed(4, square(*box)))
+        body += message(2, feature)
+    layer = (field(15, 0) + varint(2) +
+             message(1, layer.encode()) +
+             body +
+             b''.join(message(3, key.encode()) for key in keys) +
+             b''.join(message(4, value(number)) for number in values) +
+             field(5, 0) + varint(extent))
+    return message(3, layer)
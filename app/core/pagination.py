@@ -0,0 +1,191 @@
+"""Keyset (seek) pagination for the result datatables and list endpoints"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as InvalidValue
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPaginator:
+    """
+    Page through a queryset on a unique key, (date_created, id) by
+    default, instead of an OFFSET.
+
+    The position is carried by an opaque cursor holding the key of the
+    last (or first, when going back) row of the current page, so every
+    page is a range scan starting at that key and costs the same as the
+    first one. Rows inserted meanwhile don't shift the following pages.
+    """
+    fields = ('date_created', 'id')
+
+    def __init__(self, descending=True, fields=None):
+        self.descending = descending
+        if fields is not None:
+            self.fields = tuple(fields)
+        self.next = None
+        self.previous = None
+
+    def encode(self, obj, backwards=False):
+        key = []
+        for field in self.fields:
+            if isinstance(obj, dict):
+                value = obj[field]
+            else:
+                value = getattr(obj, field)
+            key.append(value.isoformat() if hasattr(value, 'isoformat')
+                       else value)
+        position = {'k': key, 'b': backwards}
+        data = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode(self, cursor, model):
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            position = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            key = position['k']
+            backwards = bool(position['b'])
+            if len(key) != len(self.fields) or None in key:
+                raise ValueError(cursor)
+            key = [model._meta.get_field(field).to_python(value)
+                   for field, value in zip(self.fields, key)]
+        except (TypeError, KeyError, ValueError, binascii.Error,
+                InvalidValue):
+            raise ValidationError({'cursor': 'Invalid cursor.'})
+        return key, backwards
+
+    def seek(self, queryset, key, descending):
+        """Rows strictly after `key` in the given order"""
+        lookup, bound = ('__lt', '__lte') if descending else ('__gt', '__gte')
+        after = Q()
+        for i, field in enumerate(self.fields):
+            equal = dict(zip(self.fields[:i], key[:i]))
+            after |= Q(**equal, **{field + lookup: key[i]})
+        # The bare bound on the first field keeps it an index range scan
+        return queryset.filter(after, **{self.fields[0] + bound: key[0]})
+
+    def order(self, queryset, descending):
+        prefix = '-' if descending else ''
+        return queryset.order_by(*[prefix + f for f in self.fields])
+
+    def paginate(self, queryset, cursor, length):
+        """
+        Return the page of at most `length` rows at `cursor` (the first
+        page when it is empty) and set the next/previous cursors
+        """
+        backwards = False
+        descending = self.descending
+        if cursor:
+            key, backwards = self.decode(cursor, queryset.model)
+            if backwards:
+                descending = not descending
+            queryset = self.seek(queryset, key, descending)
+        queryset = self.order(queryset, descending)
+        page = list(queryset[:length + 1])
+        has_more = len(page) > length
+        page = page[:length]
+        if backwards:
+            page.reverse()
+
+        self.next = self.previous = None
+        if page:
+            if has_more or backwards:
+                self.next = self.encode(page[-1])
+            if cursor and (has_more or not backwards):
+                self.previous = self.encode(page[0], backwards=True)
+        return page
+
+
+class LimitCursorPagination(BasePagination):
+    """
+    Pages of ?limit= rows (settings.PAGE_SIZE by default, at most
+    settings.MAX_PAGE_SIZE) from the ?cursor= position, paged with
+    KeysetPaginator on `fields`. Whether more rows follow is known from
+    the extra row read, the rows are never counted.
+    """
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    fields = KeysetPaginator.fields
+    descending = True
+
+    def get_limit(self, request):
+        value = request.query_params.get(self.limit_query_param)
+        if value is None:
+            return settings.PAGE_SIZE
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError(
+                {self.limit_query_param: 'A positive integer is required.'})
+        return min(limit, settings.MAX_PAGE_SIZE)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.keyset = KeysetPaginator(self.descending, self.fields)
+        return self.keyset.paginate(
+            queryset, request.query_params.get(self.cursor_query_param),
+            self.get_limit(request))
+
+    def link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.link(self.keyset.next)),
+            ('previous', self.link(self.keyset.previous)),
+            ('has_more', self.keyset.next is not None),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        link = {'type': 'string', 'nullable': True, 'format': 'uri'}
+        return {
+            'type': 'object',
+            'properties': {
+                'next': link,
+                'previous': link,
+                'has_more': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.limit_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results per page, at most %d.' %
+                               settings.MAX_PAGE_SIZE,
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+        ]
+
+
+class NamePagination(LimitCursorPagination):
+    """Alphabetical pages"""
+    fields = ('name', 'id')
+    descending = False
+
+
+class IdPagination(LimitCursorPagination):
+    """Newest first on the primary key alone"""
+    fields = ('id',)
@@ -0,0 +1,259 @@
+"""
+Monthly range partitions of the result and flat result tables
+
+core_mobileresult and core_rfcresult are partitioned by range of
+timestamp, mobile_result_flat and rfc_result_flat by range of
+date_created. Each table has one partition per calendar month
+(Asia/Manila) named <table>_pYYYYMM, plus a <table>_default partition
+catching rows no monthly partition covers so ingest never fails. The
+datatable and export filters on date_created__range compare against
+constants, so Postgres prunes the flat partitions outside the range
+when planning.
+
+The manage_partitions command creates partitions ahead of time, moves
+rows that landed in the default partition into their month, and
+expires the result months past settings.PARTITION_RETENTION_MONTHS:
+the tests of their results are archived next to them and deleted with
+their flat rows, then the result partition is detached. Flat months
+past the retention are dropped once empty, the flat rows of tests
+still kept stay readable.
+"""
+import datetime
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import counts, enrichment, flat
+from core.models import (
+    EnrichmentJob,
+    MobileResult,
+    MobileResultFlat,
+    NTCSpeedTest,
+    PublicSpeedTest,
+    RfcResult,
+    RfcResultFlat,
+    RfcTest,
+)
+
+# Partitioned model -> partition key, results are expired first
+MODELS = {
+    MobileResult: 'timestamp',
+    RfcResult: 'timestamp',
+    MobileResultFlat: 'date_created',
+    RfcResultFlat: 'date_created',
+}
+
+KINDS = {model: kind for kind, model in enrichment.MODELS.items()}
+
+# Result model -> models of the tests referencing its rows
+TESTS = {
+    MobileResult: (NTCSpeedTest, PublicSpeedTest),
+    RfcResult: (RfcTest,),
+}
+
+MONTH = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def month_start(value):
+    if isinstance(value, datetime.datetime):
+        value = timezone.localtime(value)
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    year, month_index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return datetime.date(year, month_index + 1, 1)
+
+
+def bound(month):
+    """Aware datetime at the start of `month` in the project time zone"""
+    return timezone.make_aware(
+        datetime.datetime.combine(month, datetime.time()))
+
+
+def partition_name(model, month):
+    return '%s_p%s' % (model._meta.db_table, month.strftime('%Y%m'))
+
+
+def default_name(model):
+    return '%s_default' % model._meta.db_table
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def partitions(model):
+    """Month -> partition table name of the attached monthly partitions"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            WHERE parent.relname = %s
+        """, [model._meta.db_table])
+        names = [row[0] for row in cursor.fetchall()]
+    months = {}
+    for name in names:
+        match = MONTH.search(name)
+        if match:
+            months[datetime.date(int(match[1]), int(match[2]), 1)] = name
+    return months
+
+
+def default_months(model):
+    """
+    Months of the rows sitting in the default partition, only those
+    with rows since result timestamps come from the device clock
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT date_trunc('month', {key} AT TIME ZONE %s) "
+            "FROM {table}".format(key=quote(MODELS[model]),
+                                  table=quote(default_name(model))),
+            [settings.TIME_ZONE])
+        return sorted(month_start(row[0].date())
+                      for row in cursor.fetchall())
+
+
+def is_empty(name):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT NOT EXISTS (SELECT 1 FROM {name})'.format(
+            name=quote(name)))
+        return cursor.fetchone()[0]
+
+
+@transaction.atomic
+def create(model, month):
+    """
+    Attach the partition of `month`, moving its rows out of the default
+    partition first since Postgres refuses to attach over them
+    """
+    table, name = model._meta.db_table, partition_name(model, month)
+    start, end = bound(month), bound(add_months(month, 1))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS '
+            'INCLUDING CONSTRAINTS)'.format(
+                name=quote(name), table=quote(table)))
+        cursor.execute(
+            'WITH moved AS (DELETE FROM {default} '
+            'WHERE {key} >= %s AND {key} < %s RETURNING *) '
+            'INSERT INTO {name} SELECT * FROM moved'.format(
+                default=quote(default_name(model)), key=quote(MODELS[model]),
+                name=quote(name)), [start, end])
+        # Builds the parent's indexes on the new partition
+        cursor.execute(
+            'ALTER TABLE {table} ATTACH PARTITION {name} '
+            'FOR VALUES FROM (%s) TO (%s)'.format(
+                table=quote(table), name=quote(name)), [start, end])
+    return name
+
+
+@transaction.atomic
+def detach(model, month, archive_schema=None, drop=False):
+    """
+    Detach the partition of `month`, then drop it or move it to
+    `archive_schema`. Without either it is left in place as a plain
+    table.
+    """
+    table, name = model._meta.db_table, partition_name(model, month)
+    with connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE {table} DETACH PARTITION {name}'.format(
+            table=quote(table), name=quote(name)))
+        if drop:
+            cursor.execute('DROP TABLE {name}'.format(name=quote(name)))
+        elif archive_schema:
+            cursor.execute('CREATE SCHEMA IF NOT EXISTS {schema}'.format(
+                schema=quote(archive_schema)))
+            cursor.execute('ALTER TABLE {name} SET SCHEMA {schema}'.format(
+                name=quote(name), schema=quote(archive_schema)))
+    counts.invalidate(model)
+    return name
+
+
+def cutoff(retention=None, today=None):
+    """First month kept with a retention of `retention` months"""
+    retention = retention or settings.PARTITION_RETENTION_MONTHS
+    if not retention:
+        return None
+    return add_months(month_start(today or timezone.localdate()),
+                      1 - retention)
+
+
+@transaction.atomic
+def expire(model, month, archive_schema=None, drop=False):
+    """
+    Remove the tests of the `month` partition of the result `model`,
+    then detach it like detach(). Unless dropped the tests are kept in
+    a <test table>_pYYYYMM table next to the partition. Their flat rows
+    and enrichment jobs are deleted, the rollups keep their history.
+    """
+    results = 'SELECT id FROM {name}'.format(
+        name=quote(partition_name(model, month)))
+    with connection.cursor() as cursor:
+        if archive_schema and not drop:
+            cursor.execute('CREATE SCHEMA IF NOT EXISTS {schema}'.format(
+                schema=quote(archive_schema)))
+        for test_model in TESTS[model]:
+            table = quote(test_model._meta.db_table)
+            tests = ('SELECT id FROM {table} WHERE result_id IN ({results})'
+                     .format(table=table, results=results))
+            if not drop:
+                archive = quote(partition_name(test_model, month))
+                if archive_schema:
+                    archive = quote(archive_schema) + '.' + archive
+                cursor.execute(
+                    'CREATE TABLE {archive} AS SELECT * FROM {table} '
+                    'WHERE result_id IN ({results})'.format(
+                        archive=archive, table=table, results=results))
+            if test_model in flat.FLAT_MODELS:
+                flat_model = flat.flat_model(test_model)
+                cursor.execute(
+                    'DELETE FROM {flat} WHERE result_id IN ({results})'
+                    .format(flat=quote(flat_model._meta.db_table),
+                            results=results))
+                counts.invalidate(flat_model)
+                cursor.execute(
+                    'DELETE FROM {jobs} WHERE kind = %s AND object_id IN '
+                    '({tests})'.format(
+                        jobs=quote(EnrichmentJob._meta.db_table),
+                        tests=tests),
+                    [KINDS[test_model]])
+            cursor.execute(
+                'DELETE FROM {table} WHERE result_id IN ({results})'.format(
+                    table=table, results=results))
+    return detach(model, month, archive_schema, drop)
+
+
+def maintain(model, ahead=None, retention=None, archive_schema=None,
+             drop=False, today=None):
+    """
+    Create the partitions of the months with rows in the default
+    partition and up to `ahead` months from now, then expire the result
+    partitions older than `retention` months, or drop the flat ones
+    left empty. Returns the created and detached table names.
+    """
+    if ahead is None:
+        ahead = settings.PARTITION_MONTHS_AHEAD
+    current = month_start(today or timezone.localdate())
+    first = cutoff(retention, today)
+    existing = partitions(model)
+
+    months = set(default_months(model))
+    months.update(add_months(current, i) for i in range(ahead + 1))
+    created = [
+        create(model, month) for month in sorted(months)
+        if month not in existing and (first is None or month >= first)
+    ]
+    detached = []
+    for month in sorted(existing):
+        if first is None or month >= first:
+            continue
+        if model in TESTS:
+            detached.append(expire(model, month, archive_schema, drop))
+        elif is_empty(existing[month]):
+            detached.append(detach(model, month, drop=True))
+    return created, detached
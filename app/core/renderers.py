@@ -0,0 +1,121 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                  if orjson else 0)
+
+# Escaped by JSONRenderer, they end strings in JavaScript
+SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def encode(obj):
+    """JSON value of what orjson doesn't encode like JSONRenderer"""
+    return JSONEncoder().default(obj)
+
+
+def dumps(data):
+    """
+    `data` as the compact UTF-8 JSON of JSONRenderer, encoded with
+    orjson when it is installed (floats with an exponent are spelled
+    differently, e.g. 1e16 for 1e+16)
+    """
+    if orjson is not None:
+        try:
+            ret = orjson.dumps(data, default=encode, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Integers over 64 bits, ...
+            pass
+        else:
+            for separator, escaped in SEPARATORS:
+                if separator in ret:
+                    ret = ret.replace(separator, escaped)
+            return ret
+    return JSONRenderer().render(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed. Indented
+    (`; indent=`), non-compact and ASCII output is left to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or \
+                not self.compact or self.get_indent(
+                    accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        return dumps(data)
+
+
+class ColumnarRenderer(BaseRenderer):
+    """
+    Lets export views negotiate a columnar format. The export itself is
+    streamed by the view, only error details are rendered here.
+    """
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+class ParquetRenderer(ColumnarRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+
+class ArrowRenderer(ColumnarRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+
+class VectorTileRenderer(BaseRenderer):
+    """
+    Coverage tile data as a Mapbox Vector Tile with one square polygon
+    per cell in the "coverage" layer
+    """
+    media_type = 'application/vnd.mapbox-vector-tile'
+    format = 'mvt'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, dict) or 'cells' not in data:
+            return JSONRenderer().render(data)
+        from core import mvt
+
+        scale = 2.0 ** (data['zoom'] - data['cell_zoom'])
+        features = []
+        for cell in data['cells']:
+            box = [
+                round((cell['x'] * scale - data['x']) * mvt.EXTENT),
+                round((cell['y'] * scale - data['y']) * mvt.EXTENT),
+                round(((cell['x'] + 1) * scale - data['x']) * mvt.EXTENT),
+                round(((cell['y'] + 1) * scale - data['y']) * mvt.EXTENT),
+            ]
+            properties = {'count': cell['count']}
+            for name, stats in cell.items():
+                if isinstance(stats, dict):
+                    properties.update({
+                        '%s_%s' % (name, stat): number
+                        for stat, number in stats.items()})
+            features.append((box, properties))
+        return mvt.encode('coverage', features)
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Metrics in the Prometheus text exposition format"""
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, str):
+            return JSONRenderer().render(data)
+        return data.encode(self.charset)
@@ -0,0 +1,374 @@
+"""
+Hourly and daily rollups of the test metrics
+
+ResultRollup rows hold the count, sum, min, max and a DDSketch of each
+metric per hour (or day) and per region, operator, network type and
+province. Rollups are rebuilt per hour from the flat tables, so they
+stay correct when enrichment later fills in the province of a test,
+and the daily rows are merged from the 24 hourly ones.
+
+Syncing flat rows marks their hours as pending (core.flat.sync). The
+refresh_rollups command rebuilds the pending hours, or it is done
+right away on ingest when settings.ROLLUP_SYNC is set. Rebuilds of the
+same day are serialized with an advisory lock. The stats API
+only reads rollup rows, so it costs the same whatever the number of
+tests.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core import coverage
+from core.models import (
+    MobileResultFlat,
+    PendingRollup,
+    ResultRollup,
+    ResultSketch,
+    RfcResultFlat,
+)
+from core.sketches import DDSketch
+
+HOUR, DAY = 'hour', 'day'
+
+KEYS = ('region', 'operator', 'network_type', 'province')
+
+# Keys of the percentile sketches, merged over provinces
+SKETCH_KEYS = ('region', 'operator', 'network_type')
+
+# kind -> (flat model, metrics, filter of the tests rolled up)
+KINDS = {
+    'mobile': (MobileResultFlat,
+               ('download', 'upload', 'ping', 'jitter', 'rssi'),
+               {'success': True}),
+    'rfc': (RfcResultFlat,
+            ('actual_thpt', 'ave_rtt', 'tcp_efficiency', 'buffer_delay',
+             'transfer_time_ratio'),
+            {}),
+}
+
+QUANTILES = {'median': 0.5, 'p90': 0.9}
+
+# First key of the advisory locks of the rollup days
+LOCK_NAMESPACE = 0x526f6c6c
+
+# First key of the advisory locks ingest holds on the hours it marked
+MARK_NAMESPACE = 0x4d61726b
+
+
+class Aggregate:
+    """Count, sum, min, max and quantile sketch of one metric"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = DDSketch()
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        if other.count:
+            self.min = other.min if self.min is None else min(
+                self.min, other.min)
+            self.max = other.max if self.max is None else max(
+                self.max, other.max)
+        self.count += other.count
+        self.sum += other.sum
+        self.sketch.merge(other.sketch)
+        return self
+
+    def summary(self):
+        summary = {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+        }
+        for name, q in QUANTILES.items():
+            summary[name] = self.sketch.quantile(q)
+        return summary
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'min': self.min,
+                'max': self.max, 'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        aggregate.count = data['count']
+        aggregate.sum = data['sum']
+        aggregate.min = data['min']
+        aggregate.max = data['max']
+        aggregate.sketch = DDSketch.from_dict(data['sketch'])
+        return aggregate
+
+
+def kind_of(flat_model):
+    for kind, (model, *_) in KINDS.items():
+        if model is flat_model:
+            return kind
+
+
+def hour_of(value):
+    return timezone.localtime(value).replace(
+        minute=0, second=0, microsecond=0)
+
+
+def day_of(value):
+    return hour_of(value).replace(hour=0)
+
+
+def key_columns(flat_model):
+    """Rollup keys that are columns of `flat_model`"""
+    names = {field.name for field in flat_model._meta.concrete_fields}
+    return [key for key in KEYS if key in names]
+
+
+def replace(kind, granularity, bucket, groups):
+    """Swap the rollups of `bucket` for the {key: (count, metrics)}"""
+    ResultRollup.objects.filter(
+        kind=kind, granularity=granularity, bucket=bucket).delete()
+    ResultRollup.objects.bulk_create([
+        ResultRollup(
+            kind=kind, granularity=granularity, bucket=bucket,
+            count=count,
+            metrics={name: aggregate.to_dict()
+                     for name, aggregate in metrics.items()},
+            **dict(zip(KEYS, key)))
+        for key, (count, metrics) in groups.items()
+    ])
+    return len(groups)
+
+
+def rebuild_hour(kind, hour):
+    flat_model, metrics, valid = KINDS[kind]
+    columns = key_columns(flat_model)
+    rows = flat_model.objects.filter(
+        date_created__gte=hour,
+        date_created__lt=hour + datetime.timedelta(hours=1),
+        **valid,
+    ).values_list(*columns, *metrics)
+    groups = {}
+    for row in rows:
+        keys = dict(zip(columns, row))
+        group = groups.setdefault(
+            tuple(keys.get(name) or '' for name in KEYS),
+            [0, {name: Aggregate() for name in metrics}])
+        group[0] += 1
+        for name, value in zip(metrics, row[len(columns):]):
+            if value is not None:
+                group[1][name].add(value)
+    return replace(kind, HOUR, hour, groups)
+
+
+def rebuild_day(kind, day):
+    rollups = ResultRollup.objects.filter(
+        kind=kind, granularity=HOUR, bucket__gte=day,
+        bucket__lt=day + datetime.timedelta(days=1),
+    ).values_list(*KEYS, 'count', 'metrics')
+    groups = {}
+    for *key, count, metrics in rollups:
+        group = groups.setdefault(tuple(key), [0, {}])
+        group[0] += count
+        for name, data in metrics.items():
+            group[1].setdefault(name, Aggregate()).merge(
+                Aggregate.from_dict(data))
+    replace_sketches(kind, day, groups)
+    return replace(kind, DAY, day, groups)
+
+
+def replace_sketches(kind, day, groups):
+    """Swap the sketches of `day` for the merge of the day's rollups"""
+    sketches = {}
+    for key, (count, metrics) in groups.items():
+        for name, aggregate in metrics.items():
+            sketch_key = (name,) + key[:len(SKETCH_KEYS)]
+            sketches.setdefault(sketch_key, DDSketch()).merge(
+                aggregate.sketch)
+    day = timezone.localtime(day).date()
+    ResultSketch.objects.filter(kind=kind, day=day).delete()
+    rows = []
+    for (name, *key), sketch in sketches.items():
+        offset, bins = sketch.to_array()
+        negative_offset, negative_bins = sketch.negative_array()
+        rows.append(ResultSketch(
+            kind=kind, metric=name, day=day, count=sketch.count,
+            zero_count=sketch.zero_count, bin_offset=offset, bins=bins,
+            negative_bin_offset=negative_offset, negative_bins=negative_bins,
+            **dict(zip(SKETCH_KEYS, key))))
+    ResultSketch.objects.bulk_create(rows)
+
+
+def lock(kind, day):
+    """Wait for the other rebuilds of `day`, until the transaction ends"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [
+            LOCK_NAMESPACE + list(KINDS).index(kind),
+            timezone.localtime(day).date().toordinal()])
+
+
+def rebuild(kind, hours):
+    """
+    Rebuild the rollups of `hours` and the rollups and coverage cells
+    of the days they are in
+    """
+    days = {}
+    for hour in sorted(set(hours)):
+        days.setdefault(day_of(hour), []).append(hour)
+    with transaction.atomic():
+        # Days in order, so rebuilds waiting on each other can't deadlock
+        for day, day_hours in sorted(days.items()):
+            lock(kind, day)
+            for hour in day_hours:
+                rebuild_hour(kind, hour)
+            rebuild_day(kind, day)
+            coverage.rebuild(kind, day)
+
+
+def mark(flat_model, dates):
+    """Flag the hours of `dates` as pending for the tests of `flat_model`"""
+    kind = kind_of(flat_model)
+    hours = sorted({hour_of(value) for value in dates})
+    if settings.ROLLUP_SYNC:
+        rebuild(kind, hours)
+        return
+    # Held until the tests commit, so refresh() doesn't claim the hours
+    # before they are visible. Shared, ingests don't wait on each other.
+    with connection.cursor() as cursor:
+        for hour in hours:
+            cursor.execute('SELECT pg_advisory_xact_lock_shared(%s, %s)', [
+                MARK_NAMESPACE + list(KINDS).index(kind),
+                int(hour.timestamp()) // 3600])
+    PendingRollup.objects.bulk_create(
+        [PendingRollup(kind=kind, hour=hour) for hour in hours],
+        ignore_conflicts=True)
+
+
+def refresh(limit=100):
+    """
+    Rebuild up to `limit` pending hours, returns how many were done.
+    The hours are claimed by deleting them first, in a transaction of
+    their own so ingest doesn't wait for the rebuild. Hours marked by
+    an ingest that hasn't committed yet (see mark()) are left for the
+    next refresh, and an ingest marking a claimed hour queues it again.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'WITH claimed AS (SELECT id, kind, hour FROM {table} '
+            'ORDER BY hour LIMIT %s FOR UPDATE SKIP LOCKED) '
+            'DELETE FROM {table} p USING claimed c WHERE p.id = c.id '
+            'AND pg_try_advisory_xact_lock('
+            '%s + array_position(%s, c.kind::text) - 1, '
+            '(extract(epoch FROM c.hour) / 3600)::integer) '
+            'RETURNING p.kind, p.hour'.format(
+                table=PendingRollup._meta.db_table),
+            [limit, MARK_NAMESPACE, list(KINDS)])
+        pending = cursor.fetchall()
+    try:
+        for kind in KINDS:
+            hours = [hour for item_kind, hour in pending if item_kind == kind]
+            if hours:
+                rebuild(kind, hours)
+    except Exception:
+        PendingRollup.objects.bulk_create(
+            [PendingRollup(kind=kind, hour=hour) for kind, hour in pending],
+            ignore_conflicts=True)
+        raise
+    return len(pending)
+
+
+def query(kind, granularity, start, end, group_by=('region',), filters=None,
+          metrics=None):
+    """
+    Merge the rollups with bucket in [start, end) per `group_by` (keys
+    and/or 'bucket'), returning a row with the count and summary of
+    each metric per group
+    """
+    metrics = metrics or KINDS[kind][1]
+    rollups = ResultRollup.objects.filter(
+        kind=kind, granularity=granularity, bucket__gte=start,
+        bucket__lt=end, **(filters or {}),
+    ).values_list('bucket', *KEYS, 'count', 'metrics')
+    groups = {}
+    for bucket, *keys, count, data in rollups:
+        values = dict(zip(KEYS, keys), bucket=bucket)
+        key = tuple(values[name] for name in group_by)
+        group = groups.setdefault(
+            key, [0, {name: Aggregate() for name in metrics}])
+        group[0] += count
+        for name in metrics:
+            if name in data:
+                group[1][name].merge(Aggregate.from_dict(data[name]))
+    return [
+        dict(zip(group_by, key), count=count, metrics={
+            name: aggregate.summary() for name, aggregate in aggs.items()})
+        for key, (count, aggs) in sorted(groups.items())
+    ]
+
+
+def label(q):
+    """Name of quantile `q` in responses, p50 for 0.5"""
+    return 'p%g' % round(q * 100, 6)
+
+
+def percentiles(kind, metric, min_date, max_date, quantiles,
+                group_by=(), filters=None):
+    """
+    Approximate `quantiles` of `metric` over the days from `min_date`
+    to `max_date` per `group_by` (sketch keys and/or 'day'). `filters`
+    maps sketch keys to the list of values to keep. The bins of both
+    stores are summed by Postgres, so only one row per group, store and
+    bin comes back.
+    """
+    sketches = ResultSketch.objects.filter(
+        kind=kind, metric=metric, day__gte=min_date, day__lte=max_date,
+        **{key + '__in': values for key, values in (filters or {}).items()})
+    sums = {'total': Sum('count'), 'zero': Sum('zero_count')}
+    if group_by:
+        totals = sketches.values(*group_by).annotate(**sums).order_by(
+            *group_by)
+    else:
+        totals = [sketches.aggregate(**sums)]
+
+    ids, params = sketches.values('id').query.sql_with_params()
+    columns = ''.join('s.%s, ' % connection.ops.quote_name(name)
+                      for name in group_by)
+    positions = ', '.join(str(i + 1) for i in range(len(group_by) + 1))
+    stores = {'bins': 'bin_offset', 'negative_bins': 'negative_bin_offset'}
+    bins = {store: {} for store in stores}
+    with connection.cursor() as cursor:
+        for store, offset in stores.items():
+            cursor.execute((
+                'SELECT {columns}s.{offset} + u.ord - 1, SUM(u.c) '
+                'FROM {table} s CROSS JOIN LATERAL '
+                'unnest(s.{store}) WITH ORDINALITY AS u(c, ord) '
+                'WHERE s.id IN ({ids}) AND u.c > 0 GROUP BY {positions}'
+            ).format(columns=columns, offset=offset, store=store,
+                     table=ResultSketch._meta.db_table, ids=ids,
+                     positions=positions), params)
+            for *key, index, count in cursor.fetchall():
+                bins[store].setdefault(tuple(key), []).append(
+                    (index, count))
+
+    results = []
+    for row in totals:
+        if not row['total']:
+            continue
+        key = tuple(row[name] for name in group_by)
+        sketch = DDSketch.from_bins(
+            bins['bins'].get(key, []), row['zero'],
+            negative_bins=bins['negative_bins'].get(key, []))
+        results.append(dict(
+            {name: row[name] for name in group_by},
+            count=row['total'],
+            percentiles={label(q): sketch.quantile(q) for q in quantiles}))
+    return results
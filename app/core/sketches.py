@@ -0,0 +1,168 @@
+"""
+Mergeable quantile sketches for the result rollups
+
+DDSketch (Masson et al., VLDB 2019) keeps counts in logarithmic bins:
+a positive value x falls in bin ceil(log(x) / log(gamma)) with
+gamma = (1 + alpha) / (1 - alpha), so any quantile is answered within
+a relative error of alpha. Negative values (rssi in dBm) are kept in a
+mirrored store of the bins of -x. Sketches of disjoint sets merge by adding
+bin counts, which is what lets daily rollups be built from hourly ones
+and several days or groups be combined when querying.
+"""
+import math
+
+RELATIVE_ACCURACY = 0.01
+
+# Past this many bins per store the bins of the lowest values are
+# collapsed together, which only costs accuracy on the lowest quantiles
+MAX_BINS = 2048
+
+# Values closer to zero than this share one bin
+MIN_VALUE = 1e-9
+
+
+class DDSketch:
+
+    def __init__(self, alpha=RELATIVE_ACCURACY, max_bins=MAX_BINS):
+        self.alpha = alpha
+        self.max_bins = max_bins
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.negative_bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def index(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def value(self, index):
+        """Estimate of the values in bin `index`"""
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value, count=1):
+        if value >= MIN_VALUE:
+            index = self.index(value)
+            self.bins[index] = self.bins.get(index, 0) + count
+        elif value <= -MIN_VALUE:
+            index = self.index(-value)
+            self.negative_bins[index] = self.negative_bins.get(
+                index, 0) + count
+        else:
+            self.zero_count += count
+        self.count += count
+        self.collapse()
+
+    def collapse(self):
+        """
+        Fold the bins of the lowest values into one to stay within
+        max_bins, the lowest indexes of the positive store and the
+        highest of the negative one
+        """
+        if len(self.bins) <= self.max_bins and \
+                len(self.negative_bins) <= self.max_bins:
+            return
+        for bins, reverse in ((self.bins, False),
+                              (self.negative_bins, True)):
+            excess = len(bins) - self.max_bins
+            if excess <= 0:
+                continue
+            lowest = sorted(bins, reverse=reverse)
+            target = lowest[excess]
+            for index in lowest[:excess]:
+                bins[target] += bins.pop(index)
+
+    def merge(self, other):
+        if other.alpha != self.alpha:
+            raise ValueError("Cannot merge sketches of different accuracy.")
+        for bins, other_bins in ((self.bins, other.bins),
+                                 (self.negative_bins, other.negative_bins)):
+            for index, count in other_bins.items():
+                bins[index] = bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.collapse()
+        return self
+
+    def quantile(self, q):
+        """Value at quantile `q` (0 to 1), None when empty"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # From the most negative values up
+        for index in sorted(self.negative_bins, reverse=True):
+            seen += self.negative_bins[index]
+            if rank < seen:
+                return -self.value(index)
+        seen += self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return self.value(index)
+        if self.bins:
+            return self.value(max(self.bins))
+        if self.zero_count:
+            return 0.0
+        return -self.value(min(self.negative_bins))
+
+    @staticmethod
+    def dense(bins):
+        """(offset, counts) of `bins` as a dense array from `offset`"""
+        if not bins:
+            return 0, []
+        offset = min(bins)
+        counts = [0] * (max(bins) - offset + 1)
+        for index, count in bins.items():
+            counts[index - offset] = count
+        return offset, counts
+
+    def to_array(self):
+        """(offset, counts) of the positive bins, see dense()"""
+        return self.dense(self.bins)
+
+    def negative_array(self):
+        """(offset, counts) of the negative bins, see dense()"""
+        return self.dense(self.negative_bins)
+
+    @classmethod
+    def from_bins(cls, bins, zero_count=0, alpha=RELATIVE_ACCURACY,
+                  negative_bins=()):
+        """Sketch of (index, count) pairs, as summed by the database"""
+        sketch = cls(alpha)
+        sketch.bins = {int(index): int(count)
+                       for index, count in bins if count}
+        sketch.negative_bins = {int(index): int(count)
+                                for index, count in negative_bins if count}
+        sketch.zero_count = int(zero_count)
+        sketch.count = sketch.zero_count + sum(sketch.bins.values()) + sum(
+            sketch.negative_bins.values())
+        sketch.collapse()
+        return sketch
+
+    def to_dict(self):
+        offset, counts = self.to_array()
+        negative_offset, negative_counts = self.negative_array()
+        return {
+            'alpha': self.alpha,
+            'zero': self.zero_count,
+            'offset': offset,
+            'counts': counts,
+            'negative_offset': negative_offset,
+            'negative_counts': negative_counts,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if 'bins' in data:
+            # Sparse form written before the dense one
+            bins = data['bins'].items()
+        else:
+            bins = enumerate(data['counts'], data['offset'])
+        # Sketches written before the negative store have none
+        negative_bins = enumerate(data.get('negative_counts', []),
+                                  data.get('negative_offset', 0))
+        return cls.from_bins(bins, data['zero'], data['alpha'],
+                             negative_bins)
@@ -0,0 +1,93 @@
+import pytest
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from core import benchmark
+from core.models import (
+    Location,
+    MobileResult,
+    MobileResultFlat,
+    NTCSpeedTest,
+    PublicSpeedTest,
+)
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def dataset():
+    benchmark.seed(results=12, agents_count=2, locations_count=3,
+                   servers_count=2, days=2, batch_size=5)
+
+
+def test_seed_writes_dataset(dataset):
+    """Test that seeding writes backdated tests and their flat rows"""
+    assert NTCSpeedTest.objects.count() == 12
+    assert MobileResultFlat.objects.count() == 12
+    assert Location.objects.count() <= 3
+    test = NTCSpeedTest.objects.select_related('result').earliest('pk')
+    assert test.date_created == test.result.timestamp
+    assert test.date_created < timezone.now()
+
+
+def test_seed_appends_older_tests(dataset):
+    """Test that seeding again doesn't collide with the seeded tests"""
+    oldest = MobileResult.objects.earliest('timestamp').timestamp
+    benchmark.seed(results=4, agents_count=2, locations_count=3,
+                   servers_count=2, days=2)
+
+    assert NTCSpeedTest.objects.count() == 16
+    assert MobileResult.objects.filter(timestamp__lt=oldest).count() == 4
+
+
+def test_run_reports_scenarios(dataset):
+    """Test that each scenario is driven and measured"""
+    report = benchmark.run(scenarios=['ingest', 'ingest-tester',
+                                      'datatable', 'ft-list'],
+                           requests=3, concurrency=1, warmup=0)
+
+    assert PublicSpeedTest.objects.count() == 3
+    assert set(report['scenarios']) == {'ingest', 'ingest-tester',
+                                        'datatable', 'ft-list'}
+    for stats in report['scenarios'].values():
+        assert stats['requests'] == 3
+        assert stats['errors'] == 0
+        assert stats['latency_ms']['p50'] <= stats['latency_ms']['p99']
+        assert stats['queries']['max'] > 0
+
+
+def test_compare_flags_regressions():
+    """Test that slower runs and extra queries are regressions"""
+    def report(p99, queries):
+        return {'scenarios': {'csv': {
+            'errors': 0,
+            'throughput': 10.0,
+            'latency_ms': {'p50': 10.0, 'p99': p99},
+            'queries': {'mean': queries},
+        }}}
+
+    baseline = report(20.0, 2)
+    assert benchmark.compare(report(22.0, 2), baseline) == []
+    regressions = benchmark.compare(report(30.0, 3), baseline)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('csv: p99 latency')
+
+
+def test_command_fails_on_server_errors(monkeypatch):
+    """Test that a scenario answered with 5xx fails the run"""
+    samples = [(0.01, 201, 3), (0.01, 400, 1), (0.02, 500, 1)]
+    stats = benchmark.summary(samples, 1.0)
+    assert (stats['errors'], stats['server_errors']) == (2, 1)
+    monkeypatch.setattr(benchmark, 'run', lambda **kwargs: {
+        'scenarios': {'ingest-tester': stats}})
+
+    with pytest.raises(Exception, match='Server errors in ingest-tester'):
+        call_command('run_benchmark', requests=1)
+
+
+def test_command_requires_dataset():
+    """Test that the benchmark refuses to run without a dataset"""
+    with pytest.raises(Exception, match='seed it first'):
+        call_command('run_benchmark', requests=1)
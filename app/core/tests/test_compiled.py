@@ -0,0 +1,102 @@
+import pytest
+
+from django.contrib.auth.models import Group, Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from core import compiled
+from core.models import NTCSpeedTest, RfcTest
+from core.tests.test_eager import seed  # noqa: F401
+from mobile.serializers import (
+    MobileResultsListSerializer,
+    NtcMobileResultsSerializer,
+)
+from rfc6349.serializers import RfcTestSerializer
+
+
+pytestmark = pytest.mark.django_db
+
+SERIALIZERS = [NtcMobileResultsSerializer, MobileResultsListSerializer,
+               RfcTestSerializer]
+
+
+class LabelSerializer(serializers.ModelSerializer):
+    label = serializers.SerializerMethodField()
+
+    class Meta:
+        model = NTCSpeedTest
+        fields = ('id', 'label')
+
+    def get_label(self, obj):
+        return str(obj)
+
+
+@pytest.fixture
+def tests(seed, agent, user):  # noqa: F811
+    seed(4)
+    user.profile_picture = 'uploads/user/face.jpg'
+    user.save()
+    user.groups.add(*Group.objects.bulk_create(
+        [Group(name='b'), Group(name='a')]))
+    user.user_permissions.add(*Permission.objects.order_by('-pk')[:3])
+    NTCSpeedTest.objects.filter(pk=NTCSpeedTest.objects.earliest(
+        'pk').pk).update(location=None)
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+@pytest.mark.parametrize("serializer_class", SERIALIZERS)
+@pytest.mark.parametrize("with_request", [False, True])
+def test_output_is_identical(tests, serializer_class, with_request):
+    """Test that compiled rows render to the serializer's JSON"""
+    context = {}
+    if with_request:
+        context['request'] = APIRequestFactory().get('/')
+    queryset = serializer_class.Meta.model.objects.order_by('-pk')
+
+    expected = serializer_class(queryset, many=True, context=context).data
+    assert compiled.compiled(serializer_class) is not None
+    assert render(compiled.data(serializer_class, queryset, context)) == \
+        render(expected)
+
+
+def test_data_in_order(tests):
+    """Test that rows follow the order of the given ids"""
+    ids = list(RfcTest.objects.order_by('?').values_list('pk', flat=True))
+    rows = compiled.data_in_order(RfcTestSerializer, ids)
+
+    assert [row['id'] for row in rows] == ids
+
+
+def test_queries_are_constant(tests):
+    """Test that the rows take one query plus one per m2m relation"""
+    with CaptureQueriesContext(connection) as queries:
+        compiled.data(NtcMobileResultsSerializer, NTCSpeedTest.objects.all())
+    assert len(queries) == 3
+
+
+def test_first(tests):
+    """Test that a single row serializes like the instance"""
+    test = NTCSpeedTest.objects.latest('pk')
+    queryset = NTCSpeedTest.objects.filter(pk=test.pk)
+
+    assert compiled.first(NtcMobileResultsSerializer, queryset) == \
+        NtcMobileResultsSerializer(test).data
+    assert compiled.first(NtcMobileResultsSerializer,
+                          queryset.none()) is None
+
+
+def test_method_fields_fall_back(tests):
+    """Test that serializers that don't compile are used as they are"""
+    queryset = NTCSpeedTest.objects.order_by('pk')
+
+    assert compiled.compiled(LabelSerializer) is None
+    assert compiled.data(LabelSerializer, queryset) == \
+        LabelSerializer(queryset, many=True).data
+    assert compiled.first(LabelSerializer, queryset)['label'] == \
+        str(queryset.first())
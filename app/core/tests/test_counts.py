@@ -0,0 +1,51 @@
+import pytest
+
+from core import counts
+from core.models import MobileResult, MobileResultFlat, NTCSpeedTest
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def make_test(agent, mobile_result, mobile_device):
+    def make_test(second=0):
+        result = MobileResult.objects.create(**dict(
+            mobile_result, timestamp="2022-11-08 02:35:%02d.000Z" % second))
+        return NTCSpeedTest.objects.create(
+            result=result,
+            tester=agent,
+            test_device=mobile_device,
+            client_ip="127.0.0.1")
+    return make_test
+
+
+def test_count_is_cached_per_filters(make_test, django_assert_num_queries):
+    """Test that the same filters are only counted once"""
+    make_test()
+    queryset = NTCSpeedTest.objects.all()
+    assert counts.count(queryset, search="", province=" Manila") == 1
+    with django_assert_num_queries(0):
+        assert counts.count(queryset, province="manila") == 1
+
+
+def test_insert_invalidates_count(make_test):
+    """Test that a new test is reflected in the next count"""
+    make_test()
+    assert counts.count(MobileResultFlat.objects.all()) == 1
+    make_test(second=1)
+    assert counts.count(MobileResultFlat.objects.all()) == 2
+
+
+def test_estimate_above_threshold(make_test, settings):
+    """Test that large counts come from the planner estimate"""
+    settings.COUNT_ESTIMATE_THRESHOLD = -1
+    make_test()
+    queryset = NTCSpeedTest.objects.all()
+    assert counts.count(queryset) == counts.estimate(queryset)
+
+
+def test_signature_ignores_empty_filters_and_case():
+    """Test that equivalent filter sets share a signature"""
+    assert counts.signature({"isp": "Globe ", "province": None}) == \
+        counts.signature({"isp": "globe", "barangay": ""})
@@ -0,0 +1,116 @@
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from core.eager import eager_load, plan
+from core.models import (
+    Location,
+    MobileResult,
+    NTCSpeedTest,
+    RfcResult,
+    RfcTest,
+)
+from mobile.serializers import NtcMobileResultsSerializer
+from rfc6349.serializers import RfcTestSerializer
+
+
+class EmailSerializer(serializers.ModelSerializer):
+    email = serializers.CharField(source='tester.agent.email')
+    label = serializers.SerializerMethodField()
+
+    class Meta:
+        model = NTCSpeedTest
+        fields = ('id', 'email', 'label')
+
+    def get_label(self, obj):
+        return str(obj)
+
+
+def test_plan_follows_nested_serializers():
+    """Test that nested serializers are joined and m2m prefetched"""
+    result = plan(NtcMobileResultsSerializer)
+
+    assert result.select == ['location', 'result', 'test_device', 'tester',
+                             'tester__agent', 'tester__office']
+    assert result.prefetch == ['tester__agent__groups',
+                               'tester__agent__user_permissions']
+    assert result.complete
+    assert {'result__download', 'tester__agent__email',
+            'result__server'} <= result.only
+    assert 'tester__agent__password' in result.only
+
+
+def test_plan_of_dotted_source():
+    """Test that a dotted source is joined and a method field loads all"""
+    result = plan(EmailSerializer)
+
+    assert result.select == ['tester', 'tester__agent']
+    assert not result.complete
+
+
+@pytest.fixture
+def seed(agent, admin_agent, server, mobile_result, mobile_device,
+         rfc_device, location):
+    loc = Location.objects.create(**location)
+
+    def seed(count):
+        start = NTCSpeedTest.objects.count()
+        for i in range(start, start + count):
+            tester = agent if i % 2 else admin_agent
+            NTCSpeedTest.objects.create(
+                result=MobileResult.objects.create(**dict(
+                    mobile_result, server=server,
+                    timestamp="2022-11-08 02:%02d:00.000Z" % i)),
+                tester=tester, test_device=mobile_device, location=loc,
+                client_ip="127.0.0.1")
+            RfcTest.objects.create(
+                result=RfcResult.objects.create(server=server),
+                tester=tester, test_device=rfc_device, location=loc,
+                client_ip="127.0.0.1")
+    return seed
+
+
+def query_count(client, url):
+    with CaptureQueriesContext(connection) as queries:
+        res = client.get(url)
+    assert res.status_code == 200
+    return len(queries), res.data['results']
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url,as_staff", [
+    ("mobile:user-tests-list", False),
+    ("mobile:speedtest-list", True),
+    ("rfc6349:result", False),
+    ("rfc6349:rfc-tests-list", True),
+    ("mobile:mobile-device-list", True),
+])
+def test_list_queries_are_constant(seed, user, admin_user, url, as_staff):
+    """Test that list endpoints don't query per row"""
+    client = APIClient()
+    client.force_authenticate(user=admin_user if as_staff else user)
+    seed(2)
+    few, data = query_count(client, reverse(url))
+    seed(6)
+    many, more = query_count(client, reverse(url))
+
+    assert len(more) > len(data) or url == "mobile:mobile-device-list"
+    assert few == many
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("serializer_class",
+                         [NtcMobileResultsSerializer, RfcTestSerializer])
+def test_eager_output_is_unchanged(seed, serializer_class):
+    """Test that eager loading doesn't change the serialized data"""
+    seed(3)
+    model = serializer_class.Meta.model
+    queryset = model.objects.order_by('pk')
+
+    eager = serializer_class(eager_load(queryset, serializer_class),
+                             many=True).data
+    assert eager == serializer_class(queryset, many=True).data
@@ -0,0 +1,94 @@
+import pytest
+
+from django.db import connection
+from django.utils import timezone
+
+from core import enrichment
+from core.models import (
+    EnrichmentJob,
+    MobileResult,
+    NTCSpeedTest,
+)
+from core.utils import Gis
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def pending_test(agent, mobile_result, mobile_device):
+    test = NTCSpeedTest.objects.create(
+        result=MobileResult.objects.create(**mobile_result),
+        tester=agent,
+        test_device=mobile_device,
+        client_ip="127.0.0.1",
+        enrichment=enrichment.PENDING)
+    enrichment.enqueue(test)
+    return test
+
+
+def test_process_links_location(pending_test, location, monkeypatch):
+    """Test that the worker geocodes and links the location"""
+    monkeypatch.setattr(Gis, "find_location", lambda lat, lon: location)
+    assert enrichment.process() == 1
+
+    pending_test.refresh_from_db()
+    assert pending_test.enrichment == enrichment.DONE
+    assert pending_test.location.barangay == location["barangay"]
+    assert not EnrichmentJob.objects.exists()
+
+
+def test_failed_job_is_retried_later(pending_test, monkeypatch):
+    """Test that a failed job is rescheduled with backoff"""
+    monkeypatch.setattr(Gis, "find_location", lambda lat, lon: None)
+    enrichment.process()
+
+    job = EnrichmentJob.objects.get()
+    assert job.attempts == 1
+    assert job.run_after > timezone.now()
+    assert "LocationNotFound" in job.last_error
+    # Not due yet
+    assert enrichment.process() == 0
+
+
+def test_job_gives_up_after_max_attempts(pending_test, monkeypatch, settings):
+    """Test that the test is flagged failed once retries are exhausted"""
+    settings.ENRICHMENT_MAX_ATTEMPTS = 1
+    monkeypatch.setattr(Gis, "find_location", lambda lat, lon: None)
+    enrichment.process()
+
+    pending_test.refresh_from_db()
+    assert pending_test.enrichment == enrichment.FAILED
+    assert EnrichmentJob.objects.get().is_dead
+
+
+def test_geocodes_outside_transaction_under_lease(pending_test, location,
+                                                  monkeypatch):
+    """Test that jobs are leased and geocoded without holding locks"""
+    depth = len(connection.atomic_blocks)
+    seen = {}
+
+    def find_location(lat, lon):
+        seen['depth'] = len(connection.atomic_blocks)
+        seen['run_after'] = EnrichmentJob.objects.get().run_after
+        return location
+
+    monkeypatch.setattr(Gis, "find_location", find_location)
+    assert enrichment.process() == 1
+
+    assert seen['depth'] == depth
+    assert seen['run_after'] > timezone.now()
+    assert not EnrichmentJob.objects.exists()
+
+
+def test_expired_lease_leaves_jobs(pending_test, location, monkeypatch,
+                                   settings):
+    """Test that jobs are left to the next claim once the lease ran out"""
+    settings.ENRICHMENT_LEASE = 0
+    monkeypatch.setattr(Gis, "find_location", lambda lat, lon: location)
+    assert enrichment.process() == 0
+    assert enrichment.process() == 0
+
+    pending_test.refresh_from_db()
+    assert pending_test.enrichment == enrichment.PENDING
+    assert EnrichmentJob.objects.get().attempts == 0
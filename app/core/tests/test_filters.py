@@ -0,0 +1,65 @@
+import pytest
+
+from django.db import connection
+
+from core.filters import filter_results
+from core.models import Location, MobileResult, NTCSpeedTest
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def speedtest(agent, mobile_result, mobile_device, location):
+    return NTCSpeedTest.objects.create(
+        result=MobileResult.objects.create(**mobile_result),
+        location=Location.objects.create(**location),
+        tester=agent,
+        test_device=mobile_device,
+        client_ip="127.0.0.1")
+
+
+def explain(queryset):
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute("EXPLAIN " + sql, params)
+        return "\n".join(row[0] for row in cursor.fetchall())
+
+
+@pytest.mark.parametrize("search", [
+    lambda test_id: str(test_id),
+    lambda test_id: str(test_id)[:8].upper(),
+    lambda test_id: " %s " % test_id.hex,
+])
+def test_search_matches_test_id(speedtest, search):
+    """Test that a full test_id or its prefix finds the test"""
+    queryset = filter_results(NTCSpeedTest.objects.all(),
+                              search=search(speedtest.test_id))
+    assert list(queryset) == [speedtest]
+
+
+def test_search_outside_uuid_alphabet_matches_nothing(speedtest):
+    """Test that a search a UUID can't contain matches nothing"""
+    queryset = filter_results(NTCSpeedTest.objects.all(), search="zz")
+    assert not queryset.exists()
+
+
+def test_location_filters_are_case_insensitive(speedtest):
+    """Test that location filters keep icontains semantics"""
+    queryset = filter_results(NTCSpeedTest.objects.all(),
+                              province="metro", barangay="NA LIGAS",
+                              isp=speedtest.result.operator[1:].lower())
+    assert list(queryset) == [speedtest]
+
+
+def test_prefix_search_uses_btree(speedtest):
+    """Test that a test_id prefix is an index range scan"""
+    queryset = filter_results(NTCSpeedTest.objects.all(), search="abc")
+    assert "ntcspeedtest_test_id_prefix" in explain(queryset)
+
+
+def test_location_filter_uses_trigram_index(speedtest):
+    """Test that an icontains location filter uses the GIN index"""
+    queryset = Location.objects.filter(barangay__icontains="ligas")
+    assert "location_barangay_trgm" in explain(queryset)
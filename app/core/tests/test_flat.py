@@ -0,0 +1,135 @@
+import importlib
+
+import pytest
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+
+from core import enrichment, flat
+from core.models import (
+    MobileResult,
+    MobileResultFlat,
+    NTCSpeedTest,
+    PendingRollup,
+)
+from core.utils import Gis
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def make_test(agent, mobile_result, mobile_device):
+    def make_test(second=0, **kwargs):
+        result = MobileResult.objects.create(**dict(
+            mobile_result, timestamp="2022-11-08 02:35:%02d.000Z" % second))
+        return NTCSpeedTest.objects.create(
+            result=result,
+            tester=agent,
+            test_device=mobile_device,
+            client_ip="127.0.0.1",
+            **kwargs)
+    return make_test
+
+
+def test_saved_test_has_flat_row(make_test, user):
+    """Test that ingest writes the joined columns inline"""
+    test = make_test()
+    row = MobileResultFlat.objects.get(pk=test.pk)
+    assert row.test_id == test.test_id
+    assert row.tester_email == user.email
+    assert row.region == test.tester.office.region.region
+    assert row.td_imei == test.test_device.imei
+    assert row.download == test.result.download
+    assert row.province is None
+
+
+def test_enrichment_updates_flat_row(make_test, location, monkeypatch):
+    """Test that linking the location is reflected in the flat row"""
+    monkeypatch.setattr(Gis, "find_location", lambda lat, lon: location)
+    test = make_test(enrichment=enrichment.PENDING)
+    enrichment.enqueue(test)
+    enrichment.process()
+
+    row = MobileResultFlat.objects.get(pk=test.pk)
+    assert row.enrichment == enrichment.DONE
+    assert row.barangay == location["barangay"]
+
+
+def test_command_catches_up(make_test, settings):
+    """Test that the command syncs tests written without sync"""
+    settings.FLAT_RESULTS_SYNC = False
+    tests = [make_test(second=i) for i in range(3)]
+    assert not MobileResultFlat.objects.exists()
+
+    call_command("sync_flat_results", "--batch-size", "2")
+    assert set(MobileResultFlat.objects.values_list("id", flat=True)) == {
+        test.pk for test in tests}
+
+
+def test_command_fills_older_gaps(make_test, settings):
+    """Test that tests older than the newest flat row are synced"""
+    settings.FLAT_RESULTS_SYNC = False
+    tests = [make_test(second=i) for i in range(3)]
+    flat.sync(NTCSpeedTest, ids=[tests[2].pk])
+
+    call_command("sync_flat_results", "--kind", "mobile")
+    assert MobileResultFlat.objects.count() == 3
+
+
+def test_migration_backfills_tests(make_test, settings):
+    """Test that the migration copies existing tests like sync does"""
+    settings.FLAT_RESULTS_SYNC = False
+    test = make_test()
+    migration = importlib.import_module("core.migrations.0069_flat_results")
+    with connection.schema_editor() as schema_editor:
+        migration.backfill(apps, schema_editor)
+    backfilled = MobileResultFlat.objects.filter(pk=test.pk).values().get()
+
+    MobileResultFlat.objects.all().delete()
+    flat.sync(NTCSpeedTest, ids=[test.pk])
+    assert MobileResultFlat.objects.filter(pk=test.pk).values().get() == (
+        backfilled)
+
+
+def test_full_sync_drops_orphans(make_test):
+    """Test that a full sync removes rows of deleted tests"""
+    test = make_test()
+    NTCSpeedTest.objects.filter(pk=test.pk).delete()
+    call_command("sync_flat_results", "--full", "--kind", "mobile")
+    assert not MobileResultFlat.objects.exists()
+
+
+def test_load_tests_keeps_page_order(make_test):
+    """Test that a page found on the flat table keeps its order"""
+    tests = [make_test(second=i) for i in range(3)]
+    ids = [tests[2].pk, tests[0].pk, tests[1].pk]
+    loaded = flat.load_tests(NTCSpeedTest, ids, "result")
+    assert [test.pk for test in loaded] == ids
+
+
+def test_deleted_test_drops_flat_row(make_test):
+    """Test that deleting a test deletes its flat row and marks its hour"""
+    test = make_test()
+    PendingRollup.objects.all().delete()
+    test.delete()
+    assert not MobileResultFlat.objects.exists()
+    assert PendingRollup.objects.filter(kind="mobile").exists()
+
+
+def test_related_save_updates_flat_rows(make_test, agent, office):
+    """Test that renaming the office of a tester rewrites its rows"""
+    test = make_test()
+    office.name = "DICT"
+    office.save()
+    assert MobileResultFlat.objects.get(pk=test.pk).office_name == "DICT"
+
+
+def test_unrelated_save_writes_nothing(make_test, user):
+    """Test that saving a user without changes leaves the rows alone"""
+    make_test()
+    PendingRollup.objects.all().delete()
+    assert flat.sync_related(user) == 0
+    user.save(update_fields=["last_login"])
+    assert not PendingRollup.objects.exists()
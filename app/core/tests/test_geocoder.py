@@ -0,0 +1,164 @@
+import json
+
+import pytest
+
+from core import geocoder
+from core.geocoder import (
+    BoundaryGeocoder,
+    ChainGeocoder,
+    BaseGeocoder,
+    CachedGeocoder,
+    StubGeocoder,
+)
+from core.metrics import registry
+from core.models import GeocodeCache
+from core.utils import Gis
+
+
+def square(x, y, size):
+    return [[[x, y], [x + size, y], [x + size, y + size],
+             [x, y + size], [x, y]]]
+
+
+@pytest.fixture
+def boundary_file(tmp_path):
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"level": "region", "name": "NCR"},
+            "geometry": {"type": "Polygon",
+                         "coordinates": square(120.9, 14.3, 0.4)},
+        },
+        {
+            "type": "Feature",
+            "properties": {
+                "province": "Metro Manila",
+                "municipality": "Quezon City",
+                "barangay": "Krus Na Ligas",
+            },
+            "geometry": {"type": "MultiPolygon",
+                         "coordinates": [square(121.06, 14.64, 0.01)]},
+        },
+    ]
+    path = tmp_path / "boundaries.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection",
+                                "features": features}))
+    return str(path)
+
+
+class StaticGeocoder(BaseGeocoder):
+
+    def __init__(self):
+        self.calls = 0
+
+    def reverse(self, lat, lon):
+        self.calls += 1
+        return {"lat": lat, "lon": lon, "region": "Fallback"}
+
+
+class TestBoundaryGeocoder:
+
+    def test_point_resolves_all_levels(self, boundary_file):
+        """Test that nested boundaries resolve every level"""
+        outcome = BoundaryGeocoder(path=boundary_file).reverse(14.645, 121.065)
+        expected = {
+            "lat": 14.645,
+            "lon": 121.065,
+            "region": "NCR",
+            "province": "Metro Manila",
+            "municipality": "Quezon City",
+            "barangay": "Krus Na Ligas",
+        }
+        assert expected == outcome
+
+    def test_point_resolves_coarse_level_only(self, boundary_file):
+        """Test that a point outside the barangay still has its region"""
+        outcome = BoundaryGeocoder(path=boundary_file).reverse(14.5, 121.0)
+        assert outcome == {"lat": 14.5, "lon": 121.0, "region": "NCR"}
+
+    def test_point_outside_returns_none(self, boundary_file):
+        """Test that an unknown point is not resolved"""
+        assert BoundaryGeocoder(path=boundary_file).reverse(10.0, 123.0) is None
+
+    def test_missing_file_returns_none(self, tmp_path):
+        """Test that a missing boundary file disables the backend"""
+        path = str(tmp_path / "missing.geojson")
+        assert BoundaryGeocoder(path=path).reverse(14.5, 121.0) is None
+
+
+def test_chain_falls_back(boundary_file):
+    """Test that the next backend is used when a point is unresolved"""
+    chain = ChainGeocoder([BoundaryGeocoder(path=boundary_file),
+                           StaticGeocoder()])
+    assert chain.reverse(10.0, 123.0)["region"] == "Fallback"
+    assert chain.reverse(14.5, 121.0)["region"] == "NCR"
+
+
+def test_stub_names_grid_cells():
+    """Test that the stub resolves every point to its grid cells"""
+    stub = StubGeocoder()
+    near = stub.reverse(14.6451, 121.0649)
+    assert near["lat"] == 14.6451
+    assert near["municipality"] == stub.reverse(14.6459,
+                                                121.0641)["municipality"]
+    assert near["region"] in StubGeocoder.REGIONS
+    assert near["barangay"] == "Barangay 1464:12106"
+    assert stub.reverse(14.6551, 121.0649)["barangay"] != near["barangay"]
+
+
+def test_gis_uses_configured_backends(settings):
+    """Test that Gis.find_location goes through settings backends"""
+    settings.GEOCODER_BACKENDS = ["core.tests.test_geocoder.StaticGeocoder"]
+    settings.GEOCODER_CACHE_SIZE = 0
+    geocoder.reset_geocoder()
+    try:
+        assert Gis.find_location(14.0, 121.0)["region"] == "Fallback"
+    finally:
+        geocoder.reset_geocoder()
+
+
+@pytest.fixture
+def lookups():
+    """Geocode cache lookups counted since the test started"""
+    def counted():
+        return {result: registry.value("netmesh_geocoder_lookups_total",
+                                       result=result)
+                for result in ("memory_hit", "table_hit", "miss")}
+    before = counted()
+    return lambda: {result: count - before[result]
+                    for result, count in counted().items()}
+
+
+@pytest.mark.django_db
+class TestCachedGeocoder:
+
+    def test_nearby_points_share_entry(self, lookups):
+        """Test that points in the same grid cell hit the memory cache"""
+        backend = StaticGeocoder()
+        cached = CachedGeocoder(backend, precision=3)
+        cached.reverse(14.64512, 121.06498)
+        outcome = cached.reverse(14.64538, 121.06521)
+
+        assert backend.calls == 1
+        assert outcome["lat"] == 14.64538
+        assert outcome["region"] == "Fallback"
+        assert lookups() == {"miss": 1, "memory_hit": 1, "table_hit": 0}
+
+    def test_table_shared_between_workers(self, lookups):
+        """Test that a cold worker is served from the persistent table"""
+        backend = StaticGeocoder()
+        CachedGeocoder(backend).reverse(14.645, 121.065)
+        other = CachedGeocoder(backend)
+        other.reverse(14.645, 121.065)
+
+        assert backend.calls == 1
+        assert lookups()["table_hit"] == 1
+        assert GeocodeCache.objects.count() == 1
+
+    def test_lru_evicts_oldest(self):
+        """Test that the memory cache is bounded"""
+        cached = CachedGeocoder(StaticGeocoder(), maxsize=2, persistent=False)
+        for lon in (120.0, 121.0, 122.0):
+            cached.reverse(14.0, lon)
+        assert len(cached.memory) == 2
+        assert cached.memory.get(cached.key(14.0, 120.0)) is None
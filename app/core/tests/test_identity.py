@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from durin.models import AuthToken
+from rest_framework.test import APIClient
+
+from core import identity
+from core.models import NTCSpeedTest
+from core.tests.test_middleware import admin_client  # noqa: F401
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def device_token(user, agent, mobile_device, mobile_client):
+    mobile_device.users.add(agent)
+    return AuthToken.objects.create(user=user, client=mobile_client)
+
+
+def test_resolve_in_one_query(device_token, agent, mobile_device):
+    """Test that the owner and device of a token are read together"""
+    with CaptureQueriesContext(connection) as queries:
+        owner = identity.resolve(device_token.token)
+        assert owner.agent.office == agent.office
+    assert len(queries) == 1
+    assert owner.user == agent.agent
+    assert owner.mobile_device == mobile_device
+    assert owner.rfc_device is None
+    assert identity.resolve("unknown") is None
+
+
+def test_resolve_is_cached(device_token, settings):
+    """Test that identities are served from the local then shared cache"""
+    settings.IDENTITY_CACHE_TTL = 300
+    identity.resolve(device_token.token)
+    with CaptureQueriesContext(connection) as queries:
+        identity.resolve(device_token.token)
+        identity.local.clear()
+        shared = identity.resolve(device_token.token)
+    assert len(queries) == 0
+    assert shared.mobile_device.pk == device_token.client.mobiledevice.pk
+
+
+def test_no_shared_cache_by_default(device_token):
+    """Test that without Redis identities are only cached per worker"""
+    identity.resolve(device_token.token)
+    identity.local.clear()
+    with CaptureQueriesContext(connection) as queries:
+        identity.resolve(device_token.token)
+        identity.resolve(device_token.token)
+    assert len(queries) == 1
+
+
+def test_invalidate_reloads(device_token, mobile_device, settings):
+    settings.IDENTITY_CACHE_TTL = 300
+    identity.resolve(device_token.token)
+    mobile_device.name = "Renamed"
+    mobile_device.save()
+    identity.invalidate()
+
+    with CaptureQueriesContext(connection) as queries:
+        owner = identity.resolve(device_token.token)
+    assert len(queries) == 1
+    assert owner.mobile_device.name == "Renamed"
+
+
+def test_device_token_ingest(device_token, user_mobile_result, agent,
+                             mobile_device):
+    """Test that a result posted with a device token is the tester's"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION="Token " + device_token.token)
+
+    res = client.post(reverse("mobile:result"), user_mobile_result,
+                      format="json")
+
+    assert res.status_code == 201
+    test = NTCSpeedTest.objects.get()
+    assert (test.tester, test.test_device) == (agent, mobile_device)
+
+
+def test_expired_token_is_rejected(device_token):
+    identity.resolve(device_token.token)
+    AuthToken.objects.filter(pk=device_token.pk).update(
+        expiry=timezone.now() - timedelta(seconds=1))
+    identity.invalidate()
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION="Token " + device_token.token)
+
+    res = client.post(reverse("mobile:result-batch"), [], format="json")
+
+    assert res.status_code == 401
+    assert not AuthToken.objects.filter(pk=device_token.pk).exists()
+
+
+def test_deactivated_user_is_rejected(admin_client, device_token,  # noqa: F811
+                                      user):
+    """Test that deactivating a user drops their cached identity"""
+    identity.resolve(device_token.token)
+    res = admin_client.patch(reverse("user:ft-user-active", args=[user.pk]),
+                             {"is_active": False})
+    assert res.status_code == 200
+
+    assert identity.resolve(device_token.token) is None
@@ -0,0 +1,94 @@
+import subprocess
+import sys
+
+import pytest
+
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.metrics import Registry, registry
+from core.middleware import QueryBudgetExceeded
+from core.models import MobileResult, NTCSpeedTest
+
+
+pytestmark = pytest.mark.django_db
+
+SERVERS_URL = reverse("server:servers")
+
+
+def recorded(view):
+    """Number of requests to `view` recorded so far"""
+    return registry.value("netmesh_db_queries_count", view=view)
+
+
+@pytest.fixture
+def admin_client(admin_user, admin_agent):
+    client = APIClient()
+    client.force_authenticate(user=admin_user)
+    return client
+
+
+def test_server_timing_header(server):
+    res = APIClient().get(SERVERS_URL)
+    assert res.status_code == 200
+    total, db, serializer = res["Server-Timing"].split(", ")
+    assert total.startswith("total;dur=")
+    assert db.startswith("db;dur=") and db.endswith('desc="1 queries"')
+    assert serializer.startswith("serializer;dur=")
+
+
+def test_server_timing_can_be_turned_off(settings):
+    settings.SERVER_TIMING = False
+    assert "Server-Timing" not in APIClient().get(SERVERS_URL)
+
+
+def test_metrics_endpoint(admin_client, server):
+    APIClient().get(SERVERS_URL)
+    res = admin_client.get(reverse("metrics"))
+    assert res.status_code == 200
+    assert res["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = res.content.decode()
+    assert "# TYPE netmesh_http_request_duration_seconds histogram" in text
+    assert 'netmesh_http_requests_total{method="GET",status="200",' \
+        'view="server:servers"}' in text
+    assert 'netmesh_db_queries_bucket{le="1.0",view="server:servers"}' in text
+
+
+def test_metrics_sum_worker_processes(tmp_path, monkeypatch):
+    """Test that the metrics of every worker are rendered by any of them"""
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    for _ in range(2):
+        subprocess.run(
+            [sys.executable, "-c",
+             "from core.metrics import registry; registry.exceeded('x')"],
+            check=True)
+    assert 'netmesh_query_budget_exceeded_total{view="x"} 2.0' in (
+        Registry().render())
+
+
+def test_metrics_requires_admin():
+    assert APIClient().get(reverse("metrics")).status_code == 401
+
+
+def test_streamed_queries_are_counted(admin_client, admin_agent,
+                                      mobile_result, mobile_device):
+    NTCSpeedTest.objects.create(
+        tester=admin_agent,
+        result=MobileResult.objects.create(**mobile_result),
+        test_device=mobile_device,
+        client_ip="127.0.0.1")
+    before = recorded("mobile:mobileresultcsv")
+    res = admin_client.get(reverse("mobile:mobileresultcsv"))
+    assert recorded("mobile:mobileresultcsv") == before
+    b"".join(res.streaming_content)
+    assert recorded("mobile:mobileresultcsv") == before + 1
+
+
+def test_query_budget(settings, server, caplog):
+    settings.QUERY_BUDGETS = {"server:servers": 0}
+    with pytest.raises(QueryBudgetExceeded):
+        APIClient().get(SERVERS_URL)
+
+    settings.QUERY_BUDGET_STRICT = False
+    assert APIClient().get(SERVERS_URL).status_code == 200
+    assert "over its budget of 0" in caplog.text
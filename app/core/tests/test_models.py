@@ -1,90 +1,135 @@
-from datetime import datetime
-import pytz
-
-import pytest
-
-from django.contrib.auth import get_user_model
-
-from durin.models import Client
-
-from core import models
-from core.models import RfcDevice
-
-
-@pytest.mark.django_db
-class TestUserModel:
-
-    def test_create_user_success(self, user_info, user):
-        """Test that normal user is created"""
-
-        assert user.email == user_info.get("email")
-
-    def test_create_superuser_success(self, user_info):
-        """Test that superuser is created"""
-        user = get_user_model().objects.create_superuser(
-            **user_info
-        )
-        assert user.is_staff == True
-
-    def test_user_email_serialized(self, nro):
-        """Test that the new user email is normalize (lowercase afer @)"""
-        email = 'test@gmaIl.coM'
-        user = get_user_model().objects.create_user(
-            email,
-            'test123'
-        )
-        assert user.email == email.lower()
-
-    def test_invalid_email_failed(self):
-        """Test creating user with no email raises error"""
-        with pytest.raises(ValueError):
-            get_user_model().objects.create_user(None, 'testpassword123')
-
-
-@pytest.mark.django_db
-class TestRfcDeviceModel:
-
-    def test_rfc_device_create_success(self, agent, token_client):
-        """Test that rfc device is created successfully"""
-        rfc_device_info = {
-            "manufacturer": 'MSI',
-            "product": 'GF63',
-            "version": '1.0',
-            "client": token_client
-        }
-        device: RfcDevice = models.RfcDevice.objects.create(
-            **rfc_device_info
-        )
-
-        assert rfc_device_info.get("manufacturer") == device.manufacturer
-
-
-@pytest.mark.django_db
-class TestMobileModel:
-    def test_mobile_device_create_success(self, mobile_device_details):
-        device = models.MobileDevice.objects.create(**mobile_device_details)
-        assert device.serial_number == mobile_device_details['serial_number']
-
-    def test_create_result_success(self, mobile_result):
-        obj = models.MobileResult.objects.create(**mobile_result)
-        expected = mobile_result.get('rssi')
-        actual = obj.rssi
-        assert expected == actual
-
-
-@pytest.mark.django_db
-class TestServerModel():
-    """Test Server Model creation"""
-
-    def test_create_server_success(self, user):
-        server_details = {
-                "ip_address": "192.168.1.1",
-                "server_type": "local",
-                "lat": 14,
-                "lon": 120,
-                "contributor": user
-        }
-        server = models.Server.objects.create(**server_details)
-        expected = server_details['ip_address']
-        outcome = server.ip_address
-        assert expected == outcome
+from datetime import datetime
+import pytz
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from durin.models import Client
+
+from core import models
+from core.models import RfcDevice
+
+
+@pytest.mark.django_db
+class TestUserModel:
+
+    def test_create_user_success(self, user_info, user):
+        """Test that normal user is created"""
+
+        assert user.email == user_info.get("email")
+
+    def test_create_superuser_success(self, user_info):
+        """Test that superuser is created"""
+        user = get_user_model().objects.create_superuser(
+            **user_info
+        )
+        assert user.is_staff == True
+
+    def test_user_email_serialized(self, nro):
+        """Test that the new user email is normalize (lowercase afer @)"""
+        email = 'test@gmaIl.coM'
+        user = get_user_model().objects.create_user(
+            email,
+            'test123'
+        )
+        assert user.email == email.lower()
+
+    def test_invalid_email_failed(self):
+        """Test creating user with no email raises error"""
+        with pytest.raises(ValueError):
+            get_user_model().objects.create_user(None, 'testpassword123')
+
+
+@pytest.mark.django_db
+class TestRfcDeviceModel:
+
+    def test_rfc_device_create_success(self, agent, token_client):
+        """Test that rfc device is created successfully"""
+        rfc_device_info = {
+            "manufacturer": 'MSI',
+            "product": 'GF63',
+            "version": '1.0',
+            "client": token_client
+        }
+        device: RfcDevice = models.RfcDevice.objects.create(
+            **rfc_device_info
+        )
+
+        assert rfc_device_info.get("manufacturer") == device.manufacturer
+
+
+@pytest.mark.django_db
+class TestMobileModel:
+    def test_mobile_device_create_success(self, mobile_device_details):
+        device = models.MobileDevice.objects.create(**mobile_device_details)
+        assert device.serial_number == mobile_device_details['serial_number']
+
+    def test_create_result_success(self, mobile_result):
+        obj = models.MobileResult.objects.create(**mobile_result)
+        expected = mobile_result.get('rssi')
+        actual = obj.rssi
+        assert expected == actual
+
+
+@pytest.mark.django_db
+class TestServerModel():
+    """Test Server Model creation"""
+
+    def test_create_server_success(self, user):
+        server_details = {
+                "ip_address": "192.168.1.1",
+                "server_type": "local",
+                "lat": 14,
+                "lon": 120,
+                "contributor": user
+        }
+        server = models.Server.objects.create(**server_details)
+        expected = server_details['ip_address']
+        outcome = server.ip_address
+        assert expected == outcome
+
+
+@pytest.mark.django_db
+class TestLocationModel:
+
+    def test_canonical_location_reused(self, location):
+        """Test that tests in the same barangay share one Location"""
+        first = models.Location.objects.get_canonical(**location)
+        models.Location.objects.clear_cache()
+        location.update(lat=15.2, lon=120.7)
+        second = models.Location.objects.get_canonical(**location)
+
+        assert first.id == second.id
+        assert second.lat == 15.1240083
+        assert models.Location.objects.count() == 1
+
+    def test_blank_and_null_areas_match(self):
+        """Test that missing areas resolve to the same Location"""
+        first = models.Location.objects.get_canonical(
+            lat=14.0, lon=121.0, region="NCR", barangay="")
+        second = models.Location.objects.get_canonical(
+            lat=14.0, lon=121.0, region="NCR", barangay=None)
+
+        assert first.id == second.id
+
+    def test_rolled_back_location_not_cached(self, location):
+        """Test that a Location of a rolled back transaction isn't cached"""
+        key = tuple(location[field] for field in
+                    models.LocationManager.KEY_FIELDS)
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                models.Location.objects.get_canonical(**location)
+                raise RuntimeError
+        assert models.Location.objects.cache.get(key) is None
+        assert not models.Location.objects.exists()
+
+    def test_committed_location_cached(self, location,
+                                       django_capture_on_commit_callbacks):
+        """Test that a Location is cached once its transaction commits"""
+        key = tuple(location[field] for field in
+                    models.LocationManager.KEY_FIELDS)
+        with django_capture_on_commit_callbacks(execute=True):
+            first = models.Location.objects.get_canonical(**location)
+        assert models.Location.objects.cache.get(key) == first
@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+import pytest
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from core.models import MobileResult, NTCSpeedTest
+from core.pagination import KeysetPaginator
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def tests(agent, mobile_result, mobile_device):
+    now = timezone.now()
+    tests = []
+    for i in range(5):
+        result = MobileResult.objects.create(**dict(
+            mobile_result, timestamp=now + timedelta(seconds=i)))
+        tests.append(NTCSpeedTest.objects.create(
+            result=result,
+            tester=agent,
+            test_device=mobile_device,
+            client_ip="127.0.0.1"))
+    # Two rows share a date_created, the id breaks the tie
+    dates = [now, now, now - timedelta(hours=1),
+             now - timedelta(hours=2), now - timedelta(hours=3)]
+    for test, date_created in zip(tests, dates):
+        NTCSpeedTest.objects.filter(pk=test.pk).update(
+            date_created=date_created)
+    return NTCSpeedTest.objects.order_by("-date_created", "-id")
+
+
+def walk(queryset, length):
+    paginator = KeysetPaginator()
+    pages = [paginator.paginate(queryset, "", length)]
+    while paginator.next:
+        pages.append(paginator.paginate(queryset, paginator.next, length))
+    return paginator, pages
+
+
+def test_pages_cover_every_row_once(tests):
+    """Test that following next cursors visits each row in order"""
+    _, pages = walk(NTCSpeedTest.objects.all(), 2)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [t.pk for page in pages for t in page] == [
+        t.pk for t in tests]
+
+
+def test_previous_cursor_returns_previous_page(tests):
+    """Test that the previous cursor of a page goes back one page"""
+    queryset = NTCSpeedTest.objects.all()
+    paginator, pages = walk(queryset, 2)
+    back = paginator.paginate(queryset, paginator.previous, 2)
+    assert [t.pk for t in back] == [t.pk for t in pages[1]]
+    assert paginator.next is not None
+
+
+def test_first_page_has_no_previous(tests):
+    """Test that the first page has only a next cursor"""
+    paginator = KeysetPaginator()
+    paginator.paginate(NTCSpeedTest.objects.all(), "", 10)
+    assert paginator.next is None
+    assert paginator.previous is None
+
+
+def test_invalid_cursor_is_rejected():
+    """Test that a tampered cursor is a validation error"""
+    with pytest.raises(ValidationError):
+        KeysetPaginator().paginate(NTCSpeedTest.objects.all(), "nope", 2)
+
+
+def test_keyset_on_other_fields(tests):
+    """Test that any unique key pages in either direction"""
+    paginator = KeysetPaginator(descending=False, fields=('id',))
+    first = paginator.paginate(NTCSpeedTest.objects.all(), "", 3)
+    second = paginator.paginate(NTCSpeedTest.objects.all(), paginator.next, 3)
+    assert [t.pk for t in first + second] == sorted(t.pk for t in tests)
+    assert paginator.next is None
+
+
+def test_cursor_of_another_key_is_rejected(tests):
+    """Test that a cursor is only valid for the key it was made for"""
+    paginator = KeysetPaginator()
+    paginator.paginate(NTCSpeedTest.objects.all(), "", 2)
+    with pytest.raises(ValidationError):
+        KeysetPaginator(fields=('id',)).paginate(
+            NTCSpeedTest.objects.all(), paginator.next, 2)
+
+
+@pytest.fixture
+def tester_client(user, tests):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def test_limit_cursor_pages(tester_client, tests):
+    """Test that next links walk every row without counting them"""
+    url = reverse("mobile:user-tests-list")
+    pages = [tester_client.get(url, {"limit": 2}).json()]
+    while pages[-1]["has_more"]:
+        pages.append(tester_client.get(pages[-1]["next"]).json())
+
+    assert [len(page["results"]) for page in pages] == [2, 2, 1]
+    assert [r["id"] for page in pages for r in page["results"]] == [
+        t.pk for t in tests]
+    assert pages[-1]["next"] is None
+    assert "limit=2" in pages[1]["previous"]
+
+
+def test_page_size_is_bounded(tester_client, settings):
+    """Test that the default and requested page sizes are capped"""
+    settings.PAGE_SIZE = 3
+    settings.MAX_PAGE_SIZE = 4
+    url = reverse("mobile:user-tests-list")
+
+    assert len(tester_client.get(url).json()["results"]) == 3
+    assert len(tester_client.get(url, {"limit": 1000}).json()[
+        "results"]) == 4
+
+
+@pytest.mark.parametrize("limit", ["0", "-1", "many"])
+def test_invalid_limit_is_rejected(tester_client, limit):
+    res = tester_client.get(reverse("mobile:user-tests-list"),
+                            {"limit": limit})
+    assert res.status_code == 400
+    assert "limit" in res.json()
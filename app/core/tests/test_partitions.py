@@ -0,0 +1,180 @@
+import datetime
+import json
+
+import pytest
+
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+
+from core import flat, partitions
+from core.filters import FLAT_LOOKUPS, filter_results
+from core.models import (
+    MobileResult,
+    MobileResultFlat,
+    NTCSpeedTest,
+    PublicSpeedTest,
+)
+
+
+pytestmark = pytest.mark.django_db
+
+TODAY = datetime.date(2026, 10, 18)
+
+
+@pytest.fixture
+def make_tests(agent, mobile_result, mobile_device, settings):
+    """
+    Tests created on each of `dates`, with results taken then unless
+    `measured` on other dates, then synced to the flat table
+    """
+    def make_tests(*dates, measured=()):
+        settings.FLAT_RESULTS_SYNC = False
+        ids = []
+        for i, day in enumerate(dates):
+            created = partitions.bound(day) + datetime.timedelta(hours=12)
+            timestamp = partitions.bound(
+                measured[i] if measured else day) + datetime.timedelta(
+                    hours=12, seconds=i)
+            result = MobileResult.objects.create(**dict(
+                mobile_result, timestamp=timestamp))
+            test = NTCSpeedTest.objects.create(
+                result=result,
+                tester=agent,
+                test_device=mobile_device,
+                client_ip="127.0.0.1")
+            NTCSpeedTest.objects.filter(pk=test.pk).update(
+                date_created=created)
+            ids.append(test.pk)
+        flat.sync(NTCSpeedTest, ids=ids)
+        return ids
+    return make_tests
+
+
+def rows_in(table):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM %s' % table)
+        return cursor.fetchone()[0]
+
+
+def scanned_tables(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    def walk(node):
+        if 'Relation Name' in node:
+            yield node['Relation Name']
+        for child in node.get('Plans', []):
+            yield from walk(child)
+    return set(walk(plan[0]['Plan']))
+
+
+def test_add_months():
+    assert partitions.add_months(datetime.date(2026, 11, 1), 2) == \
+        datetime.date(2027, 1, 1)
+    assert partitions.add_months(datetime.date(2026, 1, 1), -1) == \
+        datetime.date(2025, 12, 1)
+
+
+def test_maintain_moves_default_rows(make_tests):
+    """Test that rows caught by the default partition get their month"""
+    make_tests(datetime.date(2026, 8, 3), datetime.date(2026, 10, 1))
+    assert rows_in('mobile_result_flat_default') == 2
+
+    created, detached = partitions.maintain(
+        MobileResultFlat, ahead=2, today=TODAY)
+    assert created == [
+        'mobile_result_flat_p202608',
+        'mobile_result_flat_p202610',
+        'mobile_result_flat_p202611',
+        'mobile_result_flat_p202612',
+    ]
+    assert detached == []
+    assert rows_in('mobile_result_flat_default') == 0
+    assert rows_in('mobile_result_flat_p202608') == 1
+    assert MobileResultFlat.objects.count() == 2
+
+    assert partitions.maintain(
+        MobileResultFlat, ahead=2, today=TODAY) == ([], [])
+
+
+def test_results_are_partitioned(make_tests):
+    """Test that results are partitioned by month of timestamp"""
+    make_tests(datetime.date(2026, 8, 3), datetime.date(2026, 10, 1))
+    created, _ = partitions.maintain(MobileResult, ahead=0, today=TODAY)
+    assert created == [
+        'core_mobileresult_p202608',
+        'core_mobileresult_p202610',
+    ]
+    assert rows_in('core_mobileresult_default') == 0
+    assert rows_in('core_mobileresult_p202608') == 1
+    assert NTCSpeedTest.objects.select_related('result').count() == 2
+
+
+def test_sync_upserts_into_partition(make_tests):
+    """Test that re-syncing a test updates its row in place"""
+    partitions.maintain(MobileResultFlat, ahead=0, today=TODAY)
+    [pk] = make_tests(datetime.date(2026, 10, 5))
+    NTCSpeedTest.objects.filter(pk=pk).update(client_ip="10.0.0.1")
+    flat.sync(NTCSpeedTest, ids=[pk])
+    assert MobileResultFlat.objects.get(pk=pk).client_ip == "10.0.0.1"
+    assert rows_in('mobile_result_flat_p202610') == 1
+
+
+def test_date_range_filter_is_pruned(make_tests):
+    """Test that the datatable date filter only scans its months"""
+    make_tests(datetime.date(2026, 8, 3), datetime.date(2026, 10, 1))
+    partitions.maintain(MobileResultFlat, ahead=1, today=TODAY)
+
+    queryset = filter_results(
+        MobileResultFlat.objects.all(),
+        min_date=datetime.date(2026, 10, 1),
+        max_date=datetime.date(2026, 10, 18),
+        lookups=FLAT_LOOKUPS)
+    assert queryset.count() == 1
+    assert scanned_tables(queryset) == {'mobile_result_flat_p202610'}
+
+
+def test_command_expires_to_archive(make_tests):
+    """Test that result months past the retention leave with their tests"""
+    current = partitions.month_start(timezone.localdate())
+    old = partitions.add_months(current, -2)
+    old_id, current_id = make_tests(old, current)
+    PublicSpeedTest.objects.create(
+        result=NTCSpeedTest.objects.get(pk=old_id).result)
+    for model in partitions.MODELS:
+        partitions.maintain(model, ahead=0)
+
+    call_command('manage_partitions', '--ahead', '0', '--retention', '2',
+                 '--archive-schema', 'result_archive')
+    assert list(NTCSpeedTest.objects.values_list('pk', flat=True)) == [
+        current_id]
+    assert MobileResult.objects.count() == 1
+    assert not PublicSpeedTest.objects.exists()
+    assert list(MobileResultFlat.objects.values_list('pk', flat=True)) == [
+        current_id]
+    for model in (MobileResult, NTCSpeedTest, PublicSpeedTest):
+        name = partitions.partition_name(model, old)
+        assert rows_in('result_archive.' + name) == 1
+    # The emptied flat month is dropped, its rows are gone with the tests
+    assert old not in partitions.partitions(MobileResultFlat)
+    assert old not in partitions.partitions(MobileResult)
+
+
+def test_flat_month_with_kept_tests_stays(make_tests):
+    """Test that flat rows of tests with results still kept stay readable"""
+    current = partitions.month_start(timezone.localdate())
+    old = partitions.add_months(current, -2)
+    [pk] = make_tests(old, measured=[current])
+    for model in partitions.MODELS:
+        partitions.maintain(model, ahead=0)
+
+    call_command('manage_partitions', '--ahead', '0', '--retention', '2',
+                 '--drop')
+    assert old in partitions.partitions(MobileResultFlat)
+    assert list(MobileResultFlat.objects.values_list('pk', flat=True)) == [
+        pk]
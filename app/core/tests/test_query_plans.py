@@ -0,0 +1,147 @@
+"""
+Query plan regression suite for the result list endpoints
+
+Every SELECT run by a list, datatable or CSV endpoint is EXPLAINed with
+sequential scans and sorts disabled. The planner then only picks one of
+them when no index can serve the query, which is what these tests catch.
+"""
+import json
+import re
+from datetime import timedelta
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import (
+    Location,
+    MobileResult,
+    NTCSpeedTest,
+    RfcResult,
+    RfcTest,
+)
+
+
+pytestmark = pytest.mark.django_db
+
+SEED_SIZE = 50
+FORBIDDEN_NODES = {"Seq Scan", "Sort", "Incremental Sort"}
+RESULT_TABLES = re.compile(
+    r'"(core_ntcspeedtest|core_rfctest|core_mobileresult|core_rfcresult'
+    r'|mobile_result_flat|rfc_result_flat)"')
+# Exports read through a server-side cursor
+DECLARE_CURSOR = re.compile(r"^DECLARE .*? CURSOR .*?FOR (SELECT .*)", re.S)
+
+
+@pytest.fixture
+def seeded(agent, admin_agent, server, mobile_result, mobile_device,
+           rfc_device, location):
+    loc = Location.objects.create(**location)
+    now = timezone.now()
+    mobile_results = MobileResult.objects.bulk_create([
+        MobileResult(**dict(mobile_result, server=server,
+                            timestamp=now - timedelta(minutes=i)))
+        for i in range(SEED_SIZE)])
+    rfc_results = RfcResult.objects.bulk_create([
+        RfcResult(server=server, timestamp=now - timedelta(minutes=i))
+        for i in range(SEED_SIZE)])
+    for i, (mobile, rfc) in enumerate(zip(mobile_results, rfc_results)):
+        tester = agent if i % 2 else admin_agent
+        NTCSpeedTest.objects.create(
+            result=mobile, tester=tester, test_device=mobile_device,
+            location=loc, client_ip="127.0.0.1")
+        RfcTest.objects.create(
+            result=rfc, tester=tester, test_device=rfc_device,
+            location=loc, client_ip="127.0.0.1")
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def plan_nodes(plan):
+    yield plan["Node Type"]
+    for child in plan.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("SET LOCAL enable_sort = off")
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+        plan = cursor.fetchone()[0]
+        cursor.execute("RESET enable_seqscan")
+        cursor.execute("RESET enable_sort")
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def assert_indexed(client, url, params=None):
+    with CaptureQueriesContext(connection) as queries:
+        res = client.get(url, params or {})
+        assert res.status_code == 200
+        if res.streaming:
+            b"".join(res.streaming_content)
+    selects = []
+    for query in queries:
+        sql = query["sql"]
+        declare = DECLARE_CURSOR.match(sql)
+        if declare:
+            sql = declare.group(1)
+        if sql.startswith("SELECT") and RESULT_TABLES.search(sql):
+            selects.append(sql)
+    assert selects
+    for sql in selects:
+        plan = explain(sql)
+        nodes = FORBIDDEN_NODES.intersection(plan_nodes(plan))
+        assert not nodes, "%s in plan of %s\n%s" % (
+            ", ".join(sorted(nodes)), sql, json.dumps(plan, indent=1))
+
+
+@pytest.fixture
+def staff_client(admin_user, seeded):
+    client = APIClient()
+    client.force_authenticate(user=admin_user)
+    return client
+
+
+@pytest.fixture
+def tester_client(user, seeded):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+DATATABLE = {"draw": 1, "start": 20, "length": 10,
+             "order[0][column]": "0", "order[0][dir]": "asc"}
+
+
+@pytest.mark.parametrize("url", ["mobile:mobileresultslist",
+                                 "rfc6349:resulttable"])
+@pytest.mark.parametrize("params", [
+    {},
+    {"cursor": ""},
+    {"search[value]": "0a1b"},
+    {"province": "metro", "municipality": "quezon"},
+])
+def test_datatable_plans(staff_client, url, params):
+    assert_indexed(staff_client, reverse(url), dict(DATATABLE, **params))
+
+
+@pytest.mark.parametrize("url", ["mobile:mobileresultcsv", "rfc6349:csv"])
+@pytest.mark.parametrize("params", [
+    {},
+    {"barangay": "ligas"},
+])
+def test_csv_plans(staff_client, agent, url, params):
+    params = dict(params, region=agent.office.region.region)
+    assert_indexed(staff_client, reverse(url), params)
+
+
+@pytest.mark.parametrize("url", ["mobile:user-tests-list", "rfc6349:result"])
+def test_tester_list_plans(tester_client, url):
+    assert_indexed(tester_client, reverse(url))
@@ -0,0 +1,57 @@
+import datetime
+import decimal
+import uuid
+from collections import OrderedDict
+
+import pytest
+
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnList
+
+from core import renderers
+from core.renderers import FastJSONRenderer, dumps
+
+
+DATA = ReturnList([
+    OrderedDict([
+        ('id', 1),
+        ('when', datetime.datetime(2022, 10, 1, 8, 30, tzinfo=timezone.utc)),
+        ('day', datetime.date(2022, 10, 1)),
+        ('at', datetime.time(8, 30)),
+        ('took', datetime.timedelta(seconds=90)),
+        ('amount', decimal.Decimal('1.25')),
+        ('uuid', uuid.UUID(int=7)),
+        ('label', gettext_lazy('Barangay')),
+        ('text', 'Mañila     "quoted"'),
+        ('none', None),
+        ('flags', [True, False]),
+        ('speed', 12.5),
+        ('counts', {1: 2}),
+    ]),
+], serializer=None)
+
+
+def test_dumps_matches_json_renderer():
+    """Test that orjson renders the same bytes as JSONRenderer"""
+    pytest.importorskip("orjson")
+    assert dumps(DATA) == JSONRenderer().render(DATA)
+
+
+def test_dumps_without_orjson(monkeypatch):
+    """Test that the stdlib encoder is used when orjson is missing"""
+    monkeypatch.setattr(renderers, "orjson", None)
+    assert dumps(DATA) == JSONRenderer().render(DATA)
+    assert FastJSONRenderer().render(DATA) == JSONRenderer().render(DATA)
+
+
+def test_big_integers_fall_back():
+    assert dumps([2 ** 70]) == b'[1180591620717411303424]'
+
+
+def test_indented_output_is_left_to_json_renderer():
+    rendered = FastJSONRenderer().render(
+        {'a': 1}, 'application/json; indent=2')
+    assert rendered == b'{\n  "a": 1\n}'
+    assert FastJSONRenderer().render(None) == b''
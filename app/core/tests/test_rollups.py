@@ -0,0 +1,265 @@
+import random
+
+import pytest
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from core import rollups
+from core.models import (
+    MobileResult,
+    MobileResultFlat,
+    NTCSpeedTest,
+    PendingRollup,
+    ResultRollup,
+)
+from core.sketches import DDSketch
+
+
+@pytest.fixture
+def make_test(agent, mobile_result, mobile_device):
+    def make_test(second=0, **result):
+        result = MobileResult.objects.create(**dict(
+            mobile_result,
+            timestamp="2022-11-08 02:%02d:%02d.000Z" % divmod(second, 60),
+            **result))
+        return NTCSpeedTest.objects.create(
+            result=result,
+            tester=agent,
+            test_device=mobile_device,
+            client_ip="127.0.0.1")
+    return make_test
+
+
+def test_sketch_quantiles_are_relative_accurate():
+    rng = random.Random(0)
+    values = [rng.lognormvariate(3, 1) for _ in range(5000)]
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+    values.sort()
+    for q in (0.1, 0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact + 1e-9
+
+
+def test_sketch_merge_matches_union():
+    left, right, union = DDSketch(), DDSketch(), DDSketch()
+    for value in range(1, 101):
+        (left if value % 2 else right).add(value)
+        union.add(value)
+    merged = DDSketch.from_dict(left.to_dict()).merge(right)
+    assert merged.count == 100
+    assert merged.quantile(0.5) == union.quantile(0.5)
+
+
+@pytest.mark.django_db
+def test_ingest_queues_hour_for_refresh(make_test, agent):
+    """Test that new tests are rolled up by the refresh"""
+    make_test(download=10, upload=1)
+    make_test(second=1, download=30, upload=3)
+    make_test(second=2, download=20, upload=2, success=False)
+    assert PendingRollup.objects.count() == 1
+    assert not ResultRollup.objects.exists()
+
+    assert rollups.refresh() == 1
+    assert not PendingRollup.objects.exists()
+    hour = ResultRollup.objects.get(granularity=rollups.HOUR)
+    day = ResultRollup.objects.get(granularity=rollups.DAY)
+    region = agent.office.region.region
+    assert (hour.region, hour.operator, hour.network_type, hour.province) \
+        == (region, "Smart", "LTE", "")
+    assert hour.count == day.count == 2
+    download = rollups.Aggregate.from_dict(day.metrics["download"])
+    assert (download.count, download.sum, download.min, download.max) == \
+        (2, 40, 10, 30)
+
+
+@pytest.mark.django_db
+def test_sync_rebuilds_on_ingest(make_test, settings):
+    """Test that ROLLUP_SYNC rolls tests up in the ingest transaction"""
+    settings.ROLLUP_SYNC = True
+    make_test(download=10)
+    make_test(second=1, download=20)
+    assert not PendingRollup.objects.exists()
+    [result] = rollups.query("mobile", rollups.DAY,
+                             timezone.now() - timezone.timedelta(days=1),
+                             timezone.now() + timezone.timedelta(days=1),
+                             group_by=("operator",))
+    assert result["operator"] == "Smart"
+    assert result["count"] == 2
+    assert result["metrics"]["download"]["mean"] == 15
+    assert result["metrics"]["download"]["median"] == pytest.approx(
+        10, rel=0.01)
+
+
+@pytest.mark.django_db
+def test_mark_during_refresh_queues_again(make_test, monkeypatch):
+    """Test that an hour marked while it is rebuilt is refreshed again"""
+    test = make_test()
+    rebuild_hour = rollups.rebuild_hour
+
+    def marking_rebuild_hour(kind, hour):
+        rollups.mark(MobileResultFlat, [test.date_created])
+        return rebuild_hour(kind, hour)
+
+    monkeypatch.setattr(rollups, "rebuild_hour", marking_rebuild_hour)
+    assert rollups.refresh() == 1
+    assert PendingRollup.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_refresh_skips_hours_of_uncommitted_ingest(make_test):
+    """Test that an hour isn't claimed while an ingest marking it runs"""
+    test = make_test()
+    hour = rollups.hour_of(test.date_created)
+    key = [rollups.MARK_NAMESPACE, int(hour.timestamp()) // 3600]
+    ingest = connection.copy()
+    try:
+        with ingest.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock_shared(%s, %s)", key)
+            assert rollups.refresh() == 0
+            assert PendingRollup.objects.filter(hour=hour).exists()
+            cursor.execute("SELECT pg_advisory_unlock_shared(%s, %s)", key)
+    finally:
+        ingest.close()
+    assert rollups.refresh() == 1
+
+
+@pytest.mark.django_db
+def test_failed_refresh_queues_again(make_test, monkeypatch):
+    """Test that the hours of a failed refresh stay pending"""
+    make_test()
+
+    def failing_rebuild_hour(kind, hour):
+        raise RuntimeError("rebuild failed")
+
+    monkeypatch.setattr(rollups, "rebuild_hour", failing_rebuild_hour)
+    with pytest.raises(RuntimeError):
+        rollups.refresh()
+    assert PendingRollup.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_rebuild_locks_day(make_test, monkeypatch):
+    """Test that a day is rebuilt holding its advisory lock"""
+    make_test()
+    locks = []
+    rebuild_day = rollups.rebuild_day
+
+    def locked_rebuild_day(kind, day):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT classid, objid FROM pg_locks WHERE locktype = "
+                "'advisory' AND pid = pg_backend_pid() AND granted "
+                "AND classid = %s", [rollups.LOCK_NAMESPACE])
+            locks.extend(cursor.fetchall())
+        return rebuild_day(kind, day)
+
+    monkeypatch.setattr(rollups, "rebuild_day", locked_rebuild_day)
+    rollups.refresh()
+    day = timezone.localdate()
+    assert locks == [(rollups.LOCK_NAMESPACE, day.toordinal())]
+
+
+@pytest.mark.django_db
+def test_backfill_command(make_test, settings):
+    """Test that --backfill rolls up tests written before the rollups"""
+    make_test()
+    PendingRollup.objects.all().delete()
+    call_command("refresh_rollups", "--backfill", "--once")
+    assert ResultRollup.objects.filter(kind="mobile").count() == 2
+
+
+def test_sketch_collapses_lowest_bins():
+    sketch = DDSketch(max_bins=10)
+    for value in range(1, 1001):
+        sketch.add(value)
+    assert len(sketch.bins) == 10
+    assert sketch.count == 1000
+    assert sketch.quantile(0.99) == pytest.approx(990, rel=0.01)
+
+
+def test_sketch_collapses_most_negative_bins():
+    sketch = DDSketch(max_bins=10)
+    for value in range(1, 1001):
+        sketch.add(-value)
+    assert len(sketch.negative_bins) == 10
+    assert sketch.quantile(0.995) == pytest.approx(-6, rel=0.01)
+
+
+@pytest.mark.django_db
+def test_percentiles_merge_days_and_regions(make_test):
+    """Test that percentiles over several sketches match the exact ones"""
+    for second, download in enumerate(range(1, 41)):
+        make_test(second=second, download=download,
+                  operator="Smart" if second % 2 else "Globe")
+    MobileResultFlat.objects.update(
+        date_created=F("date_created") - timezone.timedelta(days=1))
+    for second, download in enumerate(range(41, 81)):
+        make_test(second=second + 40, download=download, operator="Smart")
+    call_command("refresh_rollups", "--backfill", "--once")
+
+    today = timezone.localdate()
+    [merged] = rollups.percentiles(
+        "mobile", "download", today - timezone.timedelta(days=1), today,
+        [0.1, 0.5, 0.9])
+    assert merged["count"] == 80
+    assert merged["percentiles"] == pytest.approx(
+        {"p10": 8, "p50": 40, "p90": 72}, rel=0.01)
+
+    by_operator = rollups.percentiles(
+        "mobile", "download", today, today, [0.5],
+        group_by=["operator"], filters={"operator": ["Smart", "Globe"]})
+    assert [row["operator"] for row in by_operator] == ["Smart"]
+    assert by_operator[0]["count"] == 40
+
+
+def test_sketch_keeps_negative_values():
+    """Test that negative values (rssi) are not counted as zero"""
+    sketch = DDSketch()
+    for value in (-95, -80, -70, -60):
+        sketch.add(value)
+    assert sketch.quantile(0) == pytest.approx(-95, rel=0.01)
+    assert sketch.quantile(0.5) == pytest.approx(-80, rel=0.01)
+    assert sketch.quantile(0.9) == pytest.approx(-70, rel=0.01)
+    assert sketch.quantile(1) == pytest.approx(-60, rel=0.01)
+
+
+def test_sketch_merges_signed_values():
+    rng = random.Random(0)
+    values = [rng.uniform(-100, 100) for _ in range(2000)] + [0] * 100
+    left, right = DDSketch(), DDSketch()
+    for i, value in enumerate(values):
+        (left if i % 2 else right).add(value)
+    merged = DDSketch.from_dict(left.to_dict()).merge(
+        DDSketch.from_dict(right.to_dict()))
+    assert merged.count == len(values)
+    values.sort()
+    for q in (0.1, 0.3, 0.5, 0.7, 0.9):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(merged.quantile(q) - exact) <= 0.01 * abs(exact) + 1e-9
+
+
+def test_sketch_reads_dict_without_negative_store():
+    """Test that sketches stored before the negative store still load"""
+    sketch = DDSketch.from_dict(
+        {"alpha": 0.01, "zero": 1, "offset": 0, "counts": [2]})
+    assert sketch.count == 3
+    assert sketch.quantile(1) == pytest.approx(1, rel=0.01)
+
+
+@pytest.mark.django_db
+def test_percentiles_of_negative_metric(make_test):
+    """Test that rssi percentiles come back negative, not 0.0"""
+    for second, rssi in enumerate(range(-100, -60)):
+        make_test(second=second, rssi=rssi)
+    call_command("refresh_rollups", "--backfill", "--once")
+
+    today = timezone.localdate()
+    [row] = rollups.percentiles("mobile", "rssi", today, today, [0.5, 0.9])
+    assert row["count"] == 40
+    assert row["percentiles"] == pytest.approx(
+        {"p50": -81, "p90": -65}, rel=0.01)
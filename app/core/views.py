@@ -0,0 +1,23 @@
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from durin.auth import TokenAuthentication
+
+from core.metrics import registry
+from core.renderers import PrometheusRenderer
+
+
+class MetricsView(APIView):
+    """
+    Request counts, latency, SQL time, query count and serializer time
+    per view summed over the uwsgi workers, for Prometheus
+    """
+    permission_classes = (permissions.IsAdminUser, )
+    authentication_classes = (TokenAuthentication, )
+    renderer_classes = (PrometheusRenderer, )
+
+    def get(self, request):
+        return Response(registry.render(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
@@ -76,12 +76,14 @@ class NtcMobileResultsSerializer(serializers.ModelSerializer):
         fields = ["id", "date_created",
                   "tester", "test_id",
                   "result", "location",
+                  "enrichment",
                   "test_device",
                   "client_ip"]
         read_only_fields = (
             'id',
             'date_created',
             'test_id',
+            "enrichment",
             "client_ip"
         )
 
@@ -97,12 +99,14 @@ class MobileResultsListSerializer(serializers.ModelSerializer):
         fields = ["id", "date_created",
                   "tester", "test_id",
                   "result", "location",
+                  "enrichment",
                   "test_device"]
         read_only_fields = (
             'id',
             'date_created',
             'test_id',
-            "location")
+            "location",
+            "enrichment")
 
 
 class MobileDeviceImeiSerializer(serializers.ModelSerializer):
@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
 
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
 import pytz
 from unittest.mock import patch
@@ -34,7 +36,8 @@ from core.models import (
     NTCSpeedTest,
 )
 
-from mobile.views import Gis
+from core.utils import Gis
+from mobile.serializers import MobileResultsSerializer
 
 SPEEDTEST_LIST_CREATE_RESULT_URL = reverse("mobile:result")
 SPEEDTEST_LIST_RESULT_URL = reverse("mobile:speedtest-list")
@@ -100,6 +103,147 @@ class TestMobileResultAPI(
         # self.assertEqual(res.status_code, status.HTTP_201_CREATED)
 
 
+@pytest.mark.django_db
+class TestMobileResultBatchAPI(
+    APIViewTest,
+    Returns200,
+    UsesPostMethod,
+    AsUser('user')
+):
+
+    url = lambda_fixture(lambda: reverse("mobile:result-batch"))
+
+    @pytest.fixture
+    def data(self, user_mobile_result, server):
+        second = dict(user_mobile_result,
+                      timestamp="2022-11-08 02:40:00.000Z")
+        MobileResult.objects.create(**dict(
+            user_mobile_result, server=server,
+            timestamp="2022-11-08 02:50:00.000Z"))
+        return [
+            user_mobile_result,
+            second,
+            user_mobile_result,
+            dict(user_mobile_result, timestamp="2022-11-08 02:50:00.000Z"),
+            dict(user_mobile_result, lat="north"),
+        ]
+
+    @pytest.fixture
+    def client(self, unauthed_client, user, agent, user_token,
+               durin_client, mobile_device_details):
+        mobile_device_details["client"] = durin_client
+        MobileDevice.objects.create(**mobile_device_details)
+        client = APIClient()
+        client.default_format = "json"
+        client.credentials(HTTP_AUTHORIZATION="Token {}".format(user_token))
+        return client
+
+    def test_batch_reports_each_item(self, json):
+        """Test that each item of the batch gets its own status"""
+        expected = ["created", "created", "duplicate", "duplicate", "invalid"]
+        outcome = [item["status"] for item in json["results"]]
+        assert expected == outcome
+        assert "lat" in json["results"][4]["errors"]
+
+    @pytest.fixture
+    def validated(self, monkeypatch):
+        validated = []
+        run_validation = MobileResultsSerializer.run_validation
+
+        def spy(serializer, data):
+            validated.append(data)
+            return run_validation(serializer, data)
+        monkeypatch.setattr(MobileResultsSerializer, "run_validation", spy)
+        return validated
+
+    def test_batch_validates_items_once(self, validated, json, data):
+        """Test that valid items are not validated again to be saved"""
+        assert json["created"] == 2
+        assert validated == data
+
+    def test_batch_creates_pending_tests(self, json, user):
+        """Test that created results are linked to the tester"""
+        tests = NTCSpeedTest.objects.filter(tester__agent=user)
+        assert tests.count() == json["created"] == 2
+        assert {str(t.test_id) for t in tests} == {
+            item["test_id"] for item in json["results"][:2]}
+
+
+@pytest.mark.django_db
+def test_result_csv_is_streamed(authenticated_user, agent, mobile_result,
+                                mobile_device, location):
+    """Test that the CSV export streams one row per result"""
+    NTCSpeedTest.objects.create(
+        tester=agent,
+        result=MobileResult.objects.create(**mobile_result),
+        location=Location.objects.create(**location),
+        test_device=mobile_device,
+        client_ip="127.0.0.1")
+
+    res = authenticated_user.get(reverse("mobile:mobileresultcsv"),
+                                 {"region": agent.office.region.region})
+    assert res.streaming
+    rows = b"".join(res.streaming_content).decode().splitlines()
+    assert rows[0].startswith("date_created,test_id,tester_email")
+    assert len(rows) == 2
+    assert "test@example.com" in rows[1]
+    assert "Krus Na Ligas" in rows[1]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_result_columnar_export(fmt, authenticated_user, agent,
+                                mobile_result, mobile_device, location):
+    """Test that results export as typed columnar files"""
+    NTCSpeedTest.objects.create(
+        tester=agent,
+        result=MobileResult.objects.create(**mobile_result),
+        location=Location.objects.create(**location),
+        test_device=mobile_device,
+        client_ip="127.0.0.1")
+
+    res = authenticated_user.get(reverse("mobile:mobileresultcsv"), {
+        "region": agent.office.region.region,
+        "format": fmt,
+    })
+    body = pa.py_buffer(b"".join(res.streaming_content))
+    if fmt == "parquet":
+        table = pq.read_table(pa.BufferReader(body))
+    else:
+        table = pa.ipc.open_stream(body).read_all()
+    assert table.num_rows == 1
+    assert table.schema.field("download").type == pa.float64()
+    assert table.schema.field("success").type == pa.bool_()
+    assert table.column("barangay").to_pylist() == ["Krus Na Ligas"]
+
+
+@pytest.mark.django_db
+def test_datatable_keyset_pages(admin_user, admin_agent, mobile_result,
+                                mobile_device):
+    """Test that the datatable pages with cursors when asked to"""
+    for minute in range(3):
+        NTCSpeedTest.objects.create(
+            tester=admin_agent,
+            result=MobileResult.objects.create(**dict(
+                mobile_result,
+                timestamp="2022-11-08 02:%02d:00.000Z" % minute)),
+            test_device=mobile_device,
+            client_ip="127.0.0.1")
+    client = APIClient()
+    client.force_authenticate(user=admin_user)
+    url = reverse("mobile:mobileresultslist")
+    params = {"draw": 1, "length": 2, "cursor": "",
+              "order[0][column]": "0", "order[0][dir]": "asc"}
+
+    first = client.get(url, params).json()
+    second = client.get(url, dict(params, cursor=first["next"])).json()
+    assert first["recordsTotal"] == 3
+    assert (len(first["data"]), len(second["data"])) == (2, 1)
+    assert second["next"] is None
+    ids = [item["id"] for item in first["data"] + second["data"]]
+    assert ids == sorted(ids, reverse=True)
+
+
 @pytest.mark.django_db
 class TestFTResultsViewset(ViewSetTest,):
     list_url = lambda_fixture(
@@ -142,7 +286,7 @@ class TestFTResultsViewset(ViewSetTest,):
 
         def test_list_result_has_test_result(self, json):
             """Test that listing results has actual result"""
-            outcome = len(json)
+            outcome = len(json['results'])
             expected = 1
             assert expected == outcome
 
@@ -28,6 +28,9 @@ urlpatterns = [
     path('result/',
          views.MobileResultsView.as_view(),
          name='result'),
+    path('result/batch/',
+         views.MobileResultsBatchView.as_view(),
+         name='result-batch'),
     # path('userntcresults/',
     #      views.SelfListNtcMobileTestsView.as_view(),
     #      name='userntcmobile'
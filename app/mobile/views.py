@@ -1,8 +1,12 @@
+from collections import Counter
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from rest_framework import generics, permissions, viewsets, status
 from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.serializers import ModelSerializer
+from rest_framework.parsers import JSONParser
 
 from rest_framework.response import Response
 
@@ -12,19 +16,35 @@ from durin.auth import TokenAuthentication
 from drf_spectacular.utils import extend_schema_view, extend_schema
 from drf_spectacular.utils import OpenApiParameter
 from django.utils.dateparse import parse_date
-from datetime import date
-import datetime
 
 from django.shortcuts import get_object_or_404
 
-from core import utils, models
-from django.db.models import Q
+from core import utils, enrichment, counts, compiled, flat, identity
 from rest_framework_csv import renderers as r
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
-from core.utils import Gis, get_client_ip
+from core.utils import get_client_ip
+from core.parsers import NDJSONParser
+from core.export import (
+    COLUMNAR_FORMATS,
+    accepts_gzip,
+    export_columns,
+    iter_rows,
+    localize_dates,
+    stream_columnar,
+    stream_csv,
+)
+from core.compiled import CompiledListMixin
+from core.eager import EagerLoadingMixin
+from core.renderers import ArrowRenderer, ParquetRenderer
+from core.filters import FLAT_LOOKUPS, filter_results
+from core.pagination import (
+    KeysetPaginator,
+    LimitCursorPagination,
+    NamePagination,
+)
 
 from mobile.serializers import (
     MobileResultsSerializer,
@@ -38,56 +58,157 @@ from core.models import (
     MobileResult,
     MobileDevice,
     PublicSpeedTest,
-    NTCSpeedTest, LinkedMobileDevice
+    NTCSpeedTest, LinkedMobileDevice, MobileResultFlat
 )
 from . import permissions as custom_permission
-from django.utils import timezone
 
 
 class MobileResultsView(generics.CreateAPIView):
     """View for Creating and Listing Mobile Speed Test Results"""
     queryset = MobileResult.objects.all()
     serializer_class = MobileResultsSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (identity.IdentityTokenAuthentication,)
     permission_classes = [
         custom_permission.IsAuthenticatedOrPostOnly]
 
     def perform_create(self, serializer):
-        token = self.request.auth
-        if not token:
+        owner = identity.of(self.request)
+        if owner is None:
             obj = serializer.save()
             PublicSpeedTest.objects.create(result_id=obj.id)
         else:
-            client = AuthToken.objects.select_related('client').get(
-                token=token
-            ).token_client
-
-            device = get_object_or_404(MobileDevice, client=client)
-            user = get_object_or_404(
-                models.User,
-                email=self.request.user)
+            if owner.mobile_device is None or owner.agent is None:
+                raise NotFound("No mobile device for this token.")
+            if self.request.data.get('lat') is None or \
+                    self.request.data.get('lon') is None:
+                raise ValidationError("lat and lon are required.")
             try:
-                obj = serializer.save()
+                with transaction.atomic():
+                    obj = serializer.save()
+                    test = NTCSpeedTest.objects.create(
+                        result=obj,
+                        tester=owner.agent,
+                        test_device=owner.mobile_device,
+                        client_ip=get_client_ip(self.request),
+                        enrichment=enrichment.PENDING)
+                    enrichment.submit(test)
             except IntegrityError:
                 raise ValidationError("Data already exists.")
-            lat = float(self.request.data.get('lat'))
-            lon = float(self.request.data.get('lon'))
-            if lat is None or lon is None:
-                raise ValidationError("lat and lon are required.")
-            loc = Gis.find_location(lat, lon)
-            if loc is None:
-                raise NotFound("No Location found!")
-            loc = models.Location.objects.create(**loc)
-            ip = get_client_ip(self.request)
-            NTCSpeedTest.objects.create(
-                result_id=obj.id,
-                tester=user,
-                test_device=device,
-                location=loc,
-                client_ip=ip)
-
-
-class AdminMobileTestsView(viewsets.ReadOnlyModelViewSet):
+
+
+class MobileResultsBatchView(generics.GenericAPIView):
+    """
+    Upload Mobile Speed Test Results buffered offline in one request
+    Accepts a JSON array or an NDJSON stream of results and reports
+    the status of each item. Results that were already uploaded are
+    reported as duplicates instead of failing the batch.
+    """
+    queryset = MobileResult.objects.all()
+    serializer_class = MobileResultsSerializer
+    authentication_classes = (identity.IdentityTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+    parser_classes = (JSONParser, NDJSONParser)
+
+    @staticmethod
+    def is_duplicate(errors):
+        """Only failed the `unique mobile results` validation"""
+        if set(errors) != {'non_field_errors'}:
+            return False
+        return all(getattr(e, 'code', None) == 'unique'
+                   for e in errors['non_field_errors'])
+
+    @staticmethod
+    def insert(results):
+        """Bulk insert results, return those that were created"""
+        try:
+            with transaction.atomic():
+                MobileResult.objects.bulk_create(results.values())
+            return results
+        except IntegrityError:
+            # Lost a race with another upload of some of the results
+            created = {}
+            for index, obj in results.items():
+                try:
+                    with transaction.atomic():
+                        obj.save()
+                    created[index] = obj
+                except IntegrityError:
+                    pass
+            return created
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError("Expected a list of results.")
+        if len(items) > settings.RESULT_BATCH_MAX_SIZE:
+            raise ValidationError("At most %s results per batch." %
+                                  settings.RESULT_BATCH_MAX_SIZE)
+        owner = identity.of(request)
+        if owner.mobile_device is None or owner.agent is None:
+            raise NotFound("No mobile device for this token.")
+        device, agent = owner.mobile_device, owner.agent
+        ip = get_client_ip(request)
+
+        statuses = [{'index': index} for index in range(len(items))]
+        # Validate each item once, as ListSerializer would, but keep the
+        # validated data of the valid items when others fail
+        child = self.get_serializer(many=True).child
+        valid = {}
+        for index, item in enumerate(items):
+            try:
+                valid[index] = child.run_validation(item)
+            except ValidationError as exc:
+                if self.is_duplicate(exc.detail):
+                    statuses[index]['status'] = 'duplicate'
+                else:
+                    statuses[index].update(status='invalid',
+                                           errors=exc.detail)
+
+        results = {}
+        keys = {}
+        for index, data in valid.items():
+            key = (data['timestamp'], data['server'].pk)
+            if key in keys:
+                statuses[index]['status'] = 'duplicate'
+                continue
+            keys[key] = index
+            results[index] = MobileResult(**data)
+        existing = MobileResult.objects.filter(
+            timestamp__in={key[0] for key in keys},
+            server_id__in={key[1] for key in keys}
+        ).values_list('timestamp', 'server_id')
+        for key in existing:
+            if key in keys:
+                del results[keys[key]]
+
+        with transaction.atomic():
+            created = self.insert(results)
+            tests = NTCSpeedTest.objects.bulk_create([
+                NTCSpeedTest(
+                    result=obj,
+                    tester=agent,
+                    test_device=device,
+                    client_ip=ip,
+                    enrichment=enrichment.PENDING)
+                for obj in created.values()])
+            enrichment.submit_many(tests)
+            flat.sync_tests(tests)
+
+        for index, test in zip(created, tests):
+            statuses[index].update(status='created', test_id=test.test_id)
+        for index in set(keys.values()) - set(created):
+            statuses[index]['status'] = 'duplicate'
+        summary = Counter(entry['status'] for entry in statuses)
+        return Response({
+            'created': summary['created'],
+            'duplicate': summary['duplicate'],
+            'invalid': summary['invalid'],
+            'results': statuses,
+        }, status=status.HTTP_200_OK)
+
+
+class AdminMobileTestsView(CompiledListMixin, EagerLoadingMixin,
+                           viewsets.ReadOnlyModelViewSet):
     """
     View for Staff User
     Staffs can only list results from his/her region
@@ -95,32 +216,34 @@ class AdminMobileTestsView(viewsets.ReadOnlyModelViewSet):
     Staffs can't change or delete results
     """
     serializer_class = NtcMobileResultsSerializer
+    pagination_class = LimitCursorPagination
     permission_classes = (permissions.IsAdminUser, )
     authentication_classes = (TokenAuthentication, )
 
     def get_queryset(self):
         return NTCSpeedTest.objects.filter(
-            tester__agency=self.request.user.agent.office)
+            tester__office=self.request.user.agent.office).order_by(
+                '-date_created')
 
     def retrieve(self, request, *args, **kwargs):
-        """List results from field tester"""
-        try:
-            instance = NTCSpeedTest.objects.get(
-                    tester_id=int(self.kwargs['pk']))
-        except NTCSpeedTest.DoesNotExist:
+        """Latest result from field tester"""
+        data = compiled.first(
+            NtcMobileResultsSerializer,
+            NTCSpeedTest.objects.filter(
+                tester_id=int(self.kwargs['pk'])).order_by('-date_created'),
+            self.get_serializer_context())
+        if data is None:
             raise NotFound("No test was found.")
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return Response(data)
 
     def list(self, request, *args, **kwargs):
         """List all results from staff's regions"""
-        queryset = self.get_queryset()
-        serializer = NtcMobileResultsSerializer(
-            queryset, many=True)
-        return Response(serializer.data)
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.list_compiled(NtcMobileResultsSerializer, queryset)
 
 
-class UserMobileTestsView(viewsets.ReadOnlyModelViewSet):
+class UserMobileTestsView(CompiledListMixin, EagerLoadingMixin,
+                          viewsets.ReadOnlyModelViewSet):
     """
     View for Field Tester aka User
     FT can only retrieve his/her tests
@@ -128,29 +251,30 @@ class UserMobileTestsView(viewsets.ReadOnlyModelViewSet):
     """
     lookup_field = "test_id"
     serializer_class = NtcMobileResultsSerializer
+    pagination_class = LimitCursorPagination
     permission_classes = (permissions.IsAuthenticated, )
     authentication_classes = (TokenAuthentication, )
 
     def get_queryset(self):
         if self.action == "list":
             if self.request.user.is_superuser:
-                return NTCSpeedTest.objects.all()
+                return NTCSpeedTest.objects.order_by("-date_created")
             elif self.request.user.is_staff:
                 return NTCSpeedTest.objects.filter(
-                    tester__agency=self.request.user.employee_set.office)
+                    tester__office=self.request.user.agent.office).order_by(
+                        "-date_created")
             return self.request.user.agent.ntcspeedtest_set.all().order_by("-date_created")
 
     def retrieve(self, request, *args, **kwargs):
         """List results from field tester"""
         lookup_field = self.kwargs["test_id"]
-        try:
-            instance = NTCSpeedTest.objects.get(
-                    test_id=lookup_field)
-        except NTCSpeedTest.DoesNotExist:
+        data = compiled.first(
+            self.get_serializer_class(),
+            NTCSpeedTest.objects.filter(test_id=lookup_field),
+            self.get_serializer_context())
+        if data is None:
             raise NotFound("No result was found.")
-
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return Response(data)
 
 
 # class RetrieveUserMobileResultDetail(generics.RetrieveAPIView):
@@ -163,7 +287,7 @@ class UserMobileTestsView(viewsets.ReadOnlyModelViewSet):
 #         return get_object_or_404(NTCSpeedTest, test_id=lookup_field)
 
 
-class MobileDeviceView(viewsets.ModelViewSet):
+class MobileDeviceView(EagerLoadingMixin, viewsets.ModelViewSet):
     """
     Create, List, Retrieve, Update Mobile Devices
     Admin: Full
@@ -172,6 +296,7 @@ class MobileDeviceView(viewsets.ModelViewSet):
     """""
     permission_classes = (custom_permission.IsAdminFull,)
     authentication_classes = (TokenAuthentication, )
+    pagination_class = NamePagination
 
     def get_queryset(self):
         if self.action == "create":
@@ -239,6 +364,7 @@ class MobileDeviceView(viewsets.ModelViewSet):
         serializer = self.get_serializer(device, data=request.data)
         if serializer.is_valid(raise_exception=serializer.error_messages):
             serializer.save()
+            identity.invalidate()
             return Response(data=serializer.data, status=status.HTTP_200_OK)
 
     @action(methods=["POST"], detail=False, url_path='link')
@@ -258,6 +384,7 @@ class MobileDeviceView(viewsets.ModelViewSet):
 
 class ListUserMobileDevices(generics.ListAPIView):
     serializer_class = MobileDeviceSerializer
+    pagination_class = NamePagination
     permission_classes = (permissions.IsAuthenticated, )
     authentication_classes = (TokenAuthentication, )
 
@@ -281,17 +408,23 @@ search_csv = ''
 
 @extend_schema_view(
     get=extend_schema(description='Mobile Datatable (Ignore)',
-                      responses=MobileResultsListSerializer),
+                      responses=MobileResultsListSerializer,
+                      parameters=[OpenApiParameter(
+                          'cursor', str,
+                          description='Opt into keyset pagination, '
+                                      'empty for the first page then the '
+                                      'next/previous cursor of the response '
+                                      'instead of start')]),
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def MobileResultsList(request):
     if request.method == 'GET':
         global search_csv, column_order, dir_order, starttable, lengthtable
-        mobileresults = NTCSpeedTest.objects.filter(tester__agency=request.user.employee.office)
-        total = NTCSpeedTest.objects.all().count()
+        region = request.user.agent.office.region.region
+        mobileresults = MobileResultFlat.objects.filter(region=region)
         draw = request.query_params.get('draw')
-        start = int(request.query_params.get('start'))
+        start = int(request.query_params.get('start') or 0)
         length = int(request.query_params.get('length'))
         isp = request.query_params.get('isp')
         search_query = request.GET.get('search[value]')
@@ -300,8 +433,8 @@ def MobileResultsList(request):
         barangay = request.query_params.get('barangay')
         order_column = request.GET.get('order[0][column]')
         order = request.GET.get('order[0][dir]')
-        minDate = parse_date(request.query_params.get('minDate'))
-        maxDate = parse_date(request.query_params.get('maxDate'))
+        minDate = parse_date(request.query_params.get('minDate') or '')
+        maxDate = parse_date(request.query_params.get('maxDate') or '')
         search_csv = search_query
         column_order = order_column
         dir_order = order
@@ -314,35 +447,33 @@ def MobileResultsList(request):
             order_column = '-' + order_column
         print(draw)
 
-        if search_query:
-            mobileresults = mobileresults.filter(Q(test_id__icontains=search_query))
-
-        if minDate:
-            mobileresults = mobileresults.filter(date_created__range=(minDate,
-                                                 date.today() + datetime.timedelta(days=1)))
-        if minDate and maxDate:
-            mobileresults = mobileresults.filter(date_created__range=(minDate,
-                                                 maxDate + datetime.timedelta(days=1)))
-        if isp:
-            mobileresults = mobileresults.filter(Q(result__operator__icontains=isp))
-
-        if province:
-            mobileresults = mobileresults.filter(Q(location__province__icontains=province))
-
-        if municipality:
-            mobileresults = mobileresults.filter(Q(location__municipality__icontains=municipality))
-
-        if barangay:
-            mobileresults = mobileresults.filter(Q(location__barangay__icontains=barangay))
-        total = mobileresults.count()
-        mobileresults = mobileresults.order_by(order_column)[start:start+length]
-        serializer = MobileResultsListSerializer(mobileresults, many=True)
+        mobileresults = filter_results(
+            mobileresults, isp=isp, province=province,
+            municipality=municipality, barangay=barangay,
+            min_date=minDate, max_date=maxDate, search=search_query,
+            lookups=FLAT_LOOKUPS)
+        total = counts.count(
+            mobileresults, region=region, isp=isp, province=province,
+            municipality=municipality, barangay=barangay, min_date=minDate,
+            max_date=maxDate, search=search_query)
         response = {
             'draw': draw,
             'recordsTotal': total,
             'recordsFiltered': total,
-            'data': serializer.data,
         }
+        if 'cursor' in request.query_params:
+            # Same direction mapping as order_column above
+            paginator = KeysetPaginator(descending=order == 'asc')
+            page = paginator.paginate(
+                mobileresults.only('id', 'date_created'),
+                request.query_params['cursor'], length)
+            ids = [row.pk for row in page]
+            response.update(next=paginator.next, previous=paginator.previous)
+        else:
+            ids = list(mobileresults.order_by(order_column).values_list(
+                'id', flat=True)[start:start+length])
+        response['data'] = compiled.data_in_order(
+            MobileResultsListSerializer, ids)
         return Response(response, status=status.HTTP_200_OK)
 
 
@@ -355,78 +486,74 @@ class MyUserRenderer (r.CSVRenderer):
               'municipality', 'barangay']
 
 
+# CSV column -> mobile_result_flat column
+CSV_FIELDS = {
+    'date_created': 'date_created',
+    'test_id': 'test_id',
+    'tester_email': 'tester_email',
+    'tester_first_name': 'tester_first_name',
+    'tester_last_name': 'tester_last_name',
+    'ntc_region': 'region',
+    'lat': 'lat',
+    'lon': 'lon',
+    'province': 'province',
+    'municipality': 'municipality',
+    'barangay': 'barangay',
+    'td_android_version': 'td_android_version',
+    'td_imei': 'td_imei',
+    'td_phone_model': 'td_phone_model',
+    'download': 'download',
+    'upload': 'upload',
+    'ping': 'ping',
+    'jitter': 'jitter',
+    'mcc': 'mcc',
+    'mnc': 'mnc',
+    'tac': 'tac',
+    'network_type': 'network_type',
+    'operator': 'operator',
+    'rssi': 'rssi',
+    'signal_quality': 'signal_quality',
+    'ssid': 'ssid',
+    'bssid': 'bssid',
+}
+
+
 class MobileResultCSV(APIView):
+    """
+    Export Mobile Results as CSV, or typed Parquet/Arrow IPC files
+    with ?format=parquet / ?format=arrow.
+    Rows are read from mobile_result_flat and streamed from a
+    server-side cursor so memory stays constant regardless of the
+    number of matching results.
+    """
     serializer_class = NtcMobileResultsSerializer
-    renderer_classes = (MyUserRenderer,)
+    renderer_classes = (MyUserRenderer, ParquetRenderer, ArrowRenderer)
     header = ['date_created', 'test_id', 'tester_email']
 
-    def get(self, request):
-        global search_csv
-        isp = request.query_params.get('isp')
-        province = request.query_params.get('province')
-        municipality = request.query_params.get('municipality')
-        minDate = parse_date(request.query_params.get('mindate'))
-        maxDate = parse_date(request.query_params.get('maxdate'))
-        barangay = request.query_params.get('barangay')
+    def get_queryset(self, request):
         region = request.query_params.get('region')
-        response = NTCSpeedTest.objects.filter(tester__agency=region).order_by('-date_created')
-        # if column_order == '0':
-        #     column_order = "date_created"
-        # if dir_order == 'asc':
-        #     column_order = '-' + column_order
-
-        if isp:
-            response = response.filter(Q(result__operator__icontains=isp))
-
-        if minDate:
-            response = response.filter(date_created__range=(minDate,
-                                       date.today() + datetime.timedelta(days=1)))
-        if minDate and maxDate:
-            response = response.filter(date_created__range=(minDate,
-                                       maxDate + datetime.timedelta(days=1)))
-        if isp:
-            response = response.filter(Q(result__operator__icontains=isp))
-        if province:
-            response = response.filter(Q(location__province__icontains=province))
-
-        if municipality:
-            response = response.filter(Q(location__municipality__icontains=municipality))
-
-        if barangay:
-            response = response.filter(Q(location__barangay__icontains=barangay))
-
-        if search_csv:
-            response = response.filter(Q(test_id__icontains=search_csv))
-
-        # response = response.order_by(column_order)[starttable:starttable+lengthtable]
-
-        content = [{'date_created': timezone.localtime(response.date_created).strftime('%Y-%m-%d %I:%M%p '),
-                    'test_id': response.test_id,
-                    'tester_email': response.tester.email,
-                    'tester_first_name': response.tester.first_name,
-                    'tester_last_name': response.tester.last_name,
-                    'ntc_region': response.tester.office.region,
-                    'lat': response.location.lat,
-                    'lon': response.location.lon,
-                    'province': response.location.province,
-                    'municipality': response.location.municipality,
-                    'barangay': response.location.barangay,
-                    'td_android_version': response.test_device.android_version,
-                    'td_imei': response.test_device.imei,
-                    'td_phone_model': response.test_device.phone_model,
-                    'download': response.result.download,
-                    'upload': response.result.upload,
-                    'ping': response.result.ping,
-                    'jitter': response.result.jitter,
-                    'mcc': response.result.mcc,
-                    'mnc': response.result.mnc,
-                    'tac': response.result.tac,
-                    'network_type': response.result.network_type,
-                    'operator': response.result.operator,
-                    'rssi': response.result.rssi,
-                    'signal_quality': response.result.signal_quality,
-                    'ssid': response.result.ssid,
-                    'bssid': response.result.bssid,
-                    }
-                   for response in response]
-        return Response(content)
+        queryset = MobileResultFlat.objects.filter(
+            region=region).order_by('-date_created')
+        return filter_results(
+            queryset,
+            isp=request.query_params.get('isp'),
+            province=request.query_params.get('province'),
+            municipality=request.query_params.get('municipality'),
+            barangay=request.query_params.get('barangay'),
+            min_date=parse_date(request.query_params.get('mindate') or ''),
+            max_date=parse_date(request.query_params.get('maxdate') or ''),
+            search=search_csv,
+            lookups=FLAT_LOOKUPS)
+
+    def get(self, request):
+        fmt = request.accepted_renderer.format
+        if fmt in COLUMNAR_FORMATS:
+            columns = export_columns(CSV_FIELDS, MobileResultFlat)
+            return stream_columnar(self.get_queryset(request), columns,
+                                   'mobile_results', fmt)
+        header = MyUserRenderer.header
+        rows = iter_rows(self.get_queryset(request),
+                         [CSV_FIELDS[column] for column in header])
+        rows = localize_dates(rows, header.index('date_created'))
+        return stream_csv(header, rows, 'mobile_results.csv',
+                          compress=accepts_gzip(request))
@@ -32,7 +32,7 @@ class RfcDeviceSerializer(serializers.ModelSerializer):
 
 class RfcTestSerializer(serializers.ModelSerializer):
     """Serializer for RFC Tests"""
-    tester = UserSerializer(read_only=True)
+    tester = UserSerializer(source='tester.agent', read_only=True)
     test_device = RfcDeviceSerializer(read_only=True)
     result = Rfc6349ResultSerializer(read_only=True)
     location = LocationSerializer(read_only=True)
@@ -42,11 +42,13 @@ class RfcTestSerializer(serializers.ModelSerializer):
         fields = ["id", "date_created",
                   "tester", "test_id",
                   "result", "location",
+                  "enrichment",
                   "test_device", "client_ip"]
         read_only_fields = (
             'id',
             'date_created',
             'test_id',
+            "enrichment",
             "client_ip"
         )
 
@@ -1,3 +1,6 @@
+import gzip
+
+import pyarrow as pa
 import pytest
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -69,6 +72,13 @@ class TestUserCreateResultAPI(
         outcome = json.keys()
         assert expected in outcome
 
+    def test_result_queued_for_enrichment(self, json):
+        """Test that location linking is left to the enrichment worker"""
+        test = models.RfcTest.objects.get(result__test_id=json["test_id"])
+        assert test.enrichment == "pending"
+        assert models.EnrichmentJob.objects.filter(
+            kind="rfc", object_id=test.id).exists()
+
     # def test_create_result_anonymous_failure(self):
     #     """Test that unauthenticated user can't post results"""
     #     res = self.client.post(LIST_CREATE_RFCRESULT_URL, self.data)
@@ -85,6 +95,38 @@ class TestUserCreateResultAPI(
         assert expected in outcome
 
 
+class TestUserCreateResultBatchAPI(
+    APIViewTest,
+    UsesPostMethod,
+    Returns201,
+    AsUser('user')
+):
+    """Test RFC6349 session batch submission"""
+
+    url = lambda_fixture(lambda: reverse("rfc6349:result-batch"))
+
+    @pytest.fixture
+    def data(self, rfc_result):
+        return [rfc_result, dict(rfc_result, direction="reverse")]
+
+    @pytest.fixture
+    def client(self, unauthed_client, user, agent, durin_client,
+               rfc_device_details):
+        models.RfcDevice.objects.create(**rfc_device_details)
+        obj = AuthToken.objects.create(client=durin_client, user=user)
+        client = APIClient()
+        client.default_format = "json"
+        client.credentials(HTTP_AUTHORIZATION="Token " + obj.token)
+        return client
+
+    def test_session_saved_together(self, json, user):
+        """Test that every result of the session gets its test row"""
+        outcome = sorted(item["direction"] for item in json)
+        assert outcome == ["forward", "reverse"]
+        assert models.RfcTest.objects.filter(
+            tester__agent=user, enrichment="pending").count() == 2
+
+
 class TestAdminCreateRfcDeviceAPI(
     APIViewTest,
     Returns201,
@@ -119,3 +161,47 @@ class TestAdminListDevices(
     def test_list_device_success(self, rfc_device, json):
         """Test that Admin can list all registered devices"""
         assert len(json) > 0
+
+
+@pytest.mark.django_db
+def test_result_csv_is_gzip_streamed(user, agent, durin_client,
+                                     rfc_device_details, rfc_result):
+    """Test that the CSV export is streamed gzipped on request"""
+    models.RfcDevice.objects.create(**rfc_device_details)
+    obj = AuthToken.objects.create(client=durin_client, user=user)
+    client = APIClient()
+    client.default_format = "json"
+    client.credentials(HTTP_AUTHORIZATION="Token " + obj.token)
+    client.post(reverse("rfc6349:result-batch"),
+                [rfc_result, dict(rfc_result, direction="reverse")])
+
+    res = client.get(reverse("rfc6349:csv"),
+                     {"region": agent.office.region.region},
+                     HTTP_ACCEPT_ENCODING="gzip")
+    assert res.streaming
+    assert res["Content-Encoding"] == "gzip"
+    rows = gzip.decompress(b"".join(res.streaming_content))
+    rows = rows.decode().splitlines()
+    assert rows[0].startswith("date_created,test_id,tester_email")
+    assert len(rows) == 3
+
+
+@pytest.mark.django_db
+def test_result_arrow_export(user, agent, durin_client, rfc_device_details,
+                             rfc_result):
+    """Test that the RFC6349 export has typed result columns"""
+    models.RfcDevice.objects.create(**rfc_device_details)
+    obj = AuthToken.objects.create(client=durin_client, user=user)
+    client = APIClient()
+    client.default_format = "json"
+    client.credentials(HTTP_AUTHORIZATION="Token " + obj.token)
+    client.post(reverse("rfc6349:result-batch"), [rfc_result])
+
+    res = client.get(reverse("rfc6349:csv"), {
+        "region": agent.office.region.region,
+        "format": "arrow",
+    })
+    table = pa.ipc.open_stream(b"".join(res.streaming_content)).read_all()
+    assert table.num_rows == 1
+    assert table.schema.field("mtu").type == pa.int64()
+    assert "result_test_id" in table.column_names
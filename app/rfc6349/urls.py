@@ -27,6 +27,8 @@ router.register(
 router.register(r"ntc", views.AdminRfcTestsView, basename="rfc-tests")
 urlpatterns = [
     path("result/", views.Rfc6349ResView.as_view(), name="result"),
+    path("result/batch/", views.Rfc6349BatchView.as_view(),
+         name="result-batch"),
     path("result/datatable", views.RFC6349ResultsList, name="resulttable"),
     path("result/csv", views.RFC6349ResultCSV.as_view(), name="csv"),
 
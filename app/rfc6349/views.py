@@ -1,9 +1,6 @@
-from datetime import date
-import datetime
-
+from django.conf import settings
 from django.utils.dateparse import parse_date
-from django.db.models import Q
-from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import (
@@ -15,6 +12,7 @@ from rest_framework import (
 from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework_csv import renderers as r
 from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
@@ -28,14 +26,34 @@ from drf_spectacular.utils import (
     extend_schema_view
 )
 
+from core import compiled, counts, enrichment, flat, identity
 from core.utils import get_client_ip
+from core.parsers import NDJSONParser
+from core.export import (
+    COLUMNAR_FORMATS,
+    accepts_gzip,
+    export_columns,
+    iter_rows,
+    localize_dates,
+    stream_columnar,
+    stream_csv,
+)
+from core.compiled import CompiledListMixin
+from core.eager import EagerLoadingMixin
+from core.renderers import ArrowRenderer, ParquetRenderer
+from core.filters import FLAT_LOOKUPS, filter_results
+from core.pagination import (
+    IdPagination,
+    KeysetPaginator,
+    LimitCursorPagination,
+)
 
 from core.models import (
     RfcResult,
     RfcDevice,
     RfcTest,
-    User,
-    Location)
+    RfcResultFlat,
+    User)
 from rfc6349.serializers import (
     Rfc6349ResultSerializer,
     RfcDeviceSerializer,
@@ -44,7 +62,6 @@ from rfc6349.serializers import (
 )
 
 from core.utils import Gis
-from django.utils import timezone
 
 
 class ResultLocation(Gis):
@@ -56,14 +73,21 @@ class ResultLocation(Gis):
         return self.get_location()
 
 
-class Rfc6349ResView(generics.ListCreateAPIView):
+class Rfc6349ResView(CompiledListMixin, EagerLoadingMixin,
+                     generics.ListCreateAPIView):
     """
     Listing and Creating RFC 6349 app results
     Delete nor Update is not allowed
     """
     serializer_class = Rfc6349ResultSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (identity.IdentityTokenAuthentication,)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = LimitCursorPagination
+
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return RfcTestSerializer
+        return Rfc6349ResultSerializer
 
     def get_queryset(self):
         if self.request.method == "POST":
@@ -74,34 +98,72 @@ class Rfc6349ResView(generics.ListCreateAPIView):
                 return RfcTest.objects.all().order_by('-date_created')
             elif self.request.user.is_staff:
                 return RfcTest.objects.filter(
-                    tester__office=self.request.user.agent.office)
+                    tester__office=self.request.user.agent.office).order_by(
+                        '-date_created')
             return self.request.user.agent.rfctest_set.all().order_by(
                 '-date_created')
 
     def perform_create(self, serializer):
-        try:
-            device = RfcDevice.objects.get(
-                client__auth_token_set__token__exact=self.request.auth
+        owner = identity.of(self.request)
+        if owner is None or owner.rfc_device is None or owner.agent is None:
+            raise Http404("No RFC 6349 device for this token.")
+        if self.request.data.get('lat') is None or \
+                self.request.data.get('lon') is None:
+            raise ValidationError("lat and lon are required.")
+        with transaction.atomic():
+            obj = serializer.save()
+            test = RfcTest.objects.create(
+                result=obj,
+                tester=owner.agent,
+                test_device=owner.rfc_device,
+                client_ip=get_client_ip(self.request),
+                enrichment=enrichment.PENDING
             )
-        except RfcDevice.DoesNotExist as e:
-            raise Http404(e)
-        obj = serializer.save()
-        lat = float(self.request.data.get('lat'))
-        lon = float(self.request.data.get('lon'))
-        if lat is None or lon is None:
+            enrichment.submit(test)
+
+
+class Rfc6349BatchView(generics.GenericAPIView):
+    """
+    Submit all RFC 6349 results of a test session in one request
+    Accepts a JSON array or an NDJSON stream of results, all of them
+    are saved or none are.
+    """
+    serializer_class = Rfc6349ResultSerializer
+    authentication_classes = (identity.IdentityTokenAuthentication,)
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = (JSONParser, NDJSONParser)
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError("Expected a list of results.")
+        if len(items) > settings.RESULT_BATCH_MAX_SIZE:
+            raise ValidationError("At most %s results per batch." %
+                                  settings.RESULT_BATCH_MAX_SIZE)
+        if any(not isinstance(item, dict) or item.get('lat') is None or
+               item.get('lon') is None for item in items):
             raise ValidationError("lat and lon are required.")
-        loc = Gis.find_location(lat, lon)
-        if loc is None:
-            raise ValidationError("No Location found!")
-        loc = Location.objects.create(**loc)
-        ip = get_client_ip(self.request)
-        RfcTest.objects.create(
-            result_id=obj.id,
-            tester=self.request.user.agent,
-            test_device=device,
-            location=loc,
-            client_ip=ip
-        )
+        owner = identity.of(request)
+        if owner.rfc_device is None or owner.agent is None:
+            raise Http404("No RFC 6349 device for this token.")
+        serializer = self.get_serializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        ip = get_client_ip(request)
+        with transaction.atomic():
+            results = RfcResult.objects.bulk_create([
+                RfcResult(**data) for data in serializer.validated_data])
+            tests = RfcTest.objects.bulk_create([
+                RfcTest(
+                    result=obj,
+                    tester=owner.agent,
+                    test_device=owner.rfc_device,
+                    client_ip=ip,
+                    enrichment=enrichment.PENDING)
+                for obj in results])
+            enrichment.submit_many(tests)
+            flat.sync_tests(tests)
+        return Response(self.get_serializer(results, many=True).data,
+                        status=status.HTTP_201_CREATED)
 
 
 class RfcDeviceView(viewsets.ModelViewSet):
@@ -110,6 +172,7 @@ class RfcDeviceView(viewsets.ModelViewSet):
     """
     authentication_classes = (TokenAuthentication,)
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = IdPagination
 
     def get_serializer_class(self):
         if self.action in ("create", "list"):
@@ -136,7 +199,8 @@ class RfcDeviceView(viewsets.ModelViewSet):
         serializer.save(client=client)
 
 
-class AdminRfcTestsView(viewsets.ReadOnlyModelViewSet):
+class AdminRfcTestsView(CompiledListMixin, EagerLoadingMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """
     View for Staff User
     Staffs can only list results from his/her region
@@ -146,30 +210,30 @@ class AdminRfcTestsView(viewsets.ReadOnlyModelViewSet):
     lookup_field = "test_id"
     serializer_class = RfcTestSerializer
     permission_classes = (permissions.IsAdminUser, )
+    pagination_class = LimitCursorPagination
     authentication_classes = (TokenAuthentication, )
 
     def get_queryset(self):
-        user = get_user_model().objects.get(email=self.request.user)
         return RfcTest.objects.filter(
-            tester__ntc_region=user.nro.region)
+            tester__office=self.request.user.agent.office)
 
     def retrieve(self, request, *args, **kwargs):
         """List results from field tester"""
         lookup_field = self.kwargs["test_id"]
-        print(lookup_field)
-        user = get_object_or_404(RfcTest, test_id=lookup_field)
-        serializer = RfcTestSerializer(user)
-        return Response(serializer.data)
+        data = compiled.first(
+            RfcTestSerializer, RfcTest.objects.filter(test_id=lookup_field))
+        if data is None:
+            raise Http404
+        return Response(data)
 
     def list(self, request, *args, **kwargs):
         """List all results from staff's regions"""
-        queryset = self.get_queryset().order_by("-timestamp")
-        serializer = RfcTestSerializer(
-            queryset, many=True)
-        return Response(serializer.data)
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.list_compiled(RfcTestSerializer, queryset)
 
 
-class UserRFC6349TestsView(viewsets.ReadOnlyModelViewSet):
+class UserRFC6349TestsView(CompiledListMixin, EagerLoadingMixin,
+                           viewsets.ReadOnlyModelViewSet):
     """
     View for Field Tester aka User
     FT can only retrieve his/her tests
@@ -178,18 +242,20 @@ class UserRFC6349TestsView(viewsets.ReadOnlyModelViewSet):
     lookup_field = "test_id"
     serializer_class = RfcTestSerializer
     permission_classes = (permissions.IsAuthenticated, )
+    pagination_class = LimitCursorPagination
     authentication_classes = (TokenAuthentication, )
 
     def get_queryset(self):
         return RfcTest.objects.filter(
-            tester__email=self.request.user)
+            tester__agent=self.request.user)
 
     def retrieve(self, request, *args, **kwargs):
         lookup_field = self.kwargs["test_id"]
-        print(lookup_field)
-        user = get_object_or_404(RfcTest, test_id=lookup_field)
-        serializer = RfcTestSerializer(user)
-        return Response(serializer.data)
+        data = compiled.first(
+            RfcTestSerializer, RfcTest.objects.filter(test_id=lookup_field))
+        if data is None:
+            raise Http404
+        return Response(data)
 
 
 class UserRFC6349DeviceView(viewsets.ReadOnlyModelViewSet):
@@ -200,6 +266,7 @@ class UserRFC6349DeviceView(viewsets.ReadOnlyModelViewSet):
     """
     lookup_field = "id"
     serializer_class = RfcDeviceSerializer
+    pagination_class = IdPagination
     permission_classes = (permissions.IsAuthenticated, )
     authentication_classes = (TokenAuthentication, )
 
@@ -218,28 +285,33 @@ class UserRFC6349DeviceView(viewsets.ReadOnlyModelViewSet):
 search_csv = ''
 
 @extend_schema_view(
-    get=extend_schema(description='Fetch All RFC6349 Results for Staff Region Datatable ONLY (Ignore)'),
+    get=extend_schema(description='Fetch All RFC6349 Results for Staff Region Datatable ONLY (Ignore)',
+                      parameters=[OpenApiParameter(
+                          'cursor', str,
+                          description='Opt into keyset pagination, '
+                                      'empty for the first page then the '
+                                      'next/previous cursor of the response '
+                                      'instead of start')]),
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def RFC6349ResultsList(request):
     if request.method == 'GET':
-        rfcresults = RfcTest.objects.filter(
-            tester__nro__region=request.user.nro.region).order_by("-date_created")
+        region = request.user.agent.office.region.region
+        rfcresults = RfcResultFlat.objects.filter(
+            region=region).order_by("-date_created")
         global search_csv 
-        total = RfcTest.objects.all().count()
         draw = request.query_params.get('draw')
-        start = int(request.query_params.get('start'))
+        start = int(request.query_params.get('start') or 0)
         length = int(request.query_params.get('length'))
-        isp = request.query_params.get('isp')
         search_query = request.GET.get('search[value]')
         province = request.query_params.get('province')
         municipality = request.query_params.get('municipality')
         barangay = request.query_params.get('barangay')
         order_column = request.GET.get('order[0][column]')
         order = request.GET.get('order[0][dir]')
-        minDate = parse_date(request.query_params.get('minDate'))
-        maxDate = parse_date(request.query_params.get('maxDate'))
+        minDate = parse_date(request.query_params.get('minDate') or '')
+        maxDate = parse_date(request.query_params.get('maxDate') or '')
         search_csv = search_query
         column_order = order_column
         dir_order = order
@@ -251,113 +323,109 @@ def RFC6349ResultsList(request):
         if order == 'asc':
             order_column = '-' + order_column
         print(draw)
-        if search_query:
-            rfcresults = rfcresults.filter(Q(test_id__icontains=search_query))
-
-        if minDate:
-            rfcresults = rfcresults.filter(date_created__range=(minDate, date.today() + datetime.timedelta(days=1)))
-
-        if minDate and maxDate:
-            rfcresults = rfcresults.filter(date_created__range=(minDate, maxDate + datetime.timedelta(days=1)))
-
-        if isp:
-            rfcresults = rfcresults.filter(Q(result__operator__icontains=isp))
-
-        if province:
-            rfcresults = rfcresults.filter(Q(location__province__icontains=province))
-
-        if municipality:
-            rfcresults = rfcresults.filter(Q(location__municipality__icontains=municipality))
-
-        if barangay:
-            rfcresults = rfcresults.filter(Q(location__barangay__icontains=barangay))
-        total = rfcresults.count()
-        rfcresults = rfcresults.order_by(order_column)[start:start+length]
-        serializer = RfcTestSerializer(rfcresults, many=True)
+        # RfcResult has no operator, the isp filter doesn't apply here
+        rfcresults = filter_results(
+            rfcresults, province=province, municipality=municipality,
+            barangay=barangay, min_date=minDate, max_date=maxDate,
+            search=search_query, lookups=FLAT_LOOKUPS)
+        total = counts.count(
+            rfcresults, region=region, province=province,
+            municipality=municipality, barangay=barangay, min_date=minDate,
+            max_date=maxDate, search=search_query)
         response = {
             'draw': draw,
             'recordsTotal': total,
             'recordsFiltered': total,
-            'data': serializer.data,
         }
+        if 'cursor' in request.query_params:
+            # Same direction mapping as order_column above
+            paginator = KeysetPaginator(descending=order == 'asc')
+            page = paginator.paginate(
+                rfcresults.only('id', 'date_created'),
+                request.query_params['cursor'], length)
+            ids = [row.pk for row in page]
+            response.update(next=paginator.next, previous=paginator.previous)
+        else:
+            ids = list(rfcresults.order_by(order_column).values_list(
+                'id', flat=True)[start:start+length])
+        response['data'] = compiled.data_in_order(RfcTestSerializer, ids)
         return Response(response, status=status.HTTP_200_OK)
 
 
 class MyUserRenderer (r.CSVRenderer):
     header = ['date_created', 'test_id', 'tester_email', 'tester_first_name', 'tester_last_name', 'ntc_region', 'lat', 'lon', 'province', 'municipality',
-              'barangay', 'direction',' mtu', 'rtt', 'bb', 'bdp', 'rwnd', 'actual_thpt', 'max_achievable_thpt', 'tx_bytes', 'ave_rtt',
+              'barangay', 'direction', 'mtu', 'rtt', 'bb', 'bdp', 'rwnd', 'actual_thpt', 'max_achievable_thpt', 'tx_bytes', 'ave_rtt',
               'rwnd', 'retransmit_bytes', 'ideal_transfer_time', 'transfer_time_ratio', 'tcp_efficiency', 'buffer_delay']
 
 
+# CSV column -> rfc_result_flat column
+CSV_FIELDS = {
+    'date_created': 'date_created',
+    'test_id': 'test_id',
+    'tester_email': 'tester_email',
+    'tester_first_name': 'tester_first_name',
+    'tester_last_name': 'tester_last_name',
+    'ntc_region': 'region',
+    'lat': 'lat',
+    'lon': 'lon',
+    'province': 'province',
+    'municipality': 'municipality',
+    'barangay': 'barangay',
+    'direction': 'direction',
+    'mtu': 'mtu',
+    'rtt': 'rtt',
+    'bb': 'bb',
+    'bdp': 'bdp',
+    'rwnd': 'rwnd',
+    'actual_thpt': 'actual_thpt',
+    'max_achievable_thpt': 'max_achievable_thpt',
+    'tx_bytes': 'tx_bytes',
+    'ave_rtt': 'ave_rtt',
+    'retransmit_bytes': 'retransmit_bytes',
+    'acutal_transfer_time': 'acutal_transfer_time',
+    'ideal_transfer_time': 'ideal_transfer_time',
+    'transfer_time_ratio': 'transfer_time_ratio',
+    'tcp_efficiency': 'tcp_efficiency',
+    'buffer_delay': 'buffer_delay',
+}
+
+
 class RFC6349ResultCSV(APIView):
+    """
+    Export RFC6349 Results as CSV, or typed Parquet/Arrow IPC files
+    with ?format=parquet / ?format=arrow.
+    Rows are read from rfc_result_flat and streamed from a
+    server-side cursor so memory stays constant regardless of the
+    number of matching results.
+    """
     serializer_class = RfcTestSerializer
-    renderer_classes = (MyUserRenderer,)
+    renderer_classes = (MyUserRenderer, ParquetRenderer, ArrowRenderer)
     header = ['date_created', 'test_id', 'tester_email']
 
-    def get(self, request):
-        global search_csv
-        isp = request.query_params.get('isp')
-        search_query = request.GET.get('search[value]')
-        province = request.query_params.get('province')
-        municipality = request.query_params.get('municipality')
-        minDate = parse_date(request.query_params.get('mindate'))
-        maxDate = parse_date(request.query_params.get('maxdate'))
-        barangay = request.query_params.get('barangay')
+    def get_queryset(self, request):
         region = request.query_params.get('region')
+        queryset = RfcResultFlat.objects.filter(
+            region=region).order_by('-date_created')
+        # RfcResult has no operator, the isp filter doesn't apply here
+        return filter_results(
+            queryset,
+            province=request.query_params.get('province'),
+            municipality=request.query_params.get('municipality'),
+            barangay=request.query_params.get('barangay'),
+            min_date=parse_date(request.query_params.get('mindate') or ''),
+            max_date=parse_date(request.query_params.get('maxdate') or ''),
+            search=search_csv,
+            lookups=FLAT_LOOKUPS)
 
-        # if column_order == '0':
-        #     column_order = "date_created"
-        # if dir_order == 'asc':
-        #     column_order = '-' + column_order
-
-        res = RfcTest.objects.filter(tester__nro__region=region).filter().order_by('-date_created')
-        if isp:
-            res = res.filter(Q(result__operator__icontains=isp))
-        if minDate:
-            res = res.filter(date_created__range=(minDate, date.today() + datetime.timedelta(days=1)))
-        if minDate and maxDate:
-            res = res.filter(date_created__range=(minDate, maxDate + datetime.timedelta(days=1)))
-
-        if isp:
-            res = res.filter(Q(result__operator__icontains=isp))
-        if province:
-            res = res.filter(Q(location__province__icontains=province))
-        if municipality:
-            res = res.filter(Q(location__municipality__icontains=municipality))
-        if barangay:
-            res = res.filter(Q(location__barangay__icontains=barangay))
-        if search_csv:
-            res = res.filter(Q(test_id__icontains=search_csv))
-
-        # res = res.order_by(column_order)[starttable:starttable+lengthtable]
-
-        content = [{'date_created': timezone.localtime(response.date_created).strftime('%Y-%m-%d %I:%M%p '),
-                    'test_id': response.test_id,
-                    'tester_email': response.tester.email,
-                    'tester_first_name': response.tester.first_name,
-                    'tester_last_name': response.tester.last_name,
-                    'ntc_region': response.tester.nro.region,
-                    'lat': response.location.lat,
-                    'lon': response.location.lon,
-                    'province': response.location.province,
-                    'municipality': response.location.municipality,
-                    'barangay': response.location.barangay,
-                    'direction': response.result.direction,
-                    'mtu': response.result.mtu,
-                    'rtt': response.result.rtt,
-                    'bb': response.result.bb,
-                    'bdp': response.result.bdp,
-                    'rwnd': response.result.rwnd,
-                    'actual_thpt': response.result.actual_thpt,
-                    'max_achievable_thpt': response.result.max_achievable_thpt,
-                    'tx_bytes': response.result.tx_bytes,
-                    'ave_rtt': response.result.ave_rtt,
-                    'retransmit_bytes': response.result.retransmit_bytes,
-                    'acutal_transfer_time': response.result.acutal_transfer_time,
-                    'ideal_transfer_time': response.result.ideal_transfer_time,
-                    'transfer_time_ratio': response.result.transfer_time_ratio,
-                    'tcp_efficiency': response.result.tcp_efficiency,
-                    'buffer_delay': response.result.buffer_delay,
-                    }
-                   for response in res]
-        return Response(content)
+    def get(self, request):
+        fmt = request.accepted_renderer.format
+        if fmt in COLUMNAR_FORMATS:
+            columns = export_columns(CSV_FIELDS, RfcResultFlat)
+            return stream_columnar(self.get_queryset(request), columns,
+                                   'rfc6349_results', fmt)
+        header = MyUserRenderer.header
+        rows = iter_rows(self.get_queryset(request),
+                         [CSV_FIELDS[column] for column in header])
+        rows = localize_dates(rows, header.index('date_created'))
+        return stream_csv(header, rows, 'rfc6349_results.csv',
+                          compress=accepts_gzip(request))
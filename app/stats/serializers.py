@@ -0,0 +1,122 @@
+import datetime
+
+from django.utils import timezone
+from rest_framework import serializers
+
+from core import rollups
+from core.choices import enrichment_kind_choices, rollup_granularity_choices
+
+
+def split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class DateRangeSerializer(serializers.Serializer):
+    """Date range, the last 30 days by default"""
+    min_date = serializers.DateField(required=False)
+    max_date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        max_date = data.get('max_date') or timezone.localdate()
+        min_date = data.get('min_date') or max_date - datetime.timedelta(
+            days=30)
+        if min_date > max_date:
+            raise serializers.ValidationError({
+                'min_date': "min_date is after max_date."})
+        data['min_date'], data['max_date'] = min_date, max_date
+        return data
+
+
+class StatsQuerySerializer(DateRangeSerializer):
+    """Query parameters of the stats endpoint"""
+    kind = serializers.ChoiceField(choices=enrichment_kind_choices,
+                                   default='mobile')
+    granularity = serializers.ChoiceField(choices=rollup_granularity_choices,
+                                          default=rollups.DAY)
+    group_by = serializers.CharField(required=False, default='region')
+    metrics = serializers.CharField(required=False)
+    region = serializers.CharField(required=False)
+    operator = serializers.CharField(required=False)
+    network_type = serializers.CharField(required=False)
+    province = serializers.CharField(required=False)
+
+    def validate_group_by(self, value):
+        group_by = split(value)
+        unknown = set(group_by) - set(rollups.KEYS) - {'bucket'}
+        if unknown:
+            raise serializers.ValidationError(
+                "Unknown group: %s." % ', '.join(sorted(unknown)))
+        return group_by
+
+    def validate(self, data):
+        data = super().validate(data)
+        metrics = rollups.KINDS[data['kind']][1]
+        if data.get('metrics'):
+            requested = split(data['metrics'])
+            unknown = set(requested) - set(metrics)
+            if unknown:
+                raise serializers.ValidationError({
+                    'metrics': "Unknown metric: %s." % ', '.join(
+                        sorted(unknown))})
+            metrics = requested
+        data['metrics'] = list(metrics)
+        return data
+
+
+class PercentileQuerySerializer(DateRangeSerializer):
+    """
+    Query parameters of the percentiles endpoint, the region, operator
+    and network_type filters take comma separated values
+    """
+    kind = serializers.ChoiceField(choices=enrichment_kind_choices,
+                                   default='mobile')
+    metric = serializers.CharField(default='download')
+    q = serializers.CharField(default='0.1,0.5,0.9',
+                              help_text="Comma separated quantiles.")
+    group_by = serializers.CharField(required=False, default='')
+    region = serializers.CharField(required=False)
+    operator = serializers.CharField(required=False)
+    network_type = serializers.CharField(required=False)
+
+    def validate_q(self, value):
+        try:
+            quantiles = [float(q) for q in split(value)]
+        except ValueError:
+            raise serializers.ValidationError("Quantiles must be numbers.")
+        if not quantiles or any(not 0 <= q <= 1 for q in quantiles):
+            raise serializers.ValidationError(
+                "Quantiles must be between 0 and 1.")
+        return quantiles
+
+    def validate_group_by(self, value):
+        group_by = split(value)
+        unknown = set(group_by) - set(rollups.SKETCH_KEYS) - {'day'}
+        if unknown:
+            raise serializers.ValidationError(
+                "Unknown group: %s." % ', '.join(sorted(unknown)))
+        return group_by
+
+    def validate(self, data):
+        data = super().validate(data)
+        if data['metric'] not in rollups.KINDS[data['kind']][1]:
+            raise serializers.ValidationError({
+                'metric': "Unknown metric: %s." % data['metric']})
+        data['filters'] = {key: split(data[key])
+                           for key in rollups.SKETCH_KEYS if key in data}
+        return data
+
+
+class CoverageQuerySerializer(DateRangeSerializer):
+    """
+    Query parameters of the coverage tiles, the operator and
+    network_type filters take comma separated values
+    """
+    operator = serializers.CharField(required=False)
+    network_type = serializers.CharField(required=False)
+
+    def validate(self, data):
+        data = super().validate(data)
+        data['filters'] = {key: split(data[key])
+                           for key in ('operator', 'network_type')
+                           if key in data}
+        return data
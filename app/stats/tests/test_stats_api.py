@@ -0,0 +1,125 @@
+import pytest
+
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import coverage, rollups
+from core.models import MobileResult, NTCSpeedTest
+
+
+STATS_URL = reverse("stats:result-stats")
+PERCENTILES_URL = reverse("stats:result-percentiles")
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def client(admin_user, admin_agent, mobile_result, mobile_device):
+    for second, (download, operator) in enumerate(
+            [(10, "Smart"), (20, "Smart"), (60, "Globe")]):
+        NTCSpeedTest.objects.create(
+            tester=admin_agent,
+            result=MobileResult.objects.create(**dict(
+                mobile_result,
+                download=download,
+                operator=operator,
+                timestamp="2022-11-08 02:35:%02d.000Z" % second)),
+            test_device=mobile_device,
+            client_ip="127.0.0.1")
+    rollups.refresh()
+    client = APIClient()
+    client.force_authenticate(user=admin_user)
+    return client
+
+
+def test_stats_per_operator(client):
+    res = client.get(STATS_URL, {"group_by": "operator",
+                                 "metrics": "download"})
+    assert res.status_code == 200
+    results = {row["operator"]: row for row in res.json()["results"]}
+    assert set(results) == {"Globe", "Smart"}
+    smart = results["Smart"]
+    assert smart["count"] == 2
+    assert list(smart["metrics"]) == ["download"]
+    assert smart["metrics"]["download"]["mean"] == 15
+    assert smart["metrics"]["download"]["min"] == 10
+    assert results["Globe"]["metrics"]["download"]["median"] == \
+        pytest.approx(60, rel=0.01)
+
+
+def test_stats_filtered_time_series(client):
+    res = client.get(STATS_URL, {"group_by": "bucket,region",
+                                 "granularity": "hour",
+                                 "operator": "Globe"})
+    [row] = res.json()["results"]
+    assert row["count"] == 1
+    assert "bucket" in row
+    assert set(row["metrics"]) == set(rollups.KINDS["mobile"][1])
+
+
+def test_stats_rejects_unknown_group(client):
+    res = client.get(STATS_URL, {"group_by": "tester"})
+    assert res.status_code == 400
+
+
+def test_stats_requires_admin(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    assert client.get(STATS_URL).status_code == 403
+
+
+def test_percentiles_per_operator(client):
+    res = client.get(PERCENTILES_URL, {"q": "0.5,0.9",
+                                       "group_by": "operator",
+                                       "operator": "Smart,Globe"})
+    assert res.status_code == 200
+    results = {row["operator"]: row for row in res.json()["results"]}
+    assert results["Smart"]["count"] == 2
+    assert set(results["Smart"]["percentiles"]) == {"p50", "p90"}
+    assert results["Globe"]["percentiles"]["p50"] == pytest.approx(
+        60, rel=0.01)
+
+
+def test_percentiles_reject_bad_quantile(client):
+    res = client.get(PERCENTILES_URL, {"q": "0.5,2"})
+    assert res.status_code == 400
+    assert "q" in res.json()
+
+
+def test_coverage_tile_cells(client, mobile_result):
+    x, y = coverage.tile_of(3, mobile_result["lat"], mobile_result["lon"])
+    res = client.get(reverse("stats:coverage-tile", args=(3, x, y)))
+    assert res.status_code == 200
+    data = res.json()
+    assert data["cell_zoom"] == 6
+    [cell] = data["cells"]
+    assert [cell["x"], cell["y"]] == list(coverage.tile_of(
+        6, mobile_result["lat"], mobile_result["lon"]))
+    assert cell["count"] == 3
+    assert cell["download"]["mean"] == 30
+    assert cell["download"]["max"] == 60
+    west, south, east, north = cell["bounds"]
+    assert west <= mobile_result["lon"] <= east
+    assert south <= mobile_result["lat"] <= north
+
+    res = client.get(reverse("stats:coverage-tile", args=(3, x, y)),
+                     {"operator": "Globe"})
+    assert res.json()["cells"][0]["count"] == 1
+
+
+def test_coverage_tile_outside_data_is_empty(client):
+    res = client.get(reverse("stats:coverage-tile", args=(3, 0, 0)))
+    assert res.json()["cells"] == []
+    res = client.get(reverse("stats:coverage-tile", args=(3, 8, 0)))
+    assert res.status_code == 404
+
+
+def test_coverage_vector_tile(client, mobile_result):
+    x, y = coverage.tile_of(12, mobile_result["lat"], mobile_result["lon"])
+    res = client.get(reverse("stats:coverage-tile", args=(12, x, y)),
+                     {"format": "mvt"})
+    assert res.status_code == 200
+    assert res["Content-Type"] == "application/vnd.mapbox-vector-tile"
+    assert res.content.startswith(b"\x1a")
+    assert b"coverage" in res.content
+    assert b"download_mean" in res.content
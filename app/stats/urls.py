@@ -0,0 +1,17 @@
+from django.urls import path
+
+from stats import views
+
+app_name = "stats"
+
+urlpatterns = [
+    path("results/",
+         views.ResultStatsView.as_view(),
+         name="result-stats"),
+    path("results/percentiles/",
+         views.ResultPercentilesView.as_view(),
+         name="result-percentiles"),
+    path("coverage/<int:zoom>/<int:x>/<int:y>/",
+         views.CoverageTileView.as_view(),
+         name="coverage-tile"),
+]
@@ -0,0 +1,112 @@
+import datetime
+
+from django.utils import timezone
+from drf_spectacular.utils import extend_schema
+from rest_framework import permissions
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from durin.auth import TokenAuthentication
+
+from core import coverage, rollups
+from core.renderers import FastJSONRenderer, VectorTileRenderer
+from stats.serializers import (
+    CoverageQuerySerializer,
+    PercentileQuerySerializer,
+    StatsQuerySerializer,
+)
+
+# Deepest web-mercator zoom level served
+MAX_ZOOM = 22
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+
+
+class ResultStatsView(APIView):
+    """
+    Count, mean, min, max, median and 90th percentile of the test
+    metrics per region, operator, network type, province and/or time
+    bucket, read from the hourly or daily rollups
+    """
+    permission_classes = (permissions.IsAdminUser, )
+    authentication_classes = (TokenAuthentication, )
+
+    @extend_schema(parameters=[StatsQuerySerializer])
+    def get(self, request):
+        params = StatsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        filters = {key: query[key] for key in rollups.KEYS if key in query}
+        results = rollups.query(
+            query['kind'],
+            query['granularity'],
+            day_start(query['min_date']),
+            day_start(query['max_date'] + datetime.timedelta(days=1)),
+            group_by=query['group_by'],
+            filters=filters,
+            metrics=query['metrics'])
+        return Response({
+            'kind': query['kind'],
+            'granularity': query['granularity'],
+            'min_date': query['min_date'],
+            'max_date': query['max_date'],
+            'group_by': query['group_by'],
+            'results': results,
+        })
+
+
+class ResultPercentilesView(APIView):
+    """
+    Approximate percentiles (within 1%) of one metric over any date
+    range and combination of regions, operators and network types,
+    merged from the daily sketches
+    """
+    permission_classes = (permissions.IsAdminUser, )
+    authentication_classes = (TokenAuthentication, )
+
+    @extend_schema(parameters=[PercentileQuerySerializer])
+    def get(self, request):
+        params = PercentileQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        results = rollups.percentiles(
+            query['kind'],
+            query['metric'],
+            query['min_date'],
+            query['max_date'],
+            query['q'],
+            group_by=query['group_by'],
+            filters=query['filters'])
+        return Response({
+            'kind': query['kind'],
+            'metric': query['metric'],
+            'min_date': query['min_date'],
+            'max_date': query['max_date'],
+            'group_by': query['group_by'],
+            'results': results,
+        })
+
+
+class CoverageTileView(APIView):
+    """
+    Mobile test counts and download/upload/ping mean, min and max per
+    cell of web-mercator tile z/x/y, as JSON or as a vector tile with
+    ?format=mvt
+    """
+    permission_classes = (permissions.IsAdminUser, )
+    authentication_classes = (TokenAuthentication, )
+    renderer_classes = (FastJSONRenderer, VectorTileRenderer)
+
+    @extend_schema(parameters=[CoverageQuerySerializer])
+    def get(self, request, zoom, x, y):
+        if zoom > MAX_ZOOM or x >= 2 ** zoom or y >= 2 ** zoom:
+            raise NotFound("No such tile.")
+        params = CoverageQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        return Response(coverage.tile(
+            zoom, x, y, query['min_date'], query['max_date'],
+            query['filters']))
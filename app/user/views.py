@@ -28,6 +28,7 @@ from rfc6349.serializers import (
     RfcDeviceUserSerializer
 )
 
+from core import identity
 from core.models import (
     RfcDeviceUser,
     NTCSpeedTest,
@@ -161,6 +162,7 @@ class ManageFieldUsersView(viewsets.ModelViewSet):
         user = get_object_or_404(get_user_model(), id=pk)
         client = Client.objects.get(name=request.data['name'])
         AuthToken.objects.get(user=user, client=client).delete()
+        identity.invalidate()
         return response.Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(methods=['POST', ], detail=False, url_path='assign-mobile-device')
@@ -183,6 +185,7 @@ class ManageFieldUsersView(viewsets.ModelViewSet):
         user = get_object_or_404(get_user_model(), id=pk)
         client = Client.objects.get(name=request.data['name'])
         AuthToken.objects.get(user=user, client=client).delete()
+        identity.invalidate()
         return response.Response(status=status.HTTP_204_NO_CONTENT)
 
     @extend_schema(
@@ -198,6 +201,7 @@ class ManageFieldUsersView(viewsets.ModelViewSet):
         serializer = self.get_serializer(user, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            identity.invalidate()
             try:
                 AuthToken.objects.get(user=user).delete()
             except AuthToken.DoesNotExist:
@@ -267,7 +271,7 @@ def csv1(request, csv_id):
 
             writer2 = csv.writer(output2)
             writer2.writerow(['test_id_id','lat','lon','date_tested','ave_tcp_tput','tcp_eff','ave_rtt'])
-            ia = RfcTest.objects.values_list('test_id', 'location__lat','location__lon','date_created','result__actual_thpt','result__tcp_efficiency','result__ave_rtt')
+            ia = RfcTest.objects.values_list('test_id', 'result__lat','result__lon','date_created','result__actual_thpt','result__tcp_efficiency','result__ave_rtt')
             for iad in ia:
                 writer2.writerow(iad)
 
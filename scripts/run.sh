@@ -5,6 +5,14 @@ set -e
 python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
+python manage.py manage_partitions
+python manage.py sync_flat_results
 python manage.py create_nro
 
+# Every uwsgi worker writes its metrics there, see core.metrics. The
+# directory is shared with the enrichment worker, whose files are kept.
+export PROMETHEUS_MULTIPROC_DIR=/vol/metrics
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+rm -f "$PROMETHEUS_MULTIPROC_DIR"/*_"$(hostname)"-*.db
+
 uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi